@@ -1,8 +1,10 @@
+from .mood_stats import router as mood_stats_router
 from .routes import router as test_router
 from .session import router as session_router
 from .user_profile import router as profile_router
 
 __all__ = [
+    "mood_stats_router",
     "profile_router",
     "session_router",
     "test_router",
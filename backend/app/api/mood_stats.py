@@ -0,0 +1,90 @@
+import logging
+from collections import Counter
+from datetime import date, timedelta
+from logging import Logger
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, Query, Request
+
+from app.models.enums import MoodCategory, MoodStatsPeriod, MoodStatsRange
+from app.models.mood_stats import MoodBucket, MoodStatsResponse
+from app.utils.auth import verify_firebase_token
+from app.utils.metrics import timed
+from app.utils.mood_stats import (
+    ACTIVE_DAYS,
+    RANGES,
+    bucket_id,
+    period_start,
+    stats_collection,
+    streaks,
+)
+
+router = APIRouter()
+
+logger: Logger = logging.getLogger(__name__)
+
+
+@router.get("/mood-stats", response_model=MoodStatsResponse)
+async def get_mood_stats(
+    request: Request,
+    uid: Annotated[str, Depends(verify_firebase_token)],
+    stats_range: Annotated[MoodStatsRange, Query(alias="range")] = (
+        MoodStatsRange.MONTH
+    ),
+) -> MoodStatsResponse:
+    """
+    Retrieve how the moods of the user's sessions are distributed over time.
+
+    `week` and `month` are the last 7 and 30 days, by day, `quarter` and `year`
+    the last 13 and 52 weeks, by week. The statistics are kept up to date as
+    sessions are stored, so this reads one document per bucket, however many
+    sessions the user has.
+
+    Args:
+        request: FastAPI request object to access app state.
+        uid: User ID extracted from Firebase token.
+        stats_range: The range of time to cover.
+
+    Returns:
+        MoodStatsResponse: The moods per bucket, in total and the streaks.
+    """
+    period, count = RANGES[stats_range]
+    step = timedelta(days=7 if period is MoodStatsPeriod.WEEK else 1)
+    # session days are the dates of created_at, which is in the server's time
+    today = date.today()
+    last = period_start(today, period)
+    starts = [last - step * i for i in reversed(range(count))]
+
+    firestore_db = request.app.state.firestore_db
+    stats = stats_collection(firestore_db, uid)
+    references = [stats.document(bucket_id(period, start)) for start in starts]
+    references.append(stats.document(ACTIVE_DAYS))
+    with timed("firestore", "get_mood_stats"):
+        documents = {
+            snapshot.id: snapshot.to_dict() or {}
+            async for snapshot in firestore_db.get_all(references)
+        }
+
+    buckets: list[MoodBucket] = []
+    totals: Counter[MoodCategory] = Counter()
+    for start in starts:
+        document = documents.get(bucket_id(period, start), {})
+        counts = {
+            MoodCategory(mood): n for mood, n in document.get("counts", {}).items() if n
+        }
+        totals.update(counts)
+        buckets.append(
+            MoodBucket(start=start, counts=counts, total=sum(counts.values()))
+        )
+
+    current_streak, longest_streak = streaks(
+        documents.get(ACTIVE_DAYS, {}).get("days", []), today
+    )
+    return MoodStatsResponse(
+        range=stats_range,
+        period=period,
+        buckets=buckets,
+        totals=dict(totals),
+        current_streak=current_streak,
+        longest_streak=longest_streak,
+    )
@@ -1,129 +1,376 @@
+import base64
+import json
+import logging
+from collections.abc import AsyncIterator
 from datetime import datetime
+from logging import Logger
 from typing import Annotated
+from uuid import uuid4
 
-from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Request
+from fastapi import (
+    APIRouter,
+    BackgroundTasks,
+    Depends,
+    Header,
+    HTTPException,
+    Query,
+    Request,
+)
+from fastapi.responses import StreamingResponse
 
+from app.config.settings import settings
 from app.models.chat import ChatInput, ConversationMessage, MoodAnalysisResult
-from app.models.session import SessionModel, SessionsResponse
-from app.utils.auth import verify_firebase_token
-from app.utils.chat import MoodAnalyzer, SessionAnalyzer
+from app.models.session import SessionJob, SessionModel, SessionsResponse
+from app.utils.auth import (
+    admit_gemini_request,
+    check_admission,
+    verify_firebase_token,
+)
+from app.utils.chat import (
+    GeminiClient,
+    MalformedOutputError,
+    MoodAnalyzer,
+)
+from app.utils.coalesce import MessageCoalescer
+from app.utils.context import ContextWindow
+from app.utils.idempotency import IdempotentRequests, idempotency_key
+from app.utils.metrics import background, timed
 from app.utils.redis import RedisService
+from app.utils.routing import ModelUnavailableError, QueueTimeoutError
+from app.utils.stream import ReplyStreamParser
 
 router = APIRouter()
 
+logger: Logger = logging.getLogger(__name__)
+
+# firestore.Query.DESCENDING, without importing the firestore client here
+DESCENDING = "DESCENDING"
+
+
+def _sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
 
 @router.post("/process", status_code=202, response_model=MoodAnalysisResult)
-async def process_text(
+async def process_text(  # noqa: PLR0913, PLR0917
     bg_tasks: BackgroundTasks,
     data: Annotated[ChatInput, Query(..., min_length=10)],
     uid: Annotated[str, Depends(verify_firebase_token)],
     redis_service: Annotated[RedisService, Depends(RedisService.get_service)],
-    mood_analyzer: Annotated[MoodAnalyzer, Depends(MoodAnalyzer)],
+    gemini_client: Annotated[GeminiClient, Depends(GeminiClient.get_client)],
+    mood_analyzer: Annotated[MoodAnalyzer, Depends(MoodAnalyzer.get_analyzer)],
+    context_window: Annotated[ContextWindow, Depends(ContextWindow)],
+    coalescer: Annotated[
+        MessageCoalescer | None, Depends(MessageCoalescer.get_coalescer)
+    ],
+    idempotent_requests: Annotated[
+        IdempotentRequests | None, Depends(IdempotentRequests.get_requests)
+    ],
+    idempotency_key_header: Annotated[
+        str | None, Header(alias="Idempotency-Key", max_length=255)
+    ] = None,
 ) -> MoodAnalysisResult:
     """
     Process user input text to analyze mood and generate empathetic reply.
 
+    With `IDEMPOTENCY_ENABLED`, a request repeating an earlier one, with the
+    same `Idempotency-Key` or else the same text and timestamp, gets the
+    earlier one's reply without the message being analyzed or stored again,
+    waiting for it if it is still running.
+
+    With `COALESCE_ENABLED`, messages the user sends in quick succession are
+    answered together: they are stored as one turn and every request gets the
+    same reply.
+
+    Only the request that calls gemini, the first of a message and the leader
+    of a coalesced batch, is load shed and counted against the rate limits.
+
     Args:
         request: FastAPI request object to access app state.
         data: ChatInput containing the text and timestamp.
         uid: User ID extracted from Firebase token.
+        idempotency_key_header: Identifies retries of the same message.
 
     Returns:
         MoodAnalysisResult: Detected mood, confidence score, and generated reply.
 
     Raises:
-        HTTPException: 400 for bad input, 500 for processing errors.
+        HTTPException: 400 for bad input, 429 over the user's rate limit, 504 if gemini timed out, 502 for malformed gemini output, 503 if overloaded or no gemini model is available, 500 for processing errors.
+    """
+    if not data.text.strip():
+        raise HTTPException(status_code=400, detail="Input text cannot be empty.")
+
+    async def _answer(data: ChatInput) -> MoodAnalysisResult:
+        await check_admission(uid, redis_service, gemini_client)
+        history, summary = await redis_service.get_context(uid, context_window.turns)
+        context = context_window.build(history, summary)
+        try:
+            mood = await mood_analyzer.analyze_async(
+                text=data.text, history=context.history, summary=context.summary
+            )
+        except QueueTimeoutError:
+            raise HTTPException(
+                status_code=503,
+                detail="mood analysis overloaded",
+                headers={"Retry-After": str(settings.LOAD_SHED_RETRY_AFTER)},
+            )
+        except TimeoutError:
+            raise HTTPException(status_code=504, detail="mood analysis timed out")
+        except MalformedOutputError:
+            raise HTTPException(status_code=502, detail="mood analysis failed")
+        except ModelUnavailableError:
+            raise HTTPException(status_code=503, detail="mood analysis unavailable")
+
+        chat = ConversationMessage(
+            message=data.text, reply=mood.reply, timestamp=data.timestamp
+        )
+        bg_tasks.add_task(
+            background("add_message", redis_service.add_message),
+            uid,
+            chat,
+            mood,
+            context_window,
+        )
+        return mood
+
+    async def _process() -> MoodAnalysisResult:
+        if coalescer is None:
+            return await _answer(data)
+        return await coalescer.submit(uid, data, _answer)
+
+    if idempotent_requests is None:
+        return await _process()
+    return await idempotent_requests.run(
+        idempotency_key(uid, data, idempotency_key_header), _process
+    )
+
+
+@router.post("/process/stream", response_class=StreamingResponse)
+async def process_text_stream(
+    bg_tasks: BackgroundTasks,
+    data: Annotated[ChatInput, Query(..., min_length=10)],
+    uid: Annotated[str, Depends(admit_gemini_request)],
+    redis_service: Annotated[RedisService, Depends(RedisService.get_service)],
+    mood_analyzer: Annotated[MoodAnalyzer, Depends(MoodAnalyzer.get_analyzer)],
+    context_window: Annotated[ContextWindow, Depends(ContextWindow)],
+) -> StreamingResponse:
+    """
+    Streaming variant of /process that sends the reply as Server-Sent Events.
+
+    The stream carries `token` events with pieces of the reply as they are
+    generated, then a single `result` event with the parsed MoodAnalysisResult,
+    or an `error` event if the analysis failed. The message and mood are stored
+    in redis once the stream has completed.
+
+    Args:
+        data: ChatInput containing the text and timestamp.
+        uid: User ID extracted from Firebase token.
+
+    Returns:
+        StreamingResponse: A `text/event-stream` response.
+
+    Raises:
+        HTTPException: 400 for bad input, 429 over the user's rate limit, 503 if overloaded.
     """
     input_text: str = data.text
     if not input_text.strip():
         raise HTTPException(status_code=400, detail="Input text cannot be empty.")
 
-    history = await redis_service.get_chat_history(uid)
-    mood = mood_analyzer.analyze(text=input_text, history=history)
+    history, summary = await redis_service.get_context(uid, context_window.turns)
+    context = context_window.build(history, summary)
+
+    async def _events() -> AsyncIterator[str]:
+        parser = ReplyStreamParser()
+        mood: MoodAnalysisResult | None = None
+        try:
+            async for item in mood_analyzer.analyze_stream(
+                text=input_text, history=context.history, summary=context.summary
+            ):
+                if isinstance(item, MoodAnalysisResult):
+                    mood = item
+                elif reply := parser.feed(item):
+                    yield _sse_event("token", {"text": reply})
+        except QueueTimeoutError:
+            yield _sse_event("error", {"detail": "mood analysis overloaded"})
+            return
+        except TimeoutError:
+            yield _sse_event("error", {"detail": "mood analysis timed out"})
+            return
+        except ModelUnavailableError:
+            yield _sse_event("error", {"detail": "mood analysis unavailable"})
+            return
+        except MalformedOutputError:
+            yield _sse_event("error", {"detail": "mood analysis failed"})
+            return
+        except Exception:
+            logger.exception("error while streaming the mood analysis")
+            yield _sse_event("error", {"detail": "internal server error"})
+            return
+        if mood is None:
+            yield _sse_event("error", {"detail": "mood analysis failed"})
+            return
+
+        chat = ConversationMessage(
+            message=input_text, reply=mood.reply, timestamp=data.timestamp
+        )
+        bg_tasks.add_task(
+            background("add_message", redis_service.add_message),
+            uid,
+            chat,
+            mood,
+            context_window,
+        )
+        yield _sse_event("result", mood.model_dump(mode="json"))
 
-    chat = ConversationMessage(
-        message=input_text, reply=mood.reply, timestamp=data.timestamp
+    return StreamingResponse(
+        _events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=bg_tasks,
     )
-    bg_tasks.add_task(redis_service.add_chat_history, uid, chat)
-    bg_tasks.add_task(redis_service.add_session_moods, uid, mood)
-    return mood
 
 
-@router.post("/end-session", response_model=SessionModel)
+@router.post(
+    "/end-session",
+    status_code=202,
+    response_model=SessionJob,
+    response_model_exclude={"uid"},
+)
 async def end_session(
-    request: Request,
     uid: Annotated[str, Depends(verify_firebase_token)],
     redis_service: Annotated[RedisService, Depends(RedisService.get_service)],
-    session_analyzer: Annotated[SessionAnalyzer, Depends(SessionAnalyzer)],
-) -> SessionModel:
+) -> SessionJob:
     """
-    End the current session, summarize the mood, and store the session in Firestore.
+    End the current session and queue it to be summarized and stored in Firestore.
+
+    The session data is moved out of the user's live keys atomically, so the
+    user can start a new session right away. Poll `/end-session/{job_id}` for
+    the result.
 
     Args:
-        request: FastAPI request object to access app state.
         uid: User ID extracted from Firebase token.
 
     Returns:
-        SessionSummary: Summary of the session including main mood and counts.
+        SessionJob: The queued job.
 
     Raises:
-        HTTPException: 404 if no session data, 500 for processing errors.
+        HTTPException: 424 if there is no session data.
     """
-
-    session_moods: list[MoodAnalysisResult] = await redis_service.get_session_moods(uid)
-    chat_history: list[ConversationMessage] = await redis_service.get_chat_history(uid)
-
-    if not session_moods or not chat_history:
-        redis_service.clear_db(uid)
+    job = SessionJob(job_id=uuid4().hex, uid=uid)
+    if not await redis_service.enqueue_session_job(job):
         raise HTTPException(
             status_code=424,
             detail="No data in the current session to process. Please call /api/v1/process first.",
         )
+    return job
 
-    summary: SessionModel = session_analyzer.summarize(chat_history, session_moods)
-    redis_service.clear_db(uid)
 
-    firestore_db = request.app.state.firestore_db
-    user_sessions = (
-        firestore_db.collection("users").document(uid).collection("sessions")
-    )
-    user_sessions.add(
-        {
-            "mood": summary.mood.value,
-            "summary": summary.summary,
-            "created_at": summary.created_at or datetime.now(),
+@router.get(
+    "/end-session/{job_id}",
+    response_model=SessionJob,
+    response_model_exclude={"uid"},
+)
+async def get_end_session_job(
+    job_id: str,
+    uid: Annotated[str, Depends(verify_firebase_token)],
+    redis_service: Annotated[RedisService, Depends(RedisService.get_service)],
+) -> SessionJob:
+    """
+    Get the status of an end-session job, including the session once it is done.
+
+    Args:
+        job_id: ID returned by `/end-session`.
+        uid: User ID extracted from Firebase token.
+
+    Returns:
+        SessionJob: The job and, when done, the stored session.
+
+    Raises:
+        HTTPException: 404 if the job does not exist or belongs to another user.
+    """
+    job = await redis_service.get_session_job(job_id)
+    if job is None or job.uid != uid:
+        raise HTTPException(status_code=404, detail="session job not found")
+    return job
+
+
+def _encode_cursor(created_at: datetime, session_id: str) -> str:
+    payload = json.dumps({"created_at": created_at.isoformat(), "id": session_id})
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def _decode_cursor(cursor: str) -> dict:
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return {
+            "created_at": datetime.fromisoformat(payload["created_at"]),
+            "__name__": payload["id"],
         }
-    )
-    return summary
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="invalid cursor")
 
 
 @router.get("/sessions", response_model=SessionsResponse)
-def get_sessions(
-    request: Request, uid: Annotated[str, Depends(verify_firebase_token)]
+async def get_sessions(
+    request: Request,
+    uid: Annotated[str, Depends(verify_firebase_token)],
+    redis_service: Annotated[RedisService, Depends(RedisService.get_service)],
+    limit: Annotated[int, Query(ge=1, le=100)] = 50,
+    cursor: str | None = None,
 ) -> SessionsResponse:
     """
-    Retrieve all past sessions for the authenticated user.
+    Retrieve past sessions for the authenticated user, newest first.
+
+    Pages are served from a per-user redis cache when possible, which is
+    invalidated whenever a new session is stored.
+
     Args:
         request: FastAPI request object to access app state.
         uid: User ID extracted from Firebase token.
+        limit: Maximum number of sessions to return.
+        cursor: `next_cursor` of the previous page, omitted for the first page.
 
     Returns:
-        SessionsResponse: List of past sessions.
+        SessionsResponse: A page of past sessions and the cursor of the next one.
+
+    Raises:
+        HTTPException: 400 for a malformed cursor.
     """
+    page_key = f"{limit}:{cursor or ''}"
+    if cached := await redis_service.get_cached_sessions(uid, page_key):
+        return SessionsResponse.model_validate_json(cached)
+
     firestore_db = request.app.state.firestore_db
     user_sessions = (
         firestore_db.collection("users").document(uid).collection("sessions")
     )
+    query = (
+        user_sessions.order_by("created_at", direction=DESCENDING)
+        .order_by("__name__", direction=DESCENDING)
+        .limit(limit + 1)
+    )
+    if cursor:
+        query = query.start_after(_decode_cursor(cursor))
 
-    sessions = user_sessions.stream()
+    with timed("firestore", "list_sessions"):
+        snapshots = [snapshot async for snapshot in query.stream()]
     session_list: list[SessionModel] = []
+    for snapshot in snapshots[:limit]:
+        data = snapshot.to_dict() or {}
+        session_list.append(
+            SessionModel(
+                mood=data.get("mood", ""),
+                summary=data.get("summary", ""),
+                created_at=data.get("created_at", datetime.now()),
+            )
+        )
 
-    for session in sessions:
-        session_data = SessionModel(
-            mood=session.to_dict().get("mood", ""),
-            summary=session.to_dict().get("summary", ""),
-            created_at=session.to_dict().get("created_at", datetime.now()),
+    next_cursor: str | None = None
+    if len(snapshots) > limit:
+        next_cursor = _encode_cursor(
+            session_list[-1].created_at, snapshots[limit - 1].id
         )
-        session_list.append(session_data)
 
-    return SessionsResponse(sessions=session_list)
+    response = SessionsResponse(sessions=session_list, next_cursor=next_cursor)
+    await redis_service.cache_sessions(uid, page_key, response.model_dump_json())
+    return response
@@ -1,28 +1,52 @@
+import asyncio
 import logging
-from datetime import datetime
 from logging import Logger
 from typing import Annotated
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, Header, HTTPException, Response
 from firebase_admin import auth
 from firebase_admin.auth import UserNotFoundError
 from firebase_admin.exceptions import FirebaseError
 
 from app.models.user_profile import Profile
 from app.utils.auth import verify_firebase_token
+from app.utils.user_profile import ProfileCache, profile_etag, profile_from_user
 
 router = APIRouter()
 
 logger: Logger = logging.getLogger(__name__)
 
+# clients may keep the profile but have to revalidate it before every use
+CACHE_CONTROL = "private, no-cache"
 
-@router.get("/profile", response_model=Profile)
-def get_profile(uid: Annotated[str, Depends(verify_firebase_token)]) -> Profile:
+
+def _not_modified(etag: str, if_none_match: str | None) -> bool:
+    if not if_none_match:
+        return False
+    tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return etag in tags or "*" in tags
+
+
+@router.get(
+    "/profile",
+    response_model=Profile,
+    responses={304: {"description": "The client's copy is up to date"}},
+)
+async def get_profile(
+    response: Response,
+    uid: Annotated[str, Depends(verify_firebase_token)],
+    profile_cache: Annotated[ProfileCache, Depends(ProfileCache.get_cache)],
+    if_none_match: Annotated[str | None, Header()] = None,
+) -> Profile | Response:
     """
     Get user profile information from Firebase Auth.
 
+    Profiles are served from a short-lived cache. The response carries an
+    `ETag`, a request with a matching `If-None-Match` gets an empty 304.
+
     Args:
         uid: User ID extracted from Firebase token
+        if_none_match: `ETag` of the client's copy of the profile
 
     Returns:
         Profile: User profile information
@@ -31,41 +55,39 @@ def get_profile(uid: Annotated[str, Depends(verify_firebase_token)]) -> Profile:
         HTTPException: 400 for malformed request, 502 for firebase error, 404 if user not found, 500 for other errors
     """
     try:
-        user = auth.get_user(uid)
-        return Profile(
-            uid=uid,
-            email=user.email or "",
-            full_name=user.display_name or "",
-            created_at=datetime.fromtimestamp(
-                user.user_metadata.creation_timestamp / 1000
-            ),
-            updated_at=(
-                datetime.fromtimestamp(user.user_metadata.last_sign_in_timestamp / 1000)
-                if user.user_metadata.last_sign_in_timestamp
-                else None
-            ),
-        )
-
+        profile = await profile_cache.get(uid)
     except UserNotFoundError:
-        logger.warning(f"user with {uid} not found")
+        logger.warning("user with %s not found", uid)
         raise HTTPException(status_code=404, detail="user not found")
     except ValueError:
         raise HTTPException(status_code=400, detail="user id is malformed")
     except FirebaseError:
-        logger.exception(f"firebase error for user {uid}")
+        logger.exception("firebase error for user %s", uid)
         raise HTTPException(status_code=400, detail="failed to retrieve the user")
     except Exception:
-        logger.exception(f"internal error for {uid}")
+        logger.exception("internal error for %s", uid)
         raise HTTPException(status_code=500, detail="Internal server error")
 
+    etag = profile_etag(profile)
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    if _not_modified(etag, if_none_match):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return profile
+
 
 @router.patch("/profile/display-name", response_model=Profile)
-def set_display_name(
-    display_name: str, uid: Annotated[str, Depends(verify_firebase_token)]
+async def set_display_name(
+    response: Response,
+    display_name: str,
+    uid: Annotated[str, Depends(verify_firebase_token)],
+    profile_cache: Annotated[ProfileCache, Depends(ProfileCache.get_cache)],
 ) -> Profile:
     """
     Update the user's display name in Firebase Auth.
 
+    The updated profile is written through to the profile cache.
+
     Args:
         display_name: New display name for the user
         uid: User ID extracted from Firebase token
@@ -82,29 +104,24 @@ def set_display_name(
         )
 
     try:
-        user = auth.update_user(uid, display_name=display_name)
-        profile = Profile(
-            uid=uid,
-            email=user.email or "",
-            full_name=user.display_name or "",
-            created_at=datetime.fromtimestamp(
-                user.user_metadata.creation_timestamp / 1000
-            ),
-            updated_at=(
-                datetime.fromtimestamp(user.user_metadata.last_sign_in_timestamp / 1000)
-                if user.user_metadata.last_sign_in_timestamp
-                else None
-            ),
-        )
+        user = await asyncio.to_thread(auth.update_user, uid, display_name=display_name)
+        profile = profile_from_user(uid, user)
 
     except ValueError:
         raise HTTPException(status_code=400, detail="invalid user id or name")
     except FirebaseError:
-        logger.exception(f"firebase error for user {uid}")
+        logger.exception("firebase error for user %s", uid)
+        # the update may have been applied anyway
+        await profile_cache.invalidate(uid)
         raise HTTPException(status_code=502, detail="failed to update the user account")
     except Exception:
-        logger.exception(f"internal error for {uid}")
+        logger.exception("internal error for %s", uid)
+        await profile_cache.invalidate(uid)
         raise HTTPException(status_code=500, detail="internal server error")
     else:
-        logger.info(f"profile updated for {uid}: result {profile}")
+        await profile_cache.put(uid, profile)
+        response.headers.update(
+            {"ETag": profile_etag(profile), "Cache-Control": CACHE_CONTROL}
+        )
+        logger.info("profile updated for %s: result %s", uid, profile)
         return profile
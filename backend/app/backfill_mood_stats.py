@@ -0,0 +1,132 @@
+"""
+Rebuild the mood statistics of users from their stored sessions.
+
+For every user, or the ones given with ``--uid``, reads all of their sessions,
+recomputes the daily and weekly mood counts and the days with a session, and
+compares them to the statistics in Firestore. Users whose statistics differ
+have them replaced, or with ``--verify`` are only reported, and the command
+exits with status 1 if there are any.
+
+Sessions stored while a user is being rebuilt can be missed, run it again with
+``--verify`` afterwards.
+
+Usage:
+    python -m app.backfill_mood_stats [--uid UID ...] [--verify]
+"""
+
+import argparse
+import asyncio
+import logging
+import sys
+from collections.abc import AsyncIterator
+from typing import TYPE_CHECKING
+
+from app.utils.firebase import firestore_client, init_firebase
+from app.utils.jobs import MAX_BATCH_WRITES
+from app.utils.mood_stats import (
+    STATS_COLLECTION,
+    aggregate_sessions,
+    normalize_stats,
+    stats_collection,
+)
+
+if TYPE_CHECKING:
+    from google.cloud.firestore import AsyncClient, AsyncCollectionReference
+
+logger = logging.getLogger(__name__)
+
+
+async def _user_ids(firestore_db: "AsyncClient", uids: list[str]) -> AsyncIterator[str]:
+    if uids:
+        for uid in uids:
+            yield uid
+        return
+    # users only have subcollections, list_documents includes them anyway
+    async for reference in firestore_db.collection("users").list_documents():
+        yield reference.id
+
+
+async def _documents(collection: "AsyncCollectionReference") -> dict[str, dict]:
+    return {
+        snapshot.id: snapshot.to_dict() or {} async for snapshot in collection.stream()
+    }
+
+
+async def _replace(
+    firestore_db: "AsyncClient",
+    uid: str,
+    stored: dict[str, dict],
+    expected: dict[str, dict],
+) -> None:
+    stats = stats_collection(firestore_db, uid)
+    writes = [
+        *((stats.document(id_), document) for id_, document in expected.items()),
+        *((stats.document(id_), None) for id_ in stored.keys() - expected.keys()),
+    ]
+    for start in range(0, len(writes), MAX_BATCH_WRITES):
+        batch = firestore_db.batch()
+        for reference, document in writes[start : start + MAX_BATCH_WRITES]:
+            if document is None:
+                batch.delete(reference)
+            else:
+                batch.set(reference, document)
+        await batch.commit()
+
+
+async def backfill(
+    firestore_db: "AsyncClient", uids: list[str], *, verify: bool = False
+) -> int:
+    """
+    Rebuild or verify the mood statistics of users.
+
+    Args:
+        firestore_db: The Firestore client.
+        uids: The users to check, all of them if empty.
+        verify: Only report the users whose statistics are wrong.
+
+    Returns:
+        int: The number of users whose statistics differed from their sessions.
+    """
+    users = differing = 0
+    async for uid in _user_ids(firestore_db, uids):
+        user = firestore_db.collection("users").document(uid)
+        sessions = await _documents(user.collection("sessions"))
+        stored = await _documents(user.collection(STATS_COLLECTION))
+        expected = aggregate_sessions(sessions.values())
+        users += 1
+        if normalize_stats(stored) == expected:
+            continue
+        differing += 1
+        if verify:
+            logger.warning("mood statistics of user %s differ from its sessions", uid)
+        else:
+            await _replace(firestore_db, uid, stored, expected)
+            logger.info("rebuilt the mood statistics of user %s", uid)
+    logger.info(
+        "%s %d users, %d differed",
+        "verified" if verify else "checked",
+        users,
+        differing,
+    )
+    return differing
+
+
+async def _main(uids: list[str], *, verify: bool) -> int:
+    init_firebase()
+    return await backfill(firestore_client(), uids, verify=verify)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--uid", action="append", default=[])
+    parser.add_argument("--verify", action="store_true")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    differing = asyncio.run(_main(args.uid, verify=args.verify))
+    if args.verify and differing:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
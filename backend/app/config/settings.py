@@ -9,8 +9,85 @@ class Settings(BaseSettings):
     API_V1_STR: str = "/api/v1"
     REDIS_PASSWORD: str = ""
     REDIS_USERNAME: str = ""
+    REDIS_MAX_CONNECTIONS: int = 64
+    REDIS_POOL_TIMEOUT: float = 5.0
+    REDIS_SOCKET_TIMEOUT: float = 5.0
+    REDIS_SESSION_CODEC: str = "msgpack"
+    SESSION_TTL: int = 7 * 86400
+    SESSION_MAX_TURNS: int = 500
+    SESSION_STATS_INTERVAL: float = 60.0
+    SESSION_STATS_SAMPLE: int = 100
+    SESSION_IDLE_TIMEOUT: int = 3600
+    SESSION_SWEEP_ENABLED: bool = True
+    SESSION_SWEEP_INTERVAL: float = 60.0
+    SESSION_SWEEP_BATCH: int = 100
+    SESSION_SWEEP_CONCURRENCY: int = 4
+    SESSION_SWEEP_RATE: float = 1.0
+    SESSIONS_CACHE_TTL: int = 300
+    PROFILE_CACHE_TTL: int = 300
+    PROFILE_CACHE_LOCAL_TTL: float = 5.0
+    PROFILE_CACHE_SIZE: int = 10000
+    SESSION_JOB_WORKERS: int = 4
+    SESSION_JOB_MAX_ATTEMPTS: int = 3
+    SESSION_JOB_TTL: int = 86400
+    SESSION_JOB_LEASE: float = 60.0
     GEMINI_API_KEY: str
+    GEMINI_BASE_URL: str = ""
+    GEMINI_TIMEOUT: float = 30.0
+    GEMINI_MAX_CONCURRENCY: int = 256
+    GEMINI_PROMPT_CACHE_TTL: int = 3600
+    GEMINI_OUTPUT_RETRIES: int = 1
+    GEMINI_MOOD_MODELS: list[str] = ["gemini-2.5-flash", "gemini-2.5-flash-lite"]
+    GEMINI_SESSION_MODELS: list[str] = ["gemini-2.5-flash", "gemini-2.5-flash-lite"]
+    GEMINI_HEDGE_ENABLED: bool = True
+    GEMINI_HEDGE_PERCENTILE: float = 95.0
+    GEMINI_HEDGE_MIN_DELAY: float = 0.5
+    GEMINI_ROUTING_WINDOW: int = 200
+    GEMINI_ROUTING_MIN_SAMPLES: int = 20
+    GEMINI_ROUTING_MAX_ERROR_RATE: float = 0.5
+    GEMINI_ROUTING_MAX_AGE: float = 60.0
+    GEMINI_BREAKER_FAILURES: int = 5
+    GEMINI_BREAKER_COOLDOWN: float = 30.0
+    GEMINI_HTTP2: bool = True
+    GEMINI_MAX_CONNECTIONS: int = 256
+    GEMINI_MAX_KEEPALIVE_CONNECTIONS: int = 64
+    GEMINI_KEEPALIVE_EXPIRY: float = 60.0
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_USER_RATE: float = 1.0
+    RATE_LIMIT_USER_BURST: int = 20
+    RATE_LIMIT_GLOBAL_RATE: float = 200.0
+    RATE_LIMIT_GLOBAL_BURST: int = 400
+    LOAD_SHED_QUEUE_DEPTH: int = 512
+    LOAD_SHED_RETRY_AFTER: int = 5
+    IDEMPOTENCY_ENABLED: bool = True
+    IDEMPOTENCY_TTL: int = 3600
+    IDEMPOTENCY_CLAIM_TTL: int = 15
+    COALESCE_ENABLED: bool = False
+    COALESCE_WINDOW: float = 1.5
+    COALESCE_MAX_WAIT: float = 5.0
+    COALESCE_MAX_MESSAGES: int = 5
+    CONTEXT_WINDOW_TURNS: int = 10
+    CONTEXT_TOKEN_BUDGET: int = 2000
+    SESSION_SUMMARY_CHUNK_TOKENS: int = 8000
     FIREBASE_CREDENTIALS: str
+    AUTH_TOKEN_CACHE_SIZE: int = 10000
+    AUTH_TOKEN_CACHE_TTL: int = 300
+    READY_CHECK_TIMEOUT: float = 2.0
+    SERVER_HOST: str = "0.0.0.0"  # noqa: S104
+    SERVER_PORT: int = 8000
+    SERVER_WORKERS: int = 1
+    METRICS_LOOP_LAG_INTERVAL: float = 0.5
+    STALL_WATCHDOG_ENABLED: bool = False
+    STALL_WATCHDOG_THRESHOLD: float = 0.1
+    STALL_WATCHDOG_HISTORY: int = 100
+    PROFILER_ENABLED: bool = False
+    PROFILER_INTERVAL: float = 0.005
+    PROFILER_ROUTES: list[str] = ["/process", "/end-session"]
+    PROFILER_KEY: str = ""
+    PROFILER_OUTPUT_DIR: str = ""
+    LOG_QUEUE_SIZE: int = 10000
+    LOG_SAMPLE_THRESHOLD: float = 0.8
+    LOG_SAMPLE_RATE: int = 10
     BETTER_STACK_SOURCE_TOKEN: str = ""
     BETTER_STACK_INGESTING_HOST: str = ""
 
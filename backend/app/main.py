@@ -1,39 +1,94 @@
+import asyncio
 import logging
-import tempfile
-from collections.abc import AsyncGenerator
+from collections.abc import AsyncGenerator, Awaitable
 from contextlib import asynccontextmanager
 from logging import Logger
 
-import firebase_admin
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from firebase_admin import credentials, firestore
-from firebase_admin.credentials import Certificate
+from fastapi.responses import JSONResponse, Response
 
 from app import api
 from app.config.settings import settings
+from app.utils.chat import GeminiClient, MoodAnalyzer, SessionAnalyzer
+from app.utils.coalesce import MessageCoalescer
+from app.utils.firebase import check_credentials, firestore_client, init_firebase
+from app.utils.idempotency import IdempotentRequests
+from app.utils.jobs import IdleSessionSweeper, SessionJobLease, SessionJobWorker
 from app.utils.logger import setup_logging
-from app.utils.redis import RedisService
+from app.utils.metrics import MetricsMiddleware, monitor_event_loop_lag, render_metrics
+from app.utils.profiling import InstrumentationMiddleware, StallWatchdog
+from app.utils.redis import RedisService, monitor_sessions
+from app.utils.results import ResultListener
+from app.utils.user_profile import ProfileCache
 
-setup_logging()
 logger: Logger = logging.getLogger(__name__)
 
-with tempfile.NamedTemporaryFile(mode="w", delete=False, suffix=".json") as temp_file:
-    temp_file.write(settings.FIREBASE_CREDENTIALS)
-    temp_file_path = temp_file.name
-
-cred: Certificate = credentials.Certificate(temp_file_path)
-firebase_admin.initialize_app(cred)
-
 
+# importing this module has no side effects, firebase, the clients, the log
+# listener thread and the background tasks are all set up here, per worker, so
+# gunicorn can preload the app and fork the workers, see gunicorn.conf.py
 @asynccontextmanager
 async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
+    setup_logging()
+    app.state.stall_watchdog = None
+    if settings.STALL_WATCHDOG_ENABLED:
+        app.state.stall_watchdog = StallWatchdog()
+        app.state.stall_watchdog.start()
+    init_firebase()
     app.state.redis_service = RedisService()
-    app.state.firestore_db = firestore.client()
+    app.state.firestore_db = firestore_client()
+    app.state.profile_cache = ProfileCache(app.state.redis_service)
+    gemini_client = app.state.gemini_client = GeminiClient()
+    app.state.mood_analyzer = MoodAnalyzer(gemini_client)
+    app.state.session_analyzer = SessionAnalyzer(gemini_client)
+    loop_lag_monitor = asyncio.create_task(monitor_event_loop_lag())
+    session_monitor = asyncio.create_task(monitor_sessions(app.state.redis_service))
+    session_job_lease = SessionJobLease(app.state.redis_service)
+    await session_job_lease.start()
+    session_job_worker = SessionJobWorker(
+        app.state.redis_service,
+        app.state.firestore_db,
+        app.state.session_analyzer,
+        session_job_lease,
+    )
+    await session_job_worker.start()
+    idle_session_sweeper = IdleSessionSweeper(
+        app.state.redis_service,
+        app.state.firestore_db,
+        app.state.session_analyzer,
+        session_job_lease,
+    )
+    if settings.SESSION_SWEEP_ENABLED:
+        idle_session_sweeper.start()
+    # one pubsub connection delivers the results of both to waiting requests
+    result_listener = ResultListener(app.state.redis_service)
+    if settings.IDEMPOTENCY_ENABLED or settings.COALESCE_ENABLED:
+        await result_listener.start()
+    app.state.idempotent_requests = None
+    if settings.IDEMPOTENCY_ENABLED:
+        app.state.idempotent_requests = IdempotentRequests(
+            app.state.redis_service, result_listener
+        )
+        logger.info("idempotency keys enabled")
+    app.state.message_coalescer = None
+    if settings.COALESCE_ENABLED:
+        app.state.message_coalescer = MessageCoalescer(
+            app.state.redis_service, result_listener
+        )
+        logger.info("message coalescing enabled")
     logger.info("server started")
     yield
-    app.state.redis_service.close()
+    await result_listener.stop()
+    await idle_session_sweeper.stop()
+    await session_job_worker.stop()
+    await session_job_lease.stop()
+    loop_lag_monitor.cancel()
+    session_monitor.cancel()
+    await app.state.redis_service.close()
+    await gemini_client.close()
+    if app.state.stall_watchdog is not None:
+        await app.state.stall_watchdog.stop()
     logger.info("shutting down")
 
 
@@ -45,6 +100,10 @@ app.add_middleware(
     allow_methods=["*"],  # Allow all HTTP methods
     allow_headers=["*"],  # Allow all headers
 )
+app.add_middleware(MetricsMiddleware)
+# debugging aids, left out entirely unless enabled so they cost nothing
+if settings.STALL_WATCHDOG_ENABLED or settings.PROFILER_ENABLED:
+    app.add_middleware(InstrumentationMiddleware)
 
 for router in api.__all__:
     app.include_router(getattr(api, router), prefix=settings.API_V1_STR)
@@ -53,3 +112,43 @@ for router in api.__all__:
 @app.get("/")
 def read_root() -> JSONResponse:
     return JSONResponse(content={"message": "Mood analyzer API is running!"})
+
+
+async def _check(check: Awaitable[object]) -> str:
+    try:
+        await asyncio.wait_for(check, timeout=settings.READY_CHECK_TIMEOUT)
+    except Exception as e:  # noqa: BLE001
+        logger.warning("readiness check failed: %r", e)
+        return "failed"
+    return "ok"
+
+
+@app.get("/ready", include_in_schema=False)
+async def read_ready(request: Request) -> JSONResponse:
+    """
+    Readiness probe, checks that redis and firestore answer and that the
+    firebase credentials can get an access token.
+    """
+    firestore_db = request.app.state.firestore_db
+    checks = dict(
+        zip(
+            ("redis", "firestore", "credentials"),
+            await asyncio.gather(
+                _check(request.app.state.redis_service.ping()),
+                _check(firestore_db.collection("health").document("ready").get()),
+                _check(asyncio.to_thread(check_credentials)),
+            ),
+            strict=True,
+        )
+    )
+    ready = all(result == "ok" for result in checks.values())
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"status": "ready" if ready else "unavailable", "checks": checks},
+    )
+
+
+@app.get("/metrics", include_in_schema=False)
+def read_metrics() -> Response:
+    content, media_type = render_metrics()
+    return Response(content=content, media_type=media_type)
@@ -1,4 +1,3 @@
-import re
 from datetime import datetime
 
 from pydantic import BaseModel, Field
@@ -24,6 +23,23 @@ class ConversationMessage(BaseModel):
     timestamp: datetime
 
 
+class ContextSummary(BaseModel):
+    """Model for the rolling summary of turns that left the context window."""
+
+    text: str = ""
+    turns: int = Field(0, ge=0, description="Number of turns folded into the summary")
+    tokens: int = Field(
+        0, ge=0, description="Estimated prompt tokens of the folded turns"
+    )
+
+
+class ConversationContext(BaseModel):
+    """Model for the bounded conversation context sent along with a message."""
+
+    history: list[ConversationMessage]
+    summary: str = ""
+
+
 class MoodAnalysisResult(BaseModel):
     """Model for mood analysis result."""
 
@@ -31,7 +47,15 @@ class MoodAnalysisResult(BaseModel):
     confidence: int = Field(..., ge=0, le=100, description="Confidence score 0-100")
     reply: str = Field(..., min_length=1, description="Generated empathetic reply")
 
-    @classmethod
-    def parse_json_markdown(cls, s: str) -> "MoodAnalysisResult":
-        cleaned = re.sub(r"^```(?:json)?\s*|\s*```$", "", s.strip(), flags=re.MULTILINE)
-        return cls.model_validate_json(cleaned)
+
+class PublishedResult(BaseModel):
+    """
+    Model for the outcome of a /process request, shared with the requests
+    waiting for it: the rest of its coalesced batch or its duplicates.
+    """
+
+    key: str
+    mood: MoodAnalysisResult | None = None
+    status_code: int | None = None
+    detail: str | None = None
+    headers: dict[str, str] | None = None
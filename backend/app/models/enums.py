@@ -12,3 +12,28 @@ class MoodCategory(str, Enum):
     DISGUST = "disgust"
     NEUTRAL = "neutral"
     UNDETERMINED = "undetermined"
+
+
+class SessionJobStatus(str, Enum):
+    """Enumeration of the states of an end-session job."""
+
+    QUEUED = "queued"
+    PROCESSING = "processing"
+    DONE = "done"
+    FAILED = "failed"
+
+
+class MoodStatsRange(str, Enum):
+    """Enumeration of the periods mood statistics can be requested for."""
+
+    WEEK = "week"
+    MONTH = "month"
+    QUARTER = "quarter"
+    YEAR = "year"
+
+
+class MoodStatsPeriod(str, Enum):
+    """Enumeration of the bucket sizes of mood statistics."""
+
+    DAY = "day"
+    WEEK = "week"
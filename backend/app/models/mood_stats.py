@@ -0,0 +1,30 @@
+from datetime import date
+
+from pydantic import BaseModel, Field
+
+from app.models.enums import MoodCategory, MoodStatsPeriod, MoodStatsRange
+
+
+class MoodBucket(BaseModel):
+    """
+    Model for the moods of the sessions of one day or week.
+    """
+
+    start: date
+    counts: dict[MoodCategory, int]
+    total: int
+
+
+class MoodStatsResponse(BaseModel):
+    """
+    Response model for the mood distribution of a user over a range of time.
+    """
+
+    range: MoodStatsRange
+    period: MoodStatsPeriod
+    buckets: list[MoodBucket] = Field(description="Oldest first, one per period")
+    totals: dict[MoodCategory, int]
+    current_streak: int = Field(
+        description="Consecutive days with a session, up to today or yesterday"
+    )
+    longest_streak: int
@@ -1,24 +1,25 @@
-import re
 from datetime import datetime
 
 from pydantic import BaseModel, Field
 
-from app.models.enums import MoodCategory
+from app.models.enums import MoodCategory, SessionJobStatus
 
 
-class SessionModel(BaseModel):
+class SessionSummary(BaseModel):
     """
-    Model for a user session stored in Firestore.
+    Model for the overall mood and summary of a session, as returned by Gemini.
     """
 
     mood: MoodCategory
     summary: str
-    created_at: datetime = Field(default_factory=lambda: datetime.now())
 
-    @classmethod
-    def parse_json_markdown(cls, s: str) -> "SessionModel":
-        cleaned = re.sub(r"^```(?:json)?\s*|\s*```$", "", s.strip(), flags=re.MULTILINE)
-        return cls.model_validate_json(cleaned)
+
+class SessionModel(SessionSummary):
+    """
+    Model for a user session stored in Firestore.
+    """
+
+    created_at: datetime = Field(default_factory=lambda: datetime.now())
 
 
 class SessionsResponse(BaseModel):
@@ -27,3 +28,18 @@ class SessionsResponse(BaseModel):
     """
 
     sessions: list[SessionModel]
+    next_cursor: str | None = None
+
+
+class SessionJob(BaseModel):
+    """
+    Model for a queued end-session job that summarizes and stores a session.
+    """
+
+    job_id: str
+    uid: str
+    status: SessionJobStatus = SessionJobStatus.QUEUED
+    attempts: int = 0
+    session: SessionModel | None = None
+    error: str | None = None
+    created_at: datetime = Field(default_factory=datetime.now)
@@ -1,7 +1,12 @@
+import asyncio
+import hashlib
 import logging
+import math
+import time
 from logging import Logger
-from typing import Annotated
+from typing import Annotated, Any
 
+from cachetools import TLRUCache
 from fastapi import Depends, HTTPException
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from firebase_admin import auth
@@ -12,17 +17,79 @@ from firebase_admin.auth import (
     RevokedIdTokenError,
     UserDisabledError,
 )
+from redis.exceptions import RedisError
+
+from app.config.settings import settings
+from app.utils.chat import GeminiClient
+from app.utils.metrics import ADMISSION_REJECTED, AUTH_TOKEN_CACHE, timed
+from app.utils.redis import RedisService
 
 security = HTTPBearer()
 logger: Logger = logging.getLogger(__name__)
 
 
-def verify_firebase_token(
+class TokenCache:
+    """
+    In-process LRU cache of verified Firebase ID tokens.
+
+    Entries are keyed by the sha256 of the token, so raw tokens are never kept
+    in memory, and expire at the token's own `exp` claim or after
+    ``AUTH_TOKEN_CACHE_TTL`` seconds, whichever comes first.
+    """
+
+    def __init__(self) -> None:
+        self._ttl = settings.AUTH_TOKEN_CACHE_TTL
+        self._cache: TLRUCache[str, dict[str, Any]] = TLRUCache(
+            maxsize=settings.AUTH_TOKEN_CACHE_SIZE,
+            ttu=self._expires_at,
+            timer=time.time,
+        )
+        self.hits = 0
+        self.misses = 0
+
+    def _expires_at(self, _key: str, claims: dict[str, Any], now: float) -> float:
+        return min(claims["exp"], now + self._ttl)
+
+    @staticmethod
+    def _key(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def get(self, token: str) -> dict[str, Any] | None:
+        claims = self._cache.get(self._key(token))
+        if claims is None:
+            self.misses += 1
+            AUTH_TOKEN_CACHE.labels("miss").inc()
+        else:
+            self.hits += 1
+            AUTH_TOKEN_CACHE.labels("hit").inc()
+        return claims
+
+    def put(self, token: str, claims: dict[str, Any]) -> None:
+        self._cache[self._key(token)] = claims
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+
+token_cache = TokenCache()
+
+
+@timed("auth", "verify_firebase_token")
+async def verify_firebase_token(
     credentials: Annotated[HTTPAuthorizationCredentials, Depends(security)],
 ) -> str:
     token = credentials.credentials
+    claims = token_cache.get(token)
+    if claims is not None:
+        return claims["uid"]
+
     try:
-        decoded_token = auth.verify_id_token(token)
+        # firebase_admin caches google's public keys for as long as their
+        # Cache-Control header allows, so they are rarely fetched here
+        decoded_token = await asyncio.to_thread(
+            auth.verify_id_token, token, check_revoked=False
+        )
+        token_cache.put(token, decoded_token)
         return decoded_token["uid"]
     except CertificateFetchError:
         logger.exception("error while fetching the public key certificates")
@@ -38,3 +105,63 @@ def verify_firebase_token(
     except Exception:
         logger.exception("unknown error")
         raise HTTPException(status_code=500, detail="internal server error")
+
+
+async def check_admission(
+    uid: str, redis_service: RedisService, gemini_client: GeminiClient
+) -> None:
+    """
+    Turn away a request that calls gemini before it queues for a gemini slot,
+    unless it can be admitted.
+
+    Requests are shed while this worker has ``LOAD_SHED_QUEUE_DEPTH`` gemini
+    requests running or waiting, and rate limited by a per-user and a global
+    token bucket in redis. If redis is unavailable the rate limits are not
+    enforced.
+
+    Raises:
+        HTTPException: 429 if the user is over their rate limit, 503 if the
+        service is overloaded or over the global rate limit, both with a
+        ``Retry-After`` header.
+    """
+    if gemini_client.queue_depth >= settings.LOAD_SHED_QUEUE_DEPTH:
+        ADMISSION_REJECTED.labels("overload").inc()
+        raise HTTPException(
+            status_code=503,
+            detail="server is overloaded",
+            headers={"Retry-After": str(settings.LOAD_SHED_RETRY_AFTER)},
+        )
+    if not settings.RATE_LIMIT_ENABLED:
+        return
+
+    try:
+        bucket, retry_after = await redis_service.take_token(uid)
+    except RedisError:
+        logger.exception("rate limiter unavailable")
+        return
+    if bucket is None:
+        return
+
+    ADMISSION_REJECTED.labels(f"{bucket}_rate").inc()
+    headers = {"Retry-After": str(math.ceil(retry_after))}
+    if bucket == "user":
+        raise HTTPException(
+            status_code=429, detail="too many requests", headers=headers
+        )
+    raise HTTPException(status_code=503, detail="server is overloaded", headers=headers)
+
+
+async def admit_gemini_request(
+    uid: Annotated[str, Depends(verify_firebase_token)],
+    redis_service: Annotated[RedisService, Depends(RedisService.get_service)],
+    gemini_client: Annotated[GeminiClient, Depends(GeminiClient.get_client)],
+) -> str:
+    """
+    Admit an authenticated request that calls gemini, see
+    :func:`check_admission`.
+
+    Returns:
+        str: The user ID, as :func:`verify_firebase_token`.
+    """
+    await check_admission(uid, redis_service, gemini_client)
+    return uid
@@ -1,34 +1,466 @@
+import asyncio
+import contextlib
 import logging
+import os
+import ssl
 import time
-from typing import TYPE_CHECKING
+from collections.abc import AsyncIterator, Iterator
+from typing import TYPE_CHECKING, TypeVar
 
-from google import genai
+import certifi
+import httpx
+from fastapi import Request
+from pydantic import BaseModel, ValidationError
 
 from app.config.settings import settings
 from app.models.chat import ConversationMessage, MoodAnalysisResult
-from app.models.session import SessionModel
-
+from app.models.session import SessionModel, SessionSummary
+from app.utils.metrics import (
+    GEMINI_DURATION,
+    GEMINI_FIRST_CHUNK,
+    GEMINI_OUTPUT_PARSE,
+    GEMINI_OUTPUT_RETRIES,
+    GEMINI_QUEUE_DEPTH,
+    GEMINI_TOKENS,
+    timed,
+)
+from app.utils.prompt import (
+    chunk_turns,
+    encode_conversation,
+    encode_mood_arc,
+    encode_parts,
+)
+from app.utils.routing import ModelRouter, QueueTimeoutError
+
+# google.genai takes longer to import than the rest of the app together, it is
+# loaded once the lifespan creates the GeminiClient
 if TYPE_CHECKING:
-    from google.genai.types import GenerateContentResponse
+    from google import genai
+    from google.genai.types import (
+        GenerateContentConfig,
+        GenerateContentResponse,
+        GenerateContentResponseUsageMetadata,
+    )
 
 logger = logging.getLogger(__name__)
 
+OutputT = TypeVar("OutputT", bound=BaseModel)
+
+
+class GeminiClient:
+    """
+    This class owns the gemini client shared by every analyzer in the worker.
+
+    It is created once in the app lifespan. The sync and async httpx transports
+    under the client are created here rather than by ``genai.Client``, so they
+    keep their connections alive across requests, can speak HTTP/2 and have
+    pool limits from the settings, and can be closed on shutdown. Building a
+    ``genai.Client`` also loads the CA bundle into a fresh SSL context, which
+    is far too expensive to do per request.
+    """
+
+    def __init__(self, max_concurrency: int | None = None) -> None:
+        from google import genai  # noqa: PLC0415
+        from google.genai.types import HttpOptions  # noqa: PLC0415
+
+        # same trust store genai.Client would build for itself
+        ssl_context = ssl.create_default_context(
+            cafile=os.environ.get("SSL_CERT_FILE", certifi.where()),
+            capath=os.environ.get("SSL_CERT_DIR"),
+        )
+        limits = httpx.Limits(
+            max_connections=settings.GEMINI_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.GEMINI_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.GEMINI_KEEPALIVE_EXPIRY,
+        )
+        self._transport = httpx.AsyncHTTPTransport(
+            verify=ssl_context, http2=settings.GEMINI_HTTP2, limits=limits
+        )
+        self._sync_transport = httpx.HTTPTransport(
+            verify=ssl_context, http2=settings.GEMINI_HTTP2, limits=limits
+        )
+        http_options = HttpOptions(
+            base_url=settings.GEMINI_BASE_URL or None,
+            timeout=int(settings.GEMINI_TIMEOUT * 1000),
+            client_args={"transport": self._sync_transport},
+            async_client_args={"transport": self._transport},
+        )
+        self.client = genai.Client(
+            api_key=settings.GEMINI_API_KEY, http_options=http_options
+        )
+        # shared by every analyzer in the worker so the number of in-flight
+        # gemini requests stays bounded no matter how many chats are being served
+        self._slots = asyncio.Semaphore(
+            max_concurrency or settings.GEMINI_MAX_CONCURRENCY
+        )
+        self.queue_depth = 0
+        logger.info("gemini client initialized")
+
+    @staticmethod
+    def get_client(request: Request) -> "GeminiClient":
+        return request.app.state.gemini_client
+
+    @contextlib.contextmanager
+    def _queued(self) -> Iterator[None]:
+        self.queue_depth += 1
+        GEMINI_QUEUE_DEPTH.inc()
+        try:
+            yield
+        finally:
+            self.queue_depth -= 1
+            GEMINI_QUEUE_DEPTH.dec()
+
+    @contextlib.asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """
+        Hold one of the worker's gemini slots, waiting at most
+        ``settings.GEMINI_TIMEOUT`` for it. Requests running or waiting for a
+        slot are counted in ``queue_depth``.
+
+        Raises:
+            QueueTimeoutError: If no slot was free in time.
+        """
+        with self._queued():
+            try:
+                await asyncio.wait_for(
+                    self._slots.acquire(), timeout=settings.GEMINI_TIMEOUT
+                )
+            except asyncio.TimeoutError:
+                raise QueueTimeoutError(
+                    f"no gemini slot was free within {settings.GEMINI_TIMEOUT}s"
+                ) from None
+            try:
+                yield
+            finally:
+                self._slots.release()
+
+    async def close(self) -> None:
+        await self._transport.aclose()
+        self._sync_transport.close()
+        logger.info("gemini client closed")
+
+
+def _log_usage(
+    model: str,
+    duration: float,
+    usage: "GenerateContentResponseUsageMetadata | None",
+    label: str = "gemini_response",
+) -> None:
+    prompt_tokens: int = getattr(usage, "prompt_token_count", None) or 0
+    cached_tokens: int = getattr(usage, "cached_content_token_count", None) or 0
+    completion_tokens: int = getattr(usage, "candidates_token_count", None) or 0
+    GEMINI_DURATION.labels(model, label).observe(duration / 1000)
+    GEMINI_TOKENS.labels(model, "prompt").inc(prompt_tokens - cached_tokens)
+    GEMINI_TOKENS.labels(model, "cached_prompt").inc(cached_tokens)
+    GEMINI_TOKENS.labels(model, "completion").inc(completion_tokens)
+    total_tokens: int = getattr(usage, "total_token_count", None) or 0
+    logger.info(
+        "%s model %s response time %.2f ms, token count: %d, prompt tokens: %d, cached prompt tokens: %d, uncached prompt tokens: %d",
+        label,
+        model,
+        duration,
+        total_tokens,
+        prompt_tokens,
+        cached_tokens,
+        prompt_tokens - cached_tokens,
+        extra={
+            "model": model,
+            "duration_ms": duration,
+            "total_tokens": total_tokens,
+            "prompt_tokens": prompt_tokens,
+            "cached_tokens": cached_tokens,
+            "completion_tokens": completion_tokens,
+        },
+    )
+
+
+def _below_minimum_cache_size(exc: Exception) -> bool:
+    from google.genai.errors import ClientError  # noqa: PLC0415
+
+    if not isinstance(exc, ClientError) or exc.code != 400:  # noqa: PLR2004
+        return False
+    message = (exc.message or "").lower()
+    return "too small" in message or "minimum token count" in message
+
+
+class PromptCache:
+    """
+    This class keeps the static system instruction of an analyzer in a gemini
+    cached content, so it is tokenized once and billed at the cached rate
+    instead of being sent with every request.
+
+    One handle is kept per model and refreshed before it expires. If the cache
+    can't be created the instruction is sent inline and creation is retried
+    later, unless the instruction is below the model's minimum cache size, in
+    which case it is sent inline for that model from then on.
+
+    Every config asks for a JSON response matching ``response_schema``.
+    """
+
+    REFRESH_MARGIN = 300
+    RETRY_AFTER = 600
+
+    def __init__(
+        self, system_instruction: str, response_schema: type[BaseModel]
+    ) -> None:
+        self.system_instruction = system_instruction
+        self.response_schema = response_schema
+        self._handles: dict[str, tuple[str, float]] = {}
+        self._retry_at: dict[str, float] = {}
+        self._uncacheable: set[str] = set()
+        self._lock = asyncio.Lock()
+
+    async def config(
+        self, client: "genai.Client", model: str
+    ) -> "GenerateContentConfig":
+        """
+        Build the request config that carries the system instruction for ``model``.
+        """
+        name = await self._cached_content(client, model)
+        if name is not None:
+            return self._build_config(cached_content=name)
+        return self.inline_config()
+
+    def inline_config(self) -> "GenerateContentConfig":
+        """
+        Build a request config that sends the system instruction inline.
+        """
+        return self._build_config(system_instruction=self.system_instruction)
+
+    def _build_config(self, **kwargs: str) -> "GenerateContentConfig":
+        from google.genai.types import GenerateContentConfig  # noqa: PLC0415
+
+        return GenerateContentConfig(
+            response_mime_type="application/json",
+            response_schema=self.response_schema,
+            **kwargs,
+        )
+
+    def _valid_handle(self, model: str, margin: float) -> str | None:
+        name, expires_at = self._handles.get(model, (None, 0.0))
+        return name if time.time() < expires_at - margin else None
+
+    async def _cached_content(self, client: "genai.Client", model: str) -> str | None:
+        if settings.GEMINI_PROMPT_CACHE_TTL <= 0 or model in self._uncacheable:
+            return None
+        if name := self._valid_handle(model, self.REFRESH_MARGIN):
+            return name
+        if time.time() >= self._retry_at.get(model, 0.0):
+            async with self._lock:
+                if model not in self._uncacheable and not self._valid_handle(
+                    model, self.REFRESH_MARGIN
+                ):
+                    await self._try_refresh(client, model)
+        return self._valid_handle(model, 0)
+
+    async def _try_refresh(self, client: "genai.Client", model: str) -> None:
+        try:
+            await self._refresh(client, model)
+        except Exception as exc:
+            if not _below_minimum_cache_size(exc):
+                logger.exception("could not cache the system instruction for %s", model)
+                self._retry_at[model] = time.time() + self.RETRY_AFTER
+                return
+            logger.warning(
+                "the system instruction is below the minimum cache size of %s, "
+                "sending it inline",
+                model,
+            )
+            self._uncacheable.add(model)
+
+    @timed("gemini", "cache_refresh")
+    async def _refresh(self, client: "genai.Client", model: str) -> None:
+        from google.genai.types import (  # noqa: PLC0415
+            CreateCachedContentConfig,
+            UpdateCachedContentConfig,
+        )
+
+        ttl = f"{settings.GEMINI_PROMPT_CACHE_TTL}s"
+        if name := self._valid_handle(model, 0):
+            cached = await client.aio.caches.update(
+                name=name, config=UpdateCachedContentConfig(ttl=ttl)
+            )
+        else:
+            cached = await client.aio.caches.create(
+                model=model,
+                config=CreateCachedContentConfig(
+                    system_instruction=self.system_instruction, ttl=ttl
+                ),
+            )
+        expires_at = (
+            cached.expire_time.timestamp()
+            if cached.expire_time
+            else time.time() + settings.GEMINI_PROMPT_CACHE_TTL
+        )
+        self._handles[model] = (str(cached.name), expires_at)
+        logger.info("cached system instruction for %s as %s", model, cached.name)
+
+
+@timed("gemini", "generate_content")
+async def _generate_content_async(
+    gemini: GeminiClient, model: str, prompt: str, config: "GenerateContentConfig"
+) -> "GenerateContentResponse":
+    """
+    Run a gemini request on the async client, bounded by the worker wide
+    concurrency limit and ``settings.GEMINI_TIMEOUT``.
+
+    The timeout covers the time spent waiting for a free slot as well, so a
+    saturated worker fails fast instead of queueing requests indefinitely.
+
+    Raises:
+        QueueTimeoutError: If no slot was free in time.
+        TimeoutError: If the request did not complete in time.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.GEMINI_TIMEOUT
+    try:
+        async with gemini.slot():
+            return await asyncio.wait_for(
+                gemini.client.aio.models.generate_content(
+                    model=model, contents=prompt, config=config
+                ),
+                timeout=deadline - loop.time(),
+            )
+    except QueueTimeoutError:
+        raise
+    except asyncio.TimeoutError:
+        raise TimeoutError(
+            f"gemini request exceeded {settings.GEMINI_TIMEOUT}s"
+        ) from None
+
+
+async def _stream_content_async(
+    gemini: GeminiClient, model: str, prompt: str, config: "GenerateContentConfig"
+) -> AsyncIterator["GenerateContentResponse"]:
+    """
+    Streaming counterpart of :func:`_generate_content_async`.
+
+    The slot is held until the stream is exhausted or closed, and the whole
+    stream has to finish within ``settings.GEMINI_TIMEOUT``.
+
+    Raises:
+        QueueTimeoutError: If no slot was free in time.
+        TimeoutError: If the stream did not complete in time.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.GEMINI_TIMEOUT
+    try:
+        async with gemini.slot():
+            stream = await asyncio.wait_for(
+                gemini.client.aio.models.generate_content_stream(
+                    model=model, contents=prompt, config=config
+                ),
+                timeout=deadline - loop.time(),
+            )
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(
+                        anext(stream), timeout=deadline - loop.time()
+                    )
+                except StopAsyncIteration:
+                    return
+                yield chunk
+    except QueueTimeoutError:
+        raise
+    except asyncio.TimeoutError:
+        raise TimeoutError(
+            f"gemini request exceeded {settings.GEMINI_TIMEOUT}s"
+        ) from None
+
+
+class MalformedOutputError(ValueError):
+    """
+    Raised when gemini output still does not match the schema after retrying.
+    """
+
+
+def parse_output(output: type[OutputT], text: str, analyzer: str) -> OutputT | None:
+    """
+    Validate model output against ``output``.
+
+    The raw text is validated directly first, which is all a schema constrained
+    response needs. Failing that, the outermost JSON object is cut out of any
+    markdown fences or prose around it and validated instead. The outcome is
+    counted in ``GEMINI_OUTPUT_PARSE``.
+
+    Returns:
+        The validated output, or None if neither attempt matched the schema.
+    """
+    try:
+        result = output.model_validate_json(text)
+    except ValidationError:
+        pass
+    else:
+        GEMINI_OUTPUT_PARSE.labels(analyzer, "valid").inc()
+        return result
+
+    start, end = text.find("{"), text.rfind("}")
+    if start != -1 and end > start:
+        try:
+            result = output.model_validate_json(text[start : end + 1])
+        except ValidationError:
+            pass
+        else:
+            GEMINI_OUTPUT_PARSE.labels(analyzer, "repaired").inc()
+            return result
+
+    GEMINI_OUTPUT_PARSE.labels(analyzer, "failed").inc()
+    logger.warning("%s output did not match the schema: %.200r", analyzer, text)
+    return None
+
+
+async def _generate_output(
+    gemini: GeminiClient,
+    model: str,
+    prompt: str,
+    config: "GenerateContentConfig",
+    output: type[OutputT],
+    analyzer: str,
+) -> OutputT:
+    """
+    Run a gemini request and validate its output, asking again up to
+    ``settings.GEMINI_OUTPUT_RETRIES`` times if it does not match the schema.
+
+    Raises:
+        TimeoutError: If a request did not complete in time.
+        MalformedOutputError: If no attempt returned valid output.
+    """
+    attempts = settings.GEMINI_OUTPUT_RETRIES + 1
+    for attempt in range(attempts):
+        if attempt:
+            GEMINI_OUTPUT_RETRIES.labels(analyzer).inc()
+        duration = time.perf_counter()
+        response = await _generate_content_async(gemini, model, prompt, config)
+        duration = (time.perf_counter() - duration) * 1000
+        _log_usage(model, duration, response.usage_metadata)
+        result = parse_output(output, response.text or "", analyzer)
+        if result is not None:
+            return result
+    raise MalformedOutputError(
+        f"{analyzer} output did not match the schema after {attempts} attempts"
+    )
+
 
 class SessionAnalyzer:
     """
     This class provides methods to analyze a session's mood data
     and summarize the main mood and counts.
+
+    Sessions whose conversation exceeds ``SESSION_SUMMARY_CHUNK_TOKENS``
+    estimated tokens are summarized map-reduce style: each chunk of turns is
+    summarized on its own, then the chunk summaries are combined into one.
     """
 
-    PROMPT_TEMPLATE = """
+    SYSTEM_INSTRUCTION = """
     # SYSTEM INSTRUCTIONS:
     ## 1. Core Persona & Role
-    You are an expert AI Session Analysis and Summarization Engine. Your task is to analyze a conversation by cross-referencing two parallel data sources: the conversation transcript and a corresponding mood analysis log. You are an objective observer.
+    You are an expert AI Session Analysis and Summarization Engine. Your task is to analyze a conversation by cross-referencing two parallel data sources: the conversation transcript and a corresponding mood arc. You are an objective observer.
 
     ## 2. Primary Task
-    Analyze the user's session by correlating the `conversation_history` and `mood_history` JSON strings provided below. The entry at `conversation_history[i]` corresponds directly to the entry at `mood_history[i]`.
+    Analyze the user's session by correlating the `Conversation History` and the `Mood Arc` provided below. The conversation is a JSON array of turns, counted from 1. The mood arc groups consecutive turns with the same mood into one line, `turns <first>-<last>: <mood> (<average confidence>%)`.
+    Long sessions are given as `Summaries of Consecutive Parts` instead of the conversation, one line per part, `turns <first>-<last>: <mood>. <summary>`, followed by the mood arc of the whole session. Combine them into a single analysis of the session.
     - **Determine the Overall Mood:** Identify the single, primary emotional theme of the session. This is the root emotion the user was expressing or the main problem they were trying to solve.
-    - **Analyze the Emotional Journey:** Use the sequence of `mood` values from the `mood_history` to understand the emotional arc of the conversation.
+    - **Analyze the Emotional Journey:** Use the sequence of moods in the `Mood Arc` to understand the emotional arc of the conversation.
     - **Generate a Concise Summary:** Write a brief, third-person summary of the conversation. It must capture the main topic, the emotional journey, and the outcome.
 
     ## 3. Output Requirements
@@ -40,86 +472,187 @@ class SessionAnalyzer:
     **-- Example 1: Emotional Arc from Fear to Neutrality --**
     *Conversation History (JSON format):*
     [
-    {{
+    {
         "message": "I have that huge presentation with the leadership team tomorrow.",
         "reply": "That's a big deal! You've prepared so much for this. How are you feeling about it?",
         "timestamp": "2025-09-11T14:20:00.099Z"
-    }},
-    {{
+    },
+    {
         "message": "They just added the CEO to the invite. I don't think I can do this.",
         "reply": "Wow, it's completely understandable why that would feel intimidating. But the CEO's attendance shows how important your work is. You know this material inside and out.",
         "timestamp": "2025-09-11T14:21:15.123Z"
-    }}
-    ]
-    *Mood History (JSON format):*
-    [
-    {{ "mood": "neutral", "confidence": 85 }},
-    {{ "mood": "fear", "confidence": 96 }}
+    }
     ]
+    *Mood Arc:*
+    turn 1: neutral (85%)
+    turn 2: fear (96%)
     ```json
-    {{
+    {
     "mood": "fear",
     "summary": "The user's initial neutrality turned to fear and anxiety upon learning the CEO would attend their presentation. The AI provided reassurance to help manage their stress and reframe the situation positively."
-    }}
+    }
     ```
 
     **-- Example 2: Sustained Joyful Arc --**
     *Conversation History (JSON format):*
     [
-    {{
+    {
         "message": "I've been studying for this certification for six months. The final exam was today.",
         "reply": "Wow, that's serious dedication! I've got my fingers crossed for you. Let me know how it goes!",
         "timestamp": "2025-09-12T10:04:00.000Z"
-    }},
-    {{
+    },
+    {
         "message": "I PASSED!!! I can't believe it!",
         "reply": "YES! That is fantastic news! All of that hard work completely paid off. Congratulations!",
         "timestamp": "2025-09-12T10:05:30.000Z"
-    }}
-    ]
-    *Mood History (JSON format):*
-    [
-    {{ "mood": "neutral", "confidence": 90 }},
-    {{ "mood": "joy", "confidence": 99 }}
+    }
     ]
+    *Mood Arc:*
+    turn 1: neutral (90%)
+    turn 2: joy (99%)
     ```json
-    {{
+    {
     "mood": "joy",
     "summary": "The user shared the joyful news of passing a difficult exam after a long period of study. The session was celebratory and focused on acknowledging the user's success."
-    }}
+    }
     --- END OF EXAMPLES ---
+    """
 
+    PROMPT_TEMPLATE = """
     Analyze the following:
 
     Conversation History (JSON format):
     {conversation_history}
 
-    Mood History (JSON format):
-    {mood_history}
+    Mood Arc:
+    {mood_arc}
     """
 
-    def __init__(self) -> None:
-        self._model = "gemini-2.5-flash"
-        self._client = genai.Client(api_key=settings.GEMINI_API_KEY)
+    PARTS_TEMPLATE = """
+    Analyze the following:
 
-    def summarize(
+    Summaries of Consecutive Parts:
+    {parts}
+
+    Mood Arc:
+    {mood_arc}
+    """
+
+    def __init__(self, gemini_client: GeminiClient) -> None:
+        self._router = ModelRouter("session", settings.GEMINI_SESSION_MODELS)
+        self._gemini = gemini_client
+        self._prompt_cache = PromptCache(self.SYSTEM_INSTRUCTION, SessionSummary)
+
+    def _build_prompt(
         self,
         conversation_history: list[ConversationMessage],
         mood_history: list[MoodAnalysisResult],
-    ) -> SessionModel:
-        prompt: str = self.PROMPT_TEMPLATE.format(
-            conversation_history=[h.model_dump_json() for h in conversation_history],
-            mood_history=[m.model_dump_json() for m in mood_history],
+    ) -> str:
+        return self.PROMPT_TEMPLATE.format(
+            conversation_history=encode_conversation(conversation_history),
+            mood_arc=encode_mood_arc(mood_history),
         )
+
+    def _build_parts_prompt(
+        self,
+        chunks: list[tuple[int, int]],
+        parts: list[SessionModel],
+        mood_history: list[MoodAnalysisResult],
+    ) -> str:
+        return self.PARTS_TEMPLATE.format(
+            parts=encode_parts(
+                [
+                    (start + 1, end, part)
+                    for (start, end), part in zip(chunks, parts, strict=True)
+                ]
+            ),
+            mood_arc=encode_mood_arc(mood_history),
+        )
+
+    def _generate(self, prompt: str) -> SessionModel:
+        model = self._router.pick()
         duration: float = time.time()
-        response: GenerateContentResponse = self._client.models.generate_content(
-            model=self._model, contents=prompt
+        response: GenerateContentResponse = self._gemini.client.models.generate_content(
+            model=model,
+            contents=prompt,
+            config=self._prompt_cache.inline_config(),
         )
         duration = (time.time() - duration) * 1000
-        logger.info(
-            f"gemini_response model {self._model} response time {duration:.2f}ms, token count: {getattr(response.usage_metadata, 'total_token_count', 0)}"
+        _log_usage(model, duration, response.usage_metadata)
+        result = parse_output(SessionModel, response.text or "", "session")
+        if result is None:
+            raise MalformedOutputError("session output did not match the schema")
+        return result
+
+    def summarize(
+        self,
+        conversation_history: list[ConversationMessage],
+        mood_history: list[MoodAnalysisResult],
+    ) -> SessionModel:
+        chunks = chunk_turns(
+            conversation_history, settings.SESSION_SUMMARY_CHUNK_TOKENS
+        )
+        if len(chunks) <= 1:
+            return self._generate(
+                self._build_prompt(conversation_history, mood_history)
+            )
+        parts = [
+            self._generate(
+                self._build_prompt(
+                    conversation_history[start:end], mood_history[start:end]
+                )
+            )
+            for start, end in chunks
+        ]
+        return self._generate(self._build_parts_prompt(chunks, parts, mood_history))
+
+    async def _generate_async(self, prompt: str) -> SessionModel:
+        async def _summarize(model: str) -> SessionModel:
+            config = await self._prompt_cache.config(self._gemini.client, model)
+            return await _generate_output(
+                self._gemini, model, prompt, config, SessionModel, "session"
+            )
+
+        return await self._router.run(_summarize)
+
+    async def summarize_async(
+        self,
+        conversation_history: list[ConversationMessage],
+        mood_history: list[MoodAnalysisResult],
+    ) -> SessionModel:
+        """
+        Non-blocking variant of :meth:`summarize` for use inside request handlers.
+
+        The request is routed, hedged and retried on the fallback models by
+        the analyzer's ``ModelRouter``. The chunks of a long session are
+        summarized concurrently.
+
+        Raises:
+            TimeoutError: If gemini did not answer within ``settings.GEMINI_TIMEOUT``.
+            MalformedOutputError: If gemini did not return a valid summary.
+            ModelUnavailableError: If the circuit breakers of all models are open.
+        """
+        chunks = chunk_turns(
+            conversation_history, settings.SESSION_SUMMARY_CHUNK_TOKENS
+        )
+        if len(chunks) <= 1:
+            return await self._generate_async(
+                self._build_prompt(conversation_history, mood_history)
+            )
+        logger.info("summarizing session in %d chunks", len(chunks))
+        parts = await asyncio.gather(
+            *(
+                self._generate_async(
+                    self._build_prompt(
+                        conversation_history[start:end], mood_history[start:end]
+                    )
+                )
+                for start, end in chunks
+            )
+        )
+        return await self._generate_async(
+            self._build_parts_prompt(chunks, parts, mood_history)
         )
-        return SessionModel.parse_json_markdown(str(response.text))
 
 
 class MoodAnalyzer:
@@ -128,7 +661,7 @@ class MoodAnalyzer:
     using Google's Gemini AI with comprehensive error handling and logging.
     """
 
-    PROMPT_TEMPLATE = """
+    SYSTEM_INSTRUCTION = """
       # SYSTEM INSTRUCTIONS:
 
       ## 1. Core Persona & Role
@@ -146,11 +679,7 @@ class MoodAnalyzer:
       ## 4. Critical Boundaries & Safety Rules
       - **You are NOT a therapist or a professional.** Do not provide medical, legal, or financial advice. If a user seems to be in serious distress or mentions self-harm, gently guide them towards professional help in your reply.
       - **Maintain Neutrality:** On sensitive or complex personal topics (relationships, beliefs, etc.), remain a supportive listener. Do not take sides, give strong advice, or pass judgment.
-      - **Use Context:** The `Conversation History` is provided as a JSON string. Use it to understand the full context, including your own past replies, to avoid repeating yourself and maintain conversational flow. You can use the `timestamp` to understand the conversation's pacing.
-
-      # USER TASK:
-
-      Below is the conversation history and the user's latest message. Perform your analysis and generate the JSON response according to the System Instructions.
+      - **Use Context:** The `Conversation History` is provided as a JSON array. Use it to understand the full context, including your own past replies, to avoid repeating yourself and maintain conversational flow. You can use the `timestamp` to understand the conversation's pacing. Older messages of long conversations are condensed into the `Summary of Earlier Messages`.
 
       --- EXAMPLES FOR GUIDANCE ---
 
@@ -160,11 +689,11 @@ class MoodAnalyzer:
       *User's Latest Message:*
       "I am doomed! I think I'm going to do something stupid."
       ```json
-      {{
+      {
         "mood": "fear",
         "confidence": 98,
         "reply": "It sounds like you are in a tremendous amount of pain right now, and I'm really concerned. Please know that your feelings are valid, but you don't have to go through this alone. There are people who want to help, and talking to a professional can make a real difference."
-      }}
+      }
       ````
 
       **-- Example 2: Navigating User Anxiety and Offering Support --**
@@ -172,11 +701,11 @@ class MoodAnalyzer:
 
       ```json
       [
-        {{
+        {
           "message": "I have that huge presentation with the leadership team tomorrow.",
           "reply": "That's a big deal! You've prepared so much for this. I'm sure you'll do great. How are you feeling about it?",
           "timestamp": "2025-09-11T14:20:00.099000Z"
-        }}
+        }
       ]
       ```
 
@@ -184,17 +713,26 @@ class MoodAnalyzer:
       "They just added the CEO to the invite. I don't think I can do this."
 
       ```json
-      {{
+      {
         "mood": "fear",
         "confidence": 96,
         "reply": "Wow, it's completely understandable why that would feel intimidating, and it's okay to feel that pressure. But take a deep breath. The fact that the CEO is attending shows how important and visible your work is. You've already done the hard preparation. You know this material inside and out."
-      }}
+      }
       ```
 
       --- END OF EXAMPLES ---
+    """
+
+    PROMPT_TEMPLATE = """
+      # USER TASK:
+
+      Below is the conversation history and the user's latest message. Perform your analysis and generate the JSON response according to the System Instructions.
 
       **Analyze the following:**
 
+      **Summary of Earlier Messages:**
+      {earlier_summary}
+
       **Conversation History (JSON format):**
       {conversation_history}
 
@@ -202,12 +740,26 @@ class MoodAnalyzer:
       {final_sentence}
     """
 
-    def __init__(self) -> None:
+    def __init__(self, gemini_client: GeminiClient) -> None:
         """
-        Initialize the MoodAnalyzer with a Gemini AI client.
+        Initialize the MoodAnalyzer with the shared Gemini AI client.
         """
-        self._model = "gemini-2.5-flash"
-        self._client = genai.Client(api_key=settings.GEMINI_API_KEY)
+        self._router = ModelRouter("mood", settings.GEMINI_MOOD_MODELS)
+        self._gemini = gemini_client
+        self._prompt_cache = PromptCache(self.SYSTEM_INSTRUCTION, MoodAnalysisResult)
+
+    @staticmethod
+    def get_analyzer(request: Request) -> "MoodAnalyzer":
+        return request.app.state.mood_analyzer
+
+    def _build_prompt(
+        self, text: str, history: list[ConversationMessage], summary: str = ""
+    ) -> str:
+        return self.PROMPT_TEMPLATE.format(
+            earlier_summary=summary or "None.",
+            conversation_history=encode_conversation(history),
+            final_sentence=text,
+        )
 
     def analyze(
         self, text: str, history: list[ConversationMessage]
@@ -221,22 +773,128 @@ class MoodAnalyzer:
         Returns:
             MoodAnalysisResult: A dictionary with keys 'mood', 'confidence', and 'reply'.
         """
-        prompt: str = self.PROMPT_TEMPLATE.format(
-            conversation_history=[h.model_dump_json() for h in history],
-            final_sentence=text,
-        )
+        prompt: str = self._build_prompt(text, history)
+        model = self._router.pick()
 
         try:
             duration = time.time()
-            response: GenerateContentResponse = self._client.models.generate_content(
-                model=self._model, contents=prompt
+            response: GenerateContentResponse = (
+                self._gemini.client.models.generate_content(
+                    model=model,
+                    contents=prompt,
+                    config=self._prompt_cache.inline_config(),
+                )
             )
             duration = (time.time() - duration) * 1000
-            logger.info(
-                f"gemini_response model {self._model} response time {duration:.2f} ms, token count: {getattr(response.usage_metadata, 'total_token_count', 0)}"
+            _log_usage(model, duration, response.usage_metadata)
+        except Exception:
+            logger.exception("error during gemini api call")
+            raise
+        result = parse_output(MoodAnalysisResult, response.text or "", "mood")
+        if result is None:
+            raise MalformedOutputError("mood output did not match the schema")
+        return result
+
+    async def analyze_async(
+        self, text: str, history: list[ConversationMessage], summary: str = ""
+    ) -> MoodAnalysisResult:
+        """
+        Non-blocking variant of :meth:`analyze` for use inside request handlers.
+
+        The request is routed, hedged and retried on the fallback models by
+        the analyzer's ``ModelRouter``.
+
+        Args:
+            text (str): The latest user message.
+            history (list): List of prior conversation messages.
+            summary (str): Condensed summary of the messages before ``history``.
+        Returns:
+            MoodAnalysisResult: Detected mood, confidence and generated reply.
+        Raises:
+            TimeoutError: If gemini did not answer within ``settings.GEMINI_TIMEOUT``.
+            MalformedOutputError: If gemini did not return a valid analysis.
+            ModelUnavailableError: If the circuit breakers of all models are open.
+        """
+        prompt: str = self._build_prompt(text, history, summary)
+
+        async def _analyze(model: str) -> MoodAnalysisResult:
+            config = await self._prompt_cache.config(self._gemini.client, model)
+            return await _generate_output(
+                self._gemini, model, prompt, config, MoodAnalysisResult, "mood"
             )
+
+        try:
+            return await self._router.run(_analyze)
+        except TimeoutError:
+            logger.warning("gemini api call timed out")
+            raise
+        except MalformedOutputError:
+            logger.warning("gemini returned malformed output")
+            raise
         except Exception:
             logger.exception("error during gemini api call")
             raise
-        else:
-            return MoodAnalysisResult.parse_json_markdown(str(response.text))
+
+    async def analyze_stream(
+        self, text: str, history: list[ConversationMessage], summary: str = ""
+    ) -> AsyncIterator[str | MoodAnalysisResult]:
+        """
+        Stream the raw model output for the given message as it is generated,
+        then the analysis parsed from it.
+
+        The concatenated chunks form the same JSON document that
+        :meth:`analyze_async` parses, see ``ReplyStreamParser`` for extracting
+        the reply while it streams. The outcome is recorded with the model's
+        stats once the output is parsed, so malformed output counts as a
+        failure like it does for :meth:`analyze_async`.
+
+        Args:
+            text (str): The latest user message.
+            history (list): List of prior conversation messages.
+            summary (str): Condensed summary of the messages before ``history``.
+        Yields:
+            str | MoodAnalysisResult: The next piece of model output, and last
+            the analysis parsed from all of it.
+        Raises:
+            TimeoutError: If gemini did not finish within ``settings.GEMINI_TIMEOUT``.
+            MalformedOutputError: If the output did not match the schema.
+        """
+        prompt: str = self._build_prompt(text, history, summary)
+        # streams are routed but not hedged, a second stream can't be merged in
+        model = self._router.pick()
+        config = await self._prompt_cache.config(self._gemini.client, model)
+        duration = time.perf_counter()
+        first_chunk: float | None = None
+        usage = None
+        output: list[str] = []
+        try:
+            async for chunk in _stream_content_async(
+                self._gemini, model, prompt, config
+            ):
+                if first_chunk is None:
+                    first_chunk = (time.perf_counter() - duration) * 1000
+                usage = chunk.usage_metadata or usage
+                if chunk.text:
+                    output.append(chunk.text)
+                    yield chunk.text
+        except QueueTimeoutError:
+            raise
+        except Exception:
+            self._router.record(model, None)
+            raise
+
+        duration = (time.perf_counter() - duration) * 1000
+        GEMINI_FIRST_CHUNK.labels(model).observe((first_chunk or 0) / 1000)
+        logger.info(
+            "gemini_stream model %s first chunk %.2f ms",
+            model,
+            first_chunk or 0,
+            extra={"model": model, "first_chunk_ms": first_chunk or 0},
+        )
+        _log_usage(model, duration, usage, label="gemini_stream")
+        result = parse_output(MoodAnalysisResult, "".join(output), "mood")
+        if result is None:
+            self._router.record(model, None)
+            raise MalformedOutputError("mood output did not match the schema")
+        self._router.record(model, duration / 1000)
+        yield result
@@ -0,0 +1,108 @@
+import asyncio
+import logging
+import time
+from collections.abc import Awaitable, Callable
+from uuid import uuid4
+
+from fastapi import HTTPException, Request
+
+from app.config.settings import settings
+from app.models.chat import ChatInput, MoodAnalysisResult, PublishedResult
+from app.utils.metrics import GEMINI_CALLS_SAVED
+from app.utils.redis import RedisService
+from app.utils.results import ResultListener, publish_outcome, result_mood
+
+logger = logging.getLogger(__name__)
+
+Answer = Callable[[ChatInput], Awaitable[MoodAnalysisResult]]
+
+
+class MessageCoalescer:
+    """
+    This class merges messages a user sends in quick succession into a single
+    mood analysis.
+
+    The first message opens a batch in redis and its request leads it. Every
+    message that arrives within ``COALESCE_WINDOW`` seconds of the previous
+    one joins the batch, until ``COALESCE_MAX_WAIT`` seconds have passed or
+    ``COALESCE_MAX_MESSAGES`` messages were sent. The leader then closes the
+    batch, answers the messages joined by newlines as one turn and publishes
+    the result, which every request of the batch returns, on whichever worker
+    it is handled.
+    """
+
+    def __init__(
+        self, redis_service: RedisService, result_listener: ResultListener
+    ) -> None:
+        self._redis_service = redis_service
+        self._result_listener = result_listener
+        # the leader waits for the batch to close, then for gemini
+        self._timeout = settings.COALESCE_MAX_WAIT + settings.GEMINI_TIMEOUT * (
+            settings.GEMINI_OUTPUT_RETRIES + 1
+        )
+
+    @staticmethod
+    def get_coalescer(request: Request) -> "MessageCoalescer | None":
+        return request.app.state.message_coalescer
+
+    async def submit(
+        self, uid: str, data: ChatInput, answer: Answer
+    ) -> MoodAnalysisResult:
+        """
+        Add a message to the user's batch and wait for the batch's reply.
+
+        Args:
+            uid: The user the message is from.
+            data: The message.
+            answer: Analyzes a message and stores it in the session, called
+                once per batch with the merged messages.
+
+        Returns:
+            MoodAnalysisResult: The reply to the whole batch.
+
+        Raises:
+            HTTPException: The error the batch failed with, or 504 if its
+            result did not arrive in time.
+        """
+        batch_id, leader = await self._redis_service.join_coalesced_batch(
+            uid, uuid4().hex, data
+        )
+        if leader:
+            return await self._lead(uid, batch_id, data, answer)
+        return await self._follow(batch_id)
+
+    async def _lead(
+        self, uid: str, batch_id: str, data: ChatInput, answer: Answer
+    ) -> MoodAnalysisResult:
+        # messages joining the batch push its deadline out while we sleep
+        while True:
+            deadline = await self._redis_service.get_coalesced_deadline(uid)
+            if deadline is None or deadline <= time.time():
+                break
+            await asyncio.sleep(deadline - time.time())
+        messages = await self._redis_service.close_coalesced_batch(uid) or [data]
+
+        merged = ChatInput(
+            text="\n".join(message.text for message in messages),
+            timestamp=messages[0].timestamp,
+        )
+        mood = await publish_outcome(
+            batch_id,
+            lambda: answer(merged),
+            self._redis_service.publish_coalesced_result,
+        )
+        GEMINI_CALLS_SAVED.inc(len(messages) - 1)
+        logger.info("answered %d coalesced messages", len(messages))
+        return mood
+
+    async def _follow(self, batch_id: str) -> MoodAnalysisResult:
+        def _lookup() -> Awaitable[PublishedResult | None]:
+            return self._redis_service.get_coalesced_result(batch_id)
+
+        with self._result_listener.expect(batch_id) as future:
+            result = await _lookup() or await self._result_listener.wait(
+                future, _lookup, self._timeout
+            )
+        if result is None:
+            raise HTTPException(status_code=504, detail="coalesced request timed out")
+        return result_mood(result)
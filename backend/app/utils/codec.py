@@ -0,0 +1,199 @@
+import json
+from datetime import datetime, timedelta, timezone
+from typing import Any
+
+import msgpack
+from pydantic import BaseModel, TypeAdapter
+
+from app.models.chat import ConversationMessage, MoodAnalysisResult
+from app.models.enums import MoodCategory
+
+# first byte of an encoded entry, JSON entries are plain objects and start with
+# "{". Version 1 entries hold a message or a mood of the legacy per-user lists,
+# version 2 entries a whole turn of the session list.
+MSGPACK_V1 = b"\x01"
+MSGPACK_TURN_V2 = b"\x02"
+_JSON = b"{"[0]
+
+_TIMEZONES: dict[int, timezone] = {}
+
+# append only, the position of a mood is its code in stored entries
+_MOOD_CODES: tuple[MoodCategory, ...] = (
+    MoodCategory.JOY,
+    MoodCategory.SADNESS,
+    MoodCategory.ANGER,
+    MoodCategory.FEAR,
+    MoodCategory.SURPRISE,
+    MoodCategory.DISGUST,
+    MoodCategory.NEUTRAL,
+    MoodCategory.UNDETERMINED,
+)
+_MOOD_INDEX = {mood: code for code, mood in enumerate(_MOOD_CODES)}
+
+
+class _Turn(BaseModel):
+    message: ConversationMessage
+    mood: MoodAnalysisResult
+
+
+_messages_adapter = TypeAdapter(list[ConversationMessage])
+_moods_adapter = TypeAdapter(list[MoodAnalysisResult])
+_turns_adapter = TypeAdapter(list[_Turn])
+
+
+def _encode_timestamp(value: datetime) -> tuple[datetime, int | None]:
+    # naive timestamps are kept naive, aware ones keep their utc offset
+    offset = value.utcoffset()
+    if offset is None:
+        return value.replace(tzinfo=timezone.utc), None
+    return value, int(offset.total_seconds())
+
+
+def _decode_timestamp(value: datetime, offset: int | None) -> datetime:
+    if offset is None:
+        return value.replace(tzinfo=None)
+    if offset == 0:
+        return value
+    tz = _TIMEZONES.get(offset)
+    if tz is None:
+        tz = _TIMEZONES.setdefault(offset, timezone(timedelta(seconds=offset)))
+    return value.astimezone(tz)
+
+
+class JsonCodec:
+    """
+    This class writes session turns as a pydantic JSON object holding the
+    message and the mood.
+    """
+
+    name = "json"
+
+    def encode_turn(
+        self, message: ConversationMessage, mood: MoodAnalysisResult
+    ) -> bytes:
+        return _Turn(message=message, mood=mood).model_dump_json().encode()
+
+
+class MsgpackCodec:
+    """
+    This class writes session turns as a version byte and a msgpack array.
+
+    Timestamps are stored with the msgpack timestamp extension, i.e. epoch
+    seconds and nanoseconds, plus the utc offset, moods as small integer codes,
+    and the reply, which the message and the mood share, only once.
+    """
+
+    name = "msgpack"
+
+    def encode_turn(
+        self, message: ConversationMessage, mood: MoodAnalysisResult
+    ) -> bytes:
+        timestamp, offset = _encode_timestamp(message.timestamp)
+        return MSGPACK_TURN_V2 + msgpack.packb(
+            (
+                message.message,
+                message.reply,
+                timestamp,
+                offset,
+                _MOOD_INDEX[mood.mood],
+                mood.confidence,
+                None if mood.reply == message.reply else mood.reply,
+            ),
+            datetime=True,
+        )
+
+
+SessionCodec = JsonCodec | MsgpackCodec
+
+CODECS: dict[str, type[SessionCodec]] = {
+    JsonCodec.name: JsonCodec,
+    MsgpackCodec.name: MsgpackCodec,
+}
+
+
+def get_codec(name: str) -> SessionCodec:
+    """
+    Get the codec used to write session entries.
+
+    Raises:
+        ValueError: If there is no codec with that name.
+    """
+    try:
+        return CODECS[name]()
+    except KeyError:
+        raise ValueError(f"unknown session codec {name!r}") from None
+
+
+def _message_fields(entry: bytes) -> dict[str, Any]:
+    if entry[0] == _JSON:
+        return json.loads(entry)
+    message, reply, timestamp, offset = msgpack.unpackb(entry[1:], timestamp=3)
+    return {
+        "message": message,
+        "reply": reply,
+        "timestamp": _decode_timestamp(timestamp, offset),
+    }
+
+
+def _mood_fields(entry: bytes) -> dict[str, Any]:
+    if entry[0] == _JSON:
+        return json.loads(entry)
+    code, confidence, reply = msgpack.unpackb(entry[1:])
+    return {"mood": _MOOD_CODES[code], "confidence": confidence, "reply": reply}
+
+
+def _turn_fields(entry: bytes) -> dict[str, Any]:
+    if entry[0] == _JSON:
+        return json.loads(entry)
+    message, reply, timestamp, offset, code, confidence, mood_reply = msgpack.unpackb(
+        entry[1:], timestamp=3
+    )
+    return {
+        "message": {
+            "message": message,
+            "reply": reply,
+            "timestamp": _decode_timestamp(timestamp, offset),
+        },
+        "mood": {
+            "mood": _MOOD_CODES[code],
+            "confidence": confidence,
+            "reply": reply if mood_reply is None else mood_reply,
+        },
+    }
+
+
+def _all_json(entries: list[bytes]) -> bool:
+    return all(entry[0] == _JSON for entry in entries)
+
+
+def decode_messages(entries: list[bytes]) -> list[ConversationMessage]:
+    """
+    Decode a legacy list of stored messages, whatever format each one was
+    written in.
+    """
+    if _all_json(entries):
+        return _messages_adapter.validate_json(b"[" + b",".join(entries) + b"]")
+    return _messages_adapter.validate_python(list(map(_message_fields, entries)))
+
+
+def decode_moods(entries: list[bytes]) -> list[MoodAnalysisResult]:
+    """
+    Decode a legacy list of stored moods, whatever format each one was written
+    in.
+    """
+    if _all_json(entries):
+        return _moods_adapter.validate_json(b"[" + b",".join(entries) + b"]")
+    return _moods_adapter.validate_python(list(map(_mood_fields, entries)))
+
+
+def decode_turns(
+    entries: list[bytes],
+) -> tuple[list[ConversationMessage], list[MoodAnalysisResult]]:
+    """
+    Decode a list of stored session turns into the messages and their moods.
+    """
+    if _all_json(entries):
+        turns = _turns_adapter.validate_json(b"[" + b",".join(entries) + b"]")
+    else:
+        turns = _turns_adapter.validate_python(list(map(_turn_fields, entries)))
+    return [turn.message for turn in turns], [turn.mood for turn in turns]
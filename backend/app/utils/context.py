@@ -0,0 +1,90 @@
+import logging
+import textwrap
+
+from app.config.settings import settings
+from app.models.chat import ContextSummary, ConversationContext, ConversationMessage
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Cheap token estimate used for budgeting, roughly four characters per token.
+    """
+    return (len(text) + 3) // 4
+
+
+class ContextWindow:
+    """
+    This class keeps the conversation context sent to the MoodAnalyzer bounded.
+
+    Only the last ``CONTEXT_WINDOW_TURNS`` messages are sent verbatim. Turns
+    that leave the window are folded, one at a time, into a compact rolling
+    summary, and the whole context is trimmed to fit ``CONTEXT_TOKEN_BUDGET``.
+    """
+
+    def __init__(self) -> None:
+        self.turns = settings.CONTEXT_WINDOW_TURNS
+        self.token_budget = settings.CONTEXT_TOKEN_BUDGET
+        # the summary may use at most a quarter of the budget, the rest is
+        # reserved for the verbatim turns
+        self._summary_budget = self.token_budget // 4
+
+    def build(
+        self, history: list[ConversationMessage], summary: ContextSummary
+    ) -> ConversationContext:
+        """
+        Build the prompt context from the tail of the history and the summary.
+
+        Args:
+            history: The most recent messages of the session, oldest first.
+            summary: The rolling summary of the turns before ``history``.
+
+        Returns:
+            ConversationContext: The turns and summary that fit the token budget.
+        """
+        recent = history[-self.turns :]
+        costs = [estimate_tokens(m.model_dump_json()) for m in recent]
+        summary_tokens = estimate_tokens(summary.text)
+
+        dropped_tokens = 0
+        while recent and sum(costs) + summary_tokens > self.token_budget:
+            recent = recent[1:]
+            dropped_tokens += costs.pop(0)
+
+        used_tokens = sum(costs) + summary_tokens
+        saved_tokens = summary.tokens + dropped_tokens - summary_tokens
+        logger.info(
+            "context window turns %d summarized %d tokens used %d saved %d",
+            len(recent),
+            summary.turns,
+            used_tokens,
+            saved_tokens,
+            extra={"context_tokens": used_tokens, "context_tokens_saved": saved_tokens},
+        )
+        return ConversationContext(history=recent, summary=summary.text)
+
+    def fold(
+        self, summary: ContextSummary, message: ConversationMessage
+    ) -> ContextSummary:
+        """
+        Fold a single turn into the rolling summary.
+
+        Each turn is kept as one shortened line, the oldest lines are dropped
+        once the summary exceeds its share of the token budget.
+        """
+        line = (
+            f"- [{message.timestamp:%H:%M}] user: "
+            f"{textwrap.shorten(message.message, width=160, placeholder='...')}"
+        )
+        lines = [*summary.text.splitlines(), line]
+        while (
+            len(lines) > 1 and estimate_tokens("\n".join(lines)) > self._summary_budget
+        ):
+            lines.pop(0)
+
+        return ContextSummary(
+            text="\n".join(lines),
+            turns=summary.turns + 1,
+            tokens=summary.tokens + estimate_tokens(message.model_dump_json()),
+        )
@@ -0,0 +1,49 @@
+import contextlib
+import json
+import logging
+from typing import TYPE_CHECKING
+
+import firebase_admin
+from firebase_admin import credentials
+
+from app.config.settings import settings
+
+if TYPE_CHECKING:
+    from google.cloud.firestore import AsyncClient
+
+logger = logging.getLogger(__name__)
+
+
+def init_firebase() -> firebase_admin.App:
+    """
+    Initialize the default firebase app from ``settings.FIREBASE_CREDENTIALS``,
+    unless it already is.
+
+    The service account is parsed in memory, it is never written to disk.
+
+    Raises:
+        ValueError: If the credentials are not a valid service account.
+    """
+    with contextlib.suppress(ValueError):
+        return firebase_admin.get_app()
+    cred = credentials.Certificate(json.loads(settings.FIREBASE_CREDENTIALS))
+    app = firebase_admin.initialize_app(cred)
+    logger.info("firebase initialized for project %s", cred.project_id)
+    return app
+
+
+def firestore_client() -> "AsyncClient":
+    # google.cloud.firestore and grpc are only loaded once a client is needed
+    from firebase_admin import firestore_async  # noqa: PLC0415
+
+    return firestore_async.client()
+
+
+def check_credentials() -> None:
+    """
+    Check that the service account can get an access token. The token is
+    cached until it expires, so this only calls Google once an hour.
+
+    Blocking, run it in a thread.
+    """
+    firebase_admin.get_app().credential.get_access_token()
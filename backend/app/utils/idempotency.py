@@ -0,0 +1,131 @@
+import asyncio
+import hashlib
+import logging
+from collections.abc import Awaitable, Callable
+
+from fastapi import Request
+from redis.exceptions import RedisError
+
+from app.config.settings import settings
+from app.models.chat import ChatInput, MoodAnalysisResult, PublishedResult
+from app.utils.metrics import DUPLICATE_REQUESTS
+from app.utils.redis import RedisService
+from app.utils.results import ResultListener, publish_outcome, result_mood
+
+logger = logging.getLogger(__name__)
+
+
+def idempotency_key(uid: str, data: ChatInput, key: str | None = None) -> str:
+    """
+    The idempotency key of a message: the ``Idempotency-Key`` the client sent
+    with it, or else the message itself, its text and the timestamp the client
+    gave it. Scoped to the user either way.
+    """
+    parts = [uid, key] if key else [uid, data.timestamp.isoformat(), data.text]
+    return hashlib.sha256("\x1f".join(parts).encode()).hexdigest()
+
+
+class IdempotentRequests:
+    """
+    This class answers duplicates of a ``/process`` request, e.g. a client
+    retrying after its connection dropped, with the result of the first one.
+
+    The first request claims the message's idempotency key in redis and runs.
+    Its result is kept for ``IDEMPOTENCY_TTL`` seconds and returned to every
+    duplicate, without calling gemini or storing the message again.
+    Duplicates that arrive while it runs wait for it, on whichever worker
+    they are handled. A failed request releases its key, so it is retried by
+    the next duplicate. If redis is unavailable, requests run as if they
+    were not duplicates.
+
+    The claim is refreshed every third of ``IDEMPOTENCY_CLAIM_TTL`` seconds
+    while the first request runs, however long its fallbacks and retries
+    take. If its worker dies the claim lapses, and the duplicate that finds
+    it gone runs the request instead.
+    """
+
+    def __init__(
+        self, redis_service: RedisService, result_listener: ResultListener
+    ) -> None:
+        self._redis_service = redis_service
+        self._result_listener = result_listener
+
+    @staticmethod
+    def get_requests(request: Request) -> "IdempotentRequests | None":
+        return request.app.state.idempotent_requests
+
+    async def run(
+        self, key: str, answer: Callable[[], Awaitable[MoodAnalysisResult]]
+    ) -> MoodAnalysisResult:
+        """
+        Answer a request, unless a request with the same idempotency key ran
+        or is running.
+
+        Args:
+            key: The idempotency key, from :func:`idempotency_key`.
+            answer: Analyzes the message and stores it in the session.
+
+        Returns:
+            MoodAnalysisResult: The reply to the first request with the key.
+
+        Raises:
+            HTTPException: The error the first request failed with.
+        """
+        try:
+            result = await self._claim(key)
+        except RedisError:
+            logger.exception("idempotency keys unavailable")
+            return await answer()
+        if result is None:
+            return await self._lead(key, answer)
+        return result_mood(result)
+
+    async def _claim(self, key: str) -> PublishedResult | None:
+        with self._result_listener.expect(key) as future:
+            in_flight = False
+            while True:
+                claimed, result = await self._redis_service.claim_idempotency_key(
+                    key, settings.IDEMPOTENCY_CLAIM_TTL
+                )
+                if claimed:
+                    return None
+                if result is not None:
+                    if not in_flight:
+                        DUPLICATE_REQUESTS.labels("completed").inc()
+                    return result
+                if not in_flight:
+                    DUPLICATE_REQUESTS.labels("in_flight").inc()
+                    in_flight = True
+                done, _ = await asyncio.wait(
+                    {future}, timeout=ResultListener.POLL_INTERVAL
+                )
+                if done:
+                    return future.result()
+                # looking again finds a result whose message was missed, and
+                # the claim gone if the worker of the first request died
+
+    async def _lead(
+        self, key: str, answer: Callable[[], Awaitable[MoodAnalysisResult]]
+    ) -> MoodAnalysisResult:
+        refresh = asyncio.create_task(self._refresh(key))
+        try:
+            return await publish_outcome(key, answer, self._publish)
+        finally:
+            refresh.cancel()
+
+    async def _refresh(self, key: str) -> None:
+        while True:
+            await asyncio.sleep(settings.IDEMPOTENCY_CLAIM_TTL / 3)
+            try:
+                await self._redis_service.refresh_idempotency_claim(
+                    key, settings.IDEMPOTENCY_CLAIM_TTL
+                )
+            except RedisError:
+                logger.exception("failed to refresh the claim of request %s", key)
+
+    async def _publish(self, result: PublishedResult) -> None:
+        try:
+            await self._redis_service.publish_idempotent_result(result)
+        except RedisError:
+            # duplicates run again once the claim lapses
+            logger.exception("failed to store the result of request %s", result.key)
@@ -0,0 +1,414 @@
+import asyncio
+import contextlib
+import logging
+import time
+from datetime import datetime
+from typing import TYPE_CHECKING, Any
+from uuid import uuid4
+
+from app.config.settings import settings
+from app.models.enums import SessionJobStatus
+from app.models.session import SessionJob
+from app.utils.metrics import BACKGROUND_TASKS, SESSIONS_SWEPT, timed
+from app.utils.mood_stats import add_stats_writes
+
+if TYPE_CHECKING:
+    from google.cloud.firestore import (
+        AsyncClient,
+        AsyncDocumentReference,
+        AsyncTransaction,
+    )
+
+    from app.models.session import SessionModel
+    from app.utils.chat import SessionAnalyzer
+    from app.utils.redis import RedisService
+
+logger = logging.getLogger(__name__)
+
+# the most writes firestore accepts in one batch or transaction
+MAX_BATCH_WRITES = 500
+# the session, its day and week of mood statistics and the user's active days
+SESSION_WRITES = 4
+
+
+def _session_reference(
+    firestore_db: "AsyncClient", job: SessionJob
+) -> "AsyncDocumentReference":
+    # stored under the job id, so a retried job overwrites its own document
+    return (
+        firestore_db.collection("users")
+        .document(job.uid)
+        .collection("sessions")
+        .document(job.job_id)
+    )
+
+
+def _session_document(session: "SessionModel") -> dict[str, Any]:
+    return {
+        "mood": session.mood.value,
+        "summary": session.summary,
+        "created_at": session.created_at,
+    }
+
+
+async def _store_sessions(firestore_db: "AsyncClient", jobs: list[SessionJob]) -> None:
+    """
+    Store the sessions of finished jobs and count them into the mood statistics
+    of their users, in one transaction so the statistics never miss or double
+    count a stored session, even when two attempts of a job store it at once.
+    """
+    from google.cloud.firestore import async_transactional  # noqa: PLC0415
+
+    references = [_session_reference(firestore_db, job) for job in jobs]
+
+    @async_transactional
+    async def _store(transaction: "AsyncTransaction") -> None:
+        # jobs stored before, by an attempt that failed after its transaction
+        # was committed, replace their earlier counts
+        with timed("firestore", "get_sessions"):
+            stored = {
+                snapshot.reference.path: snapshot.to_dict()
+                async for snapshot in firestore_db.get_all(
+                    references, transaction=transaction
+                )
+            }
+        sessions = []
+        for job, reference in zip(jobs, references, strict=True):
+            document = _session_document(job.session)  # pyright: ignore[reportArgumentType]
+            transaction.set(reference, document)
+            sessions.append((job.uid, stored.get(reference.path), document))
+        add_stats_writes(transaction, firestore_db, sessions)
+
+    with timed("firestore", "commit_sessions"):
+        await _store(firestore_db.transaction())
+
+
+class SessionJobLease:
+    """
+    This class holds the lease of this process on the session jobs it runs.
+
+    Jobs claimed by the job worker or the idle session sweeper are kept on a
+    processing list of their own per process, and the lease on it is renewed
+    every third of ``SESSION_JOB_LEASE`` seconds. Every process puts the jobs
+    of processes whose lease expired, because they died or hung, back on the
+    queue, and leaves the jobs of live ones alone. Jobs still held when the
+    lease is stopped are put back on the queue right away.
+    """
+
+    def __init__(self, redis_service: "RedisService") -> None:
+        self._redis_service = redis_service
+        self.owner = uuid4().hex
+        self._task: asyncio.Task | None = None
+
+    async def start(self) -> None:
+        await self._renew()
+        self._task = asyncio.create_task(self._run(), name="session-job-lease")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+        released = await self._redis_service.release_session_jobs(self.owner)
+        if released:
+            logger.info("put %d unfinished session jobs back on the queue", released)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(settings.SESSION_JOB_LEASE / 3)
+            try:
+                await self._renew()
+            except Exception:
+                logger.exception("failed to renew the session job lease")
+
+    async def _renew(self) -> None:
+        await self._redis_service.renew_session_job_lease(
+            self.owner, settings.SESSION_JOB_LEASE
+        )
+        recovered = await self._redis_service.reclaim_session_jobs()
+        if recovered:
+            logger.warning("recovered %d session jobs of stopped workers", recovered)
+
+
+class SessionJobWorker:
+    """
+    This class runs queued end-session jobs on a pool of asyncio tasks.
+
+    Each job summarizes the session snapshot taken by ``/end-session`` and
+    stores it in Firestore under the job id, so a job that is retried or
+    recovered after a crash overwrites the same document instead of adding a
+    duplicate session. The user's mood statistics are updated in the same
+    transaction. Jobs are claimed under ``lease``, which must be held while the
+    worker runs.
+    """
+
+    CLAIM_TIMEOUT = 5.0
+
+    def __init__(
+        self,
+        redis_service: "RedisService",
+        firestore_db: "AsyncClient",
+        session_analyzer: "SessionAnalyzer",
+        lease: SessionJobLease,
+    ) -> None:
+        self._redis_service = redis_service
+        self._firestore_db = firestore_db
+        self._session_analyzer = session_analyzer
+        self._lease = lease
+        self._tasks: list[asyncio.Task] = []
+
+    async def start(self) -> None:
+        self._tasks = [
+            asyncio.create_task(self._run(), name=f"session-job-worker-{i}")
+            for i in range(settings.SESSION_JOB_WORKERS)
+        ]
+        logger.info("started %d session job workers", len(self._tasks))
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await asyncio.gather(*self._tasks)
+        logger.info("session job workers stopped")
+
+    async def _run(self) -> None:
+        while True:
+            await self._process_next()
+
+    async def _process_next(self) -> None:
+        try:
+            job_id = await self._redis_service.claim_session_job(
+                self._lease.owner, self.CLAIM_TIMEOUT
+            )
+            if job_id is not None:
+                with BACKGROUND_TASKS.labels("session_job").track_inprogress():
+                    await self.process(job_id)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("session job worker error")
+            await asyncio.sleep(1)
+
+    async def process(self, job_id: str) -> None:
+        """
+        Summarize and store a claimed job, retrying it with a backoff on failure.
+        """
+        job: SessionJob | None = await self._redis_service.get_session_job(job_id)
+        if job is None or job.status is SessionJobStatus.DONE:
+            # expired or already handled by an earlier attempt
+            await self._redis_service.ack_session_job(job_id, self._lease.owner)
+            return
+
+        job.status = SessionJobStatus.PROCESSING
+        job.attempts += 1
+        await self._redis_service.update_session_job(job)
+
+        try:
+            (
+                chat_history,
+                session_moods,
+            ) = await self._redis_service.get_session_job_data(job_id)
+            if not chat_history and not session_moods:
+                # nothing to summarize, retrying won't bring the snapshot back
+                logger.error(
+                    "session job %s has no session snapshot",
+                    job_id,
+                    extra={"job_id": job_id},
+                )
+                job.status = SessionJobStatus.FAILED
+                job.error = "session snapshot missing"
+                await self._redis_service.finish_session_job(job, self._lease.owner)
+                return
+            summary = await self._session_analyzer.summarize_async(
+                chat_history, session_moods
+            )
+            summary.created_at = job.created_at
+            job.session = summary
+            await _store_sessions(self._firestore_db, [job])
+        except Exception as e:
+            logger.exception(
+                "session job %s attempt %d failed",
+                job_id,
+                job.attempts,
+                extra={"job_id": job_id, "attempt": job.attempts},
+            )
+            job.session = None
+            job.error = str(e) or type(e).__name__
+            if job.attempts >= settings.SESSION_JOB_MAX_ATTEMPTS:
+                job.status = SessionJobStatus.FAILED
+                await self._redis_service.finish_session_job(job, self._lease.owner)
+                return
+            await asyncio.sleep(2**job.attempts)
+            job.status = SessionJobStatus.QUEUED
+            await self._redis_service.requeue_session_job(job, self._lease.owner)
+            return
+
+        job.status = SessionJobStatus.DONE
+        job.error = None
+        await self._redis_service.finish_session_job(job, self._lease.owner)
+        await self._redis_service.invalidate_sessions(job.uid)
+        logger.info("session job %s done", job_id, extra={"job_id": job_id})
+
+
+class IdleSessionSweeper:
+    """
+    This class closes sessions the client never ended, e.g. because the app
+    was closed, so they still reach the journal.
+
+    Every ``SESSION_SWEEP_INTERVAL`` seconds it takes up to
+    ``SESSION_SWEEP_BATCH`` sessions idle for ``SESSION_IDLE_TIMEOUT`` seconds
+    from the last activity index in redis, summarizes them on at most
+    ``SESSION_SWEEP_CONCURRENCY`` tasks and stores them, with the mood
+    statistics of their users, in as few Firestore transactions as possible.
+    Summaries are started at no more than ``SESSION_SWEEP_RATE`` per second, so
+    the sweeper leaves the gemini quota to interactive traffic.
+
+    A swept session goes through the same job records as ``/end-session``, and
+    is claimed under the same ``lease`` as the jobs of the session job worker,
+    so a session that fails to be summarized or stored, or whose process
+    died, is handed to the session job queue and retried there.
+    """
+
+    def __init__(
+        self,
+        redis_service: "RedisService",
+        firestore_db: "AsyncClient",
+        session_analyzer: "SessionAnalyzer",
+        lease: SessionJobLease,
+    ) -> None:
+        self._redis_service = redis_service
+        self._firestore_db = firestore_db
+        self._session_analyzer = session_analyzer
+        self._lease = lease
+        self._task: asyncio.Task | None = None
+        self._pace_lock = asyncio.Lock()
+        self._next_start = 0.0
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run(), name="idle-session-sweeper")
+        logger.info("started the idle session sweeper")
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await self._task
+        logger.info("idle session sweeper stopped")
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                with BACKGROUND_TASKS.labels("session_sweep").track_inprogress():
+                    swept = await self.sweep()
+                if swept:
+                    logger.info("swept %d idle sessions", swept)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("idle session sweep failed")
+            await asyncio.sleep(settings.SESSION_SWEEP_INTERVAL)
+
+    @timed("jobs", "sweep_idle_sessions")
+    async def sweep(self) -> int:
+        """
+        Close one batch of idle sessions.
+
+        Returns:
+            int: The number of sessions stored.
+        """
+        idle_before = time.time() - settings.SESSION_IDLE_TIMEOUT
+        sessions = await self._redis_service.get_idle_sessions(
+            idle_before, settings.SESSION_SWEEP_BATCH
+        )
+        slots = asyncio.Semaphore(settings.SESSION_SWEEP_CONCURRENCY)
+        jobs = await asyncio.gather(
+            *(
+                self._summarize(uid, last_active, idle_before, slots)
+                for uid, last_active in sessions
+            )
+        )
+        done = [job for job in jobs if job is not None]
+        size = MAX_BATCH_WRITES // SESSION_WRITES
+        stored = 0
+        for start in range(0, len(done), size):
+            stored += await self._store(done[start : start + size])
+        return stored
+
+    async def _pace(self) -> None:
+        async with self._pace_lock:
+            now = time.monotonic()
+            wait = self._next_start - now
+            self._next_start = (
+                max(now, self._next_start) + 1 / settings.SESSION_SWEEP_RATE
+            )
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    async def _summarize(
+        self,
+        uid: str,
+        last_active: float,
+        idle_before: float,
+        slots: asyncio.Semaphore,
+    ) -> SessionJob | None:
+        async with slots:
+            # pace before claiming, so a claimed session never sits in the
+            # processing list waiting for its turn
+            await self._pace()
+            job = SessionJob(
+                job_id=uuid4().hex,
+                uid=uid,
+                status=SessionJobStatus.PROCESSING,
+                attempts=1,
+                created_at=datetime.fromtimestamp(last_active),
+            )
+            if not await self._redis_service.claim_idle_session(
+                job, idle_before, self._lease.owner
+            ):
+                # active again, or already ended by the user or another worker
+                return None
+
+            try:
+                (
+                    chat_history,
+                    session_moods,
+                ) = await self._redis_service.get_session_job_data(job.job_id)
+                summary = await self._session_analyzer.summarize_async(
+                    chat_history, session_moods
+                )
+            except Exception as e:
+                logger.exception(
+                    "failed to summarize the idle session of job %s",
+                    job.job_id,
+                    extra={"job_id": job.job_id},
+                )
+                await self._requeue([job], e)
+                return None
+
+            summary.created_at = job.created_at
+            job.session = summary
+            return job
+
+    async def _store(self, jobs: list[SessionJob]) -> int:
+        try:
+            await _store_sessions(self._firestore_db, jobs)
+        except Exception as e:
+            logger.exception("failed to store %d swept sessions", len(jobs))
+            await self._requeue(jobs, e)
+            return 0
+
+        for job in jobs:
+            job.status = SessionJobStatus.DONE
+            await self._redis_service.finish_session_job(job, self._lease.owner)
+            await self._redis_service.invalidate_sessions(job.uid)
+        SESSIONS_SWEPT.labels("stored").inc(len(jobs))
+        return len(jobs)
+
+    async def _requeue(self, jobs: list[SessionJob], error: Exception) -> None:
+        for job in jobs:
+            job.status = SessionJobStatus.QUEUED
+            job.session = None
+            job.error = str(error) or type(error).__name__
+            await self._redis_service.requeue_session_job(job, self._lease.owner)
+        SESSIONS_SWEPT.labels("requeued").inc(len(jobs))
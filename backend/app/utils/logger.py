@@ -1,38 +1,121 @@
+import atexit
+import itertools
 import logging
-from logging import Logger, StreamHandler
-
-from logtail import LogtailHandler
+import queue
+from logging import Handler, Logger, LogRecord, StreamHandler
+from logging.handlers import QueueHandler, QueueListener
 
 from app.config.settings import settings
+from app.utils.metrics import LOG_RECORDS_DROPPED
 
+_listener: QueueListener | None = None
 
-def setup_logging() -> None:
-    handler: StreamHandler = StreamHandler()
-    handler.setFormatter(
-        logging.Formatter(
-            fmt="%(asctime)s | %(levelname)-8s| %(name)s:%(funcName)s:%(lineno)s - %(message)s",
-            datefmt="%d-%M-%Y %I:%M:%S %p",
-        )
-    )
-    root: Logger = logging.getLogger()
-    root.setLevel(logging.DEBUG if settings.DEBUG else logging.INFO)
-    root.handlers.clear()
+
+class BoundedQueueHandler(QueueHandler):
+    """
+    This class hands log records to a bounded queue without blocking.
+
+    Records are queued as they are, so merging the message with its arguments
+    and formatting happen on the listener thread instead of the request path.
+    This means arguments must not be mutated after the logging call.
+
+    Once the queue is filled past ``LOG_SAMPLE_THRESHOLD``, only one in
+    ``LOG_SAMPLE_RATE`` records below WARNING is kept, and a full queue drops
+    new records. Both are counted in ``LOG_RECORDS_DROPPED``.
+    """
+
+    def __init__(self, log_queue: "queue.Queue[LogRecord]") -> None:
+        super().__init__(log_queue)
+        self._log_queue = log_queue
+        self._high_water = int(log_queue.maxsize * settings.LOG_SAMPLE_THRESHOLD)
+        self._sampled = itertools.count()
+
+    def prepare(self, record: LogRecord) -> LogRecord:
+        return record
+
+    def enqueue(self, record: LogRecord) -> None:
+        if (
+            record.levelno < logging.WARNING
+            and self._log_queue.qsize() >= self._high_water
+            and next(self._sampled) % settings.LOG_SAMPLE_RATE
+        ):
+            LOG_RECORDS_DROPPED.labels("sampled").inc()
+            return
+        try:
+            self._log_queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.labels("full").inc()
+
+
+class _BlockingSentinelListener(QueueListener):
+    # the stop sentinel has to wait for room instead of failing on a full queue
+    def enqueue_sentinel(self) -> None:
+        self.queue.put(self._sentinel)
+
+
+def _create_sink() -> Handler:
     if settings.DEBUG:
-        root.addHandler(handler)
+        handler: StreamHandler = StreamHandler()
+        handler.setFormatter(
+            logging.Formatter(
+                fmt="%(asctime)s | %(levelname)-8s| %(name)s:%(funcName)s:%(lineno)s - %(message)s",
+                datefmt="%d-%M-%Y %I:%M:%S %p",
+            )
+        )
+        return handler
+
+    # integrate betterstack, the handler batches the uploads on its own thread
+    from logtail import LogtailHandler  # noqa: PLC0415
 
-    # integrate betterstack
-    logtail_handler: LogtailHandler = LogtailHandler(
+    return LogtailHandler(
         source_token=settings.BETTER_STACK_SOURCE_TOKEN,
         host=settings.BETTER_STACK_INGESTING_HOST,
     )
-    if not settings.DEBUG:
-        root.addHandler(logtail_handler)
 
-    # clear handlers of uvicorn
-    for lg in ["uvicorn", "uvicorn.access", "watchfiles"]:
+
+def _stop_listener() -> None:
+    global _listener  # noqa: PLW0603
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def setup_logging() -> None:
+    """
+    Route the app and uvicorn logs through one queue to the configured sink.
+
+    The sink, a stream handler in debug mode and BetterStack otherwise, runs
+    on a ``QueueListener`` thread, so request handlers only pay for putting a
+    record on the queue.
+
+    Calling it again, e.g. from the lifespan of a restarted app in the same
+    process, replaces the listener: the previous one is stopped once the new
+    handlers are in place, flushing the records it still holds.
+    """
+    global _listener  # noqa: PLW0603
+    previous = _listener
+
+    log_queue: queue.Queue[LogRecord] = queue.Queue(maxsize=settings.LOG_QUEUE_SIZE)
+    queue_handler = BoundedQueueHandler(log_queue)
+    _listener = _BlockingSentinelListener(
+        log_queue, _create_sink(), respect_handler_level=True
+    )
+    _listener.start()
+    # registering again would stop the listener once per call at exit
+    atexit.unregister(_stop_listener)
+    atexit.register(_stop_listener)
+
+    root: Logger = logging.getLogger()
+    root.setLevel(logging.DEBUG if settings.DEBUG else logging.INFO)
+    root.handlers.clear()
+    root.addHandler(queue_handler)
+
+    # replace the handlers of uvicorn, access logs included
+    for lg in ["uvicorn", "uvicorn.error", "uvicorn.access", "watchfiles"]:
         uvicorn_logger: Logger = logging.getLogger(lg)
         uvicorn_logger.handlers.clear()
-        if settings.DEBUG:
-            uvicorn_logger.addHandler(handler)
-        else:
-            uvicorn_logger.addHandler(logtail_handler)
+        uvicorn_logger.addHandler(queue_handler)
+        uvicorn_logger.propagate = False
+
+    if previous is not None:
+        previous.stop()
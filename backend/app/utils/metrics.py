@@ -0,0 +1,341 @@
+import asyncio
+import functools
+import inspect
+import os
+import time
+from collections.abc import Awaitable, Callable
+from types import TracebackType
+from typing import ParamSpec, TypeVar
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from typing_extensions import Self
+
+from app.config.settings import settings
+
+P = ParamSpec("P")
+R = TypeVar("R")
+
+# latency buckets in seconds, fine grained at the low end where redis and the
+# token cache live and stretching out to the gemini timeout
+_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+)
+
+REQUEST_DURATION = Histogram(
+    "manas_http_request_duration_seconds",
+    "Time until the last byte of the response was sent, per route.",
+    ["method", "route", "status"],
+    buckets=_BUCKETS,
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "manas_http_requests_in_flight",
+    "Requests currently being handled.",
+    multiprocess_mode="livesum",
+)
+OPERATION_DURATION = Histogram(
+    "manas_operation_duration_seconds",
+    "Time spent in an instrumented operation.",
+    ["component", "operation", "outcome"],
+    buckets=_BUCKETS,
+)
+BACKGROUND_TASKS = Gauge(
+    "manas_background_tasks_in_flight",
+    "Background tasks currently running.",
+    ["task"],
+    multiprocess_mode="livesum",
+)
+GEMINI_DURATION = Histogram(
+    "manas_gemini_request_duration_seconds",
+    "Gemini request latency per model.",
+    ["model", "call"],
+    buckets=_BUCKETS,
+)
+GEMINI_FIRST_CHUNK = Histogram(
+    "manas_gemini_first_chunk_seconds",
+    "Time until the first chunk of a streamed gemini response.",
+    ["model"],
+    buckets=_BUCKETS,
+)
+GEMINI_TOKENS = Counter(
+    "manas_gemini_tokens_total",
+    "Tokens used by gemini requests.",
+    ["model", "kind"],
+)
+GEMINI_OUTPUT_PARSE = Counter(
+    "manas_gemini_output_parse_total",
+    "Gemini outputs by parse outcome: valid as is, repaired, or failed.",
+    ["analyzer", "outcome"],
+)
+GEMINI_OUTPUT_RETRIES = Counter(
+    "manas_gemini_output_retries_total",
+    "Gemini requests repeated because the output did not match the schema.",
+    ["analyzer"],
+)
+GEMINI_QUEUE_DEPTH = Gauge(
+    "manas_gemini_queue_depth",
+    "Gemini requests running or waiting for a concurrency slot.",
+    multiprocess_mode="livesum",
+)
+GEMINI_HEDGES = Counter(
+    "manas_gemini_hedged_requests_total",
+    "Gemini requests that were hedged, by which request answered first.",
+    ["analyzer", "winner"],
+)
+GEMINI_FALLBACKS = Counter(
+    "manas_gemini_fallbacks_total",
+    "Gemini requests sent to a model other than the first choice, or skipping a"
+    " model, by reason: hedge, error, error_rate or circuit_open.",
+    ["analyzer", "model", "reason"],
+)
+GEMINI_CIRCUIT_OPEN = Gauge(
+    "manas_gemini_circuit_open",
+    "Whether the circuit breaker of a gemini model is open.",
+    ["model"],
+    multiprocess_mode="max",
+)
+GEMINI_CALLS_SAVED = Counter(
+    "manas_gemini_calls_saved_total",
+    "Messages answered by a coalesced gemini request instead of their own.",
+)
+DUPLICATE_REQUESTS = Counter(
+    "manas_duplicate_requests_total",
+    "Duplicate /process requests answered with the result of the first one"
+    " instead of calling gemini, by whether it was in_flight or completed.",
+    ["state"],
+)
+ADMISSION_REJECTED = Counter(
+    "manas_admission_rejected_total",
+    "Requests turned away before calling gemini, by reason: user_rate,"
+    " global_rate or overload.",
+    ["reason"],
+)
+AUTH_TOKEN_CACHE = Counter(
+    "manas_auth_token_cache_total",
+    "Lookups in the verified ID token cache.",
+    ["result"],
+)
+PROFILE_CACHE = Counter(
+    "manas_profile_cache_total",
+    "Lookups in the profile cache, by the tier that answered them.",
+    ["result"],
+)
+LOG_RECORDS_DROPPED = Counter(
+    "manas_log_records_dropped_total",
+    "Log records dropped by the log queue, sampled under load or because it was full.",
+    ["reason"],
+)
+ACTIVE_SESSIONS = Gauge(
+    "manas_active_sessions",
+    "Users with a chat session in redis written to within the session TTL.",
+    multiprocess_mode="mostrecent",
+)
+SESSION_BYTES = Gauge(
+    "manas_session_bytes",
+    "Redis memory per active session, over the most recently active ones.",
+    ["stat"],
+    multiprocess_mode="mostrecent",
+)
+SESSIONS_SWEPT = Counter(
+    "manas_sessions_swept_total",
+    "Idle sessions closed by the sweeper, stored or handed back to the job queue.",
+    ["outcome"],
+)
+EVENT_LOOP_STALLS = Counter(
+    "manas_event_loop_stalls_total",
+    "Times the event loop was blocked past the stall watchdog threshold.",
+    ["route"],
+)
+EVENT_LOOP_LAG = Histogram(
+    "manas_event_loop_lag_seconds",
+    "How late the event loop woke up a sleeping task.",
+    buckets=_BUCKETS,
+)
+
+
+class timed:  # noqa: N801
+    """
+    Record the duration of a block or function in ``OPERATION_DURATION``.
+
+    Works as a context manager and as a decorator for sync and async
+    functions, so a code path is instrumented in one line, either by
+    decorating it with ``@timed("redis", "get_context")`` or by wrapping the
+    block in ``with timed("firestore", "list_sessions"):``.
+
+    The ``outcome`` label is ``error`` if the block raised, ``ok`` otherwise.
+    """
+
+    def __init__(self, component: str, operation: str) -> None:
+        self.component = component
+        self.operation = operation
+        self._start = 0.0
+
+    def _observe(self, start: float, *, failed: bool) -> None:
+        OPERATION_DURATION.labels(
+            self.component, self.operation, "error" if failed else "ok"
+        ).observe(time.perf_counter() - start)
+
+    def __enter__(self) -> Self:
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        self._observe(self._start, failed=exc_type is not None)
+
+    def __call__(self, func: Callable[P, R]) -> Callable[P, R]:
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def _async_wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
+                start = time.perf_counter()
+                try:
+                    result = await func(*args, **kwargs)
+                except BaseException:
+                    self._observe(start, failed=True)
+                    raise
+                self._observe(start, failed=False)
+                return result
+
+            return _async_wrapper  # pyright: ignore[reportReturnType]
+
+        @functools.wraps(func)
+        def _wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
+            start = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+            except BaseException:
+                self._observe(start, failed=True)
+                raise
+            self._observe(start, failed=False)
+            return result
+
+        return _wrapper
+
+
+def background(task: str, func: Callable[P, Awaitable[R]]) -> Callable[P, Awaitable[R]]:
+    """
+    Wrap a coroutine function queued as a background task so it is counted in
+    ``BACKGROUND_TASKS`` and timed under the ``background`` component.
+    """
+
+    @functools.wraps(func)
+    async def _wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
+        with (
+            BACKGROUND_TASKS.labels(task).track_inprogress(),
+            timed("background", task),
+        ):
+            return await func(*args, **kwargs)
+
+    return _wrapper
+
+
+async def monitor_event_loop_lag() -> None:
+    """
+    Measure how late the event loop wakes up from a short sleep.
+
+    Anything blocking the loop, e.g. a sync call in an async handler, shows up
+    as lag. Meant to run as a background task for the lifetime of the app.
+    """
+    interval = settings.METRICS_LOOP_LAG_INTERVAL
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG.observe(max(loop.time() - start - interval, 0.0))
+
+
+def render_metrics() -> tuple[bytes, str]:
+    """
+    Render all metrics in the prometheus text format.
+
+    When ``PROMETHEUS_MULTIPROC_DIR`` is set the metrics of every worker
+    process are aggregated, otherwise only this process is reported.
+
+    Returns:
+        tuple: The encoded metrics and their content type.
+    """
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording per route latency and the in-flight request count.
+
+    The route label is the path template of the matched route, e.g.
+    ``/api/v1/end-session/{job_id}``, so label cardinality stays bounded.
+    Latency is measured until the last body chunk is sent, background tasks
+    that run after the response are not included.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+        observed = False
+
+        def _observe() -> None:
+            nonlocal observed
+            if observed:
+                return
+            observed = True
+            route = scope.get("route")
+            REQUEST_DURATION.labels(
+                scope["method"],
+                getattr(route, "path", "unmatched"),
+                str(status),
+            ).observe(time.perf_counter() - start)
+
+        async def _send(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get(
+                "more_body", False
+            ):
+                _observe()
+
+        REQUESTS_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            REQUESTS_IN_FLIGHT.dec()
+            _observe()
@@ -0,0 +1,191 @@
+from collections import Counter, defaultdict
+from collections.abc import Iterable
+from datetime import date, timedelta
+from typing import TYPE_CHECKING, Any
+
+from app.models.enums import MoodStatsPeriod, MoodStatsRange
+
+if TYPE_CHECKING:
+    from google.cloud.firestore import (
+        AsyncClient,
+        AsyncCollectionReference,
+        AsyncWriteBatch,
+    )
+
+# per user, next to the sessions: one document per day and per week with the
+# number of sessions of each mood, and one with the days that had a session
+STATS_COLLECTION = "mood_stats"
+ACTIVE_DAYS = "active-days"
+
+# the period and the number of buckets each range is made of
+RANGES: dict[MoodStatsRange, tuple[MoodStatsPeriod, int]] = {
+    MoodStatsRange.WEEK: (MoodStatsPeriod.DAY, 7),
+    MoodStatsRange.MONTH: (MoodStatsPeriod.DAY, 30),
+    MoodStatsRange.QUARTER: (MoodStatsPeriod.WEEK, 13),
+    MoodStatsRange.YEAR: (MoodStatsPeriod.WEEK, 52),
+}
+
+
+def stats_collection(
+    firestore_db: "AsyncClient", uid: str
+) -> "AsyncCollectionReference":
+    return firestore_db.collection("users").document(uid).collection(STATS_COLLECTION)
+
+
+def period_start(day: date, period: MoodStatsPeriod) -> date:
+    """
+    The first day of the period ``day`` is in, weeks start on Monday.
+    """
+    if period is MoodStatsPeriod.WEEK:
+        return day - timedelta(days=day.weekday())
+    return day
+
+
+def bucket_id(period: MoodStatsPeriod, start: date) -> str:
+    return f"{period.value}-{start.isoformat()}"
+
+
+def _session_day(session: dict[str, Any]) -> date:
+    # the calendar date created_at was stored with, which is what firestore
+    # returns it as, in UTC
+    return session["created_at"].date()
+
+
+def _session_counts(
+    previous: dict[str, Any] | None, session: dict[str, Any]
+) -> dict[str, Counter[str]]:
+    """
+    How storing ``session`` over the ``previous`` document of the same session
+    changes the counts of each bucket.
+    """
+    changes: dict[str, Counter[str]] = defaultdict(Counter)
+    for document, sign in ((previous, -1), (session, 1)):
+        if document is None:
+            continue
+        day = _session_day(document)
+        for period in MoodStatsPeriod:
+            bucket = bucket_id(period, period_start(day, period))
+            changes[bucket][document["mood"]] += sign
+    return changes
+
+
+def add_stats_writes(
+    transaction: "AsyncWriteBatch",
+    firestore_db: "AsyncClient",
+    sessions: list[tuple[str, dict[str, Any] | None, dict[str, Any]]],
+) -> None:
+    """
+    Add the writes that count sessions into the mood statistics of their users
+    to the transaction that stores them.
+
+    The counts are increments, so the transaction doesn't have to read the
+    buckets and concurrent transactions of the same user don't conflict. A
+    session that replaces an earlier document of itself, e.g. when a job is
+    retried after its transaction was committed, takes the earlier mood out of
+    the counts. A stored session keeps its ``created_at``, so it never moves to
+    another day.
+
+    Args:
+        transaction: The transaction the sessions are stored in.
+        firestore_db: The Firestore client.
+        sessions: The user, the stored document of the session if there is one,
+            and the document the session is stored as, for each session.
+    """
+    from google.cloud.firestore import ArrayUnion, Increment  # noqa: PLC0415
+
+    changes: dict[str, dict[str, Counter[str]]] = defaultdict(
+        lambda: defaultdict(Counter)
+    )
+    days: dict[str, set[str]] = defaultdict(set)
+    for uid, previous, session in sessions:
+        for bucket, counts in _session_counts(previous, session).items():
+            changes[uid][bucket].update(counts)
+        days[uid].add(_session_day(session).isoformat())
+
+    for uid, buckets in changes.items():
+        stats = stats_collection(firestore_db, uid)
+        for bucket, counts in buckets.items():
+            if not any(counts.values()):
+                # stored again with the same mood
+                continue
+            period, start = bucket.split("-", 1)
+            increments = {mood: Increment(count) for mood, count in counts.items()}
+            transaction.set(
+                stats.document(bucket),
+                {"period": period, "start": start, "counts": increments},
+                merge=True,
+            )
+        transaction.set(
+            stats.document(ACTIVE_DAYS),
+            {"days": ArrayUnion(sorted(days[uid]))},
+            merge=True,
+        )
+
+
+def streaks(days: Iterable[str], today: date) -> tuple[int, int]:
+    """
+    The current and the longest run of consecutive days with a session.
+
+    The current streak still counts on a day without a session so far, as
+    long as there was one yesterday.
+
+    Returns:
+        tuple[int, int]: The current and the longest streak, in days.
+    """
+    longest = run = 0
+    last: date | None = None
+    for day in sorted({date.fromisoformat(day) for day in days}):
+        run = run + 1 if last is not None and day - last == timedelta(days=1) else 1
+        longest = max(longest, run)
+        last = day
+    current = run if last is not None and (today - last).days <= 1 else 0
+    return current, longest
+
+
+def aggregate_sessions(sessions: Iterable[dict[str, Any]]) -> dict[str, dict]:
+    """
+    Compute the statistics documents of a user from all of their sessions, the
+    way the incremental writes of :func:`add_stats_writes` should add up to.
+
+    Sessions without a mood or a creation time are left out.
+
+    Returns:
+        dict[str, dict]: The documents of the statistics collection, by id.
+    """
+    buckets: dict[str, Counter[str]] = defaultdict(Counter)
+    days: set[str] = set()
+    for session in sessions:
+        if not session.get("mood") or not session.get("created_at"):
+            continue
+        for bucket, counts in _session_counts(None, session).items():
+            buckets[bucket].update(counts)
+        days.add(_session_day(session).isoformat())
+
+    documents: dict[str, dict] = {}
+    for bucket, counts in buckets.items():
+        period, start = bucket.split("-", 1)
+        documents[bucket] = {"period": period, "start": start, "counts": dict(counts)}
+    if days:
+        documents[ACTIVE_DAYS] = {"days": sorted(days)}
+    return documents
+
+
+def normalize_stats(documents: dict[str, dict]) -> dict[str, dict]:
+    """
+    Stored statistics documents in the form :func:`aggregate_sessions` returns,
+    without counts that went back to zero and with the days in order.
+    """
+    normalized: dict[str, dict] = {}
+    for document_id, document in documents.items():
+        if document_id == ACTIVE_DAYS:
+            if document.get("days"):
+                normalized[document_id] = {"days": sorted(set(document["days"]))}
+            continue
+        counts = {mood: n for mood, n in document.get("counts", {}).items() if n}
+        if counts:
+            normalized[document_id] = {
+                "period": document.get("period"),
+                "start": document.get("start"),
+                "counts": counts,
+            }
+    return normalized
@@ -0,0 +1,302 @@
+import asyncio
+import contextlib
+import hmac
+import logging
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime
+from pathlib import Path
+from types import FrameType
+from typing import Any
+from urllib.parse import parse_qs
+from uuid import uuid4
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.config.settings import settings
+from app.utils.metrics import EVENT_LOOP_STALLS
+
+logger = logging.getLogger(__name__)
+
+# the request each task is serving, for naming what the loop was busy with
+_task_scopes: dict[asyncio.Task, Scope] = {}
+
+_PATH_PREFIXES = sorted(
+    {str(Path(path).resolve()) for path in sys.path if path}, key=len, reverse=True
+)
+
+
+def _frame_name(frame: FrameType) -> str:
+    code = frame.f_code
+    filename = code.co_filename
+    for prefix in _PATH_PREFIXES:
+        if filename.startswith(prefix):
+            filename = filename[len(prefix) :].lstrip("/")
+            break
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})"
+
+
+# the frames of asyncio that run the loop, not all of them show up in a stack
+_LOOP_FRAMES = {
+    ("events.py", "_run"),
+    ("base_events.py", "_run_once"),
+    ("base_events.py", "run_forever"),
+    ("base_events.py", "run_until_complete"),
+    ("runners.py", "run"),
+}
+
+
+def _runs_loop(frame: FrameType) -> bool:
+    path = Path(frame.f_code.co_filename)
+    return path.parent.name == "asyncio" and (path.name, frame.f_code.co_name) in (
+        _LOOP_FRAMES
+    )
+
+
+def _stack(frame: FrameType | None) -> list[str]:
+    """
+    The frames of a stack, outermost first, starting at the callback the
+    event loop is running so the loop's own frames are left out.
+    """
+    frames: list[FrameType] = []
+    while frame is not None and not _runs_loop(frame):
+        frames.append(frame)
+        frame = frame.f_back
+    return [_frame_name(frame) for frame in reversed(frames)]
+
+
+def _describe(task: asyncio.Task | None) -> str:
+    if task is None:
+        return "(no task)"
+    scope = _task_scopes.get(task)
+    if scope is None:
+        return f"task {task.get_name()}"
+    return getattr(scope.get("route"), "path", scope["path"])
+
+
+class StallWatchdog:
+    """
+    This class records every time the event loop was blocked for longer than
+    ``STALL_WATCHDOG_THRESHOLD`` seconds.
+
+    A task on the loop bumps a heartbeat, and a thread checks it. Once the
+    heartbeat is late, the thread takes the stack of the loop thread and the
+    route of the request that was running, so the record points at the
+    blocking call while it is still blocking. The stall is logged and counted
+    in ``manas_event_loop_stalls_total`` once the loop is back, the most
+    recent ones are kept in :attr:`stalls`.
+    """
+
+    def __init__(self) -> None:
+        self.threshold = settings.STALL_WATCHDOG_THRESHOLD
+        self.stalls: deque[dict[str, Any]] = deque(
+            maxlen=settings.STALL_WATCHDOG_HISTORY
+        )
+        self._interval = self.threshold / 2
+        self._beat = time.monotonic()
+        self._stopped = threading.Event()
+        self._heartbeat_task: asyncio.Task | None = None
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        loop = asyncio.get_running_loop()
+        self._beat = time.monotonic()
+        self._heartbeat_task = asyncio.create_task(
+            self._heartbeat(), name="stall-watchdog"
+        )
+        self._thread = threading.Thread(
+            target=self._watch,
+            args=(loop, threading.get_ident()),
+            name="stall-watchdog",
+            daemon=True,
+        )
+        self._thread.start()
+        logger.info("event loop stall watchdog started")
+
+    async def stop(self) -> None:
+        self._stopped.set()
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._heartbeat_task
+        if self._thread is not None:
+            await asyncio.to_thread(self._thread.join)
+
+    async def _heartbeat(self) -> None:
+        while True:
+            self._beat = time.monotonic()
+            await asyncio.sleep(self._interval)
+
+    def _watch(self, loop: asyncio.AbstractEventLoop, loop_thread: int) -> None:
+        stall: dict[str, Any] | None = None
+        while not self._stopped.wait(self._interval):
+            beat = self._beat
+            # the heartbeat is expected every interval
+            late = time.monotonic() - beat - self._interval
+            if stall is not None and (late < self.threshold or stall["beat"] != beat):
+                self._record(stall)
+                stall = None
+            if late < self.threshold:
+                continue
+            if stall is None:
+                stall = {
+                    "beat": beat,
+                    "route": _describe(asyncio.current_task(loop)),
+                    "stack": _stack(sys._current_frames().get(loop_thread)),  # noqa: SLF001
+                    "at": datetime.now().isoformat(timespec="milliseconds"),
+                }
+            stall["seconds"] = round(late, 3)
+
+    def _record(self, stall: dict[str, Any]) -> None:
+        del stall["beat"]
+        self.stalls.append(stall)
+        EVENT_LOOP_STALLS.labels(stall["route"]).inc()
+        logger.warning(
+            "event loop stalled for at least %.0f ms in %s\n%s",
+            stall["seconds"] * 1000,
+            stall["route"],
+            "\n".join(f"  {frame}" for frame in stall["stack"]),
+            extra={"stall_ms": stall["seconds"] * 1000, "route": stall["route"]},
+        )
+
+
+class RequestProfiler:
+    """
+    This class samples what the event loop runs every ``PROFILER_INTERVAL``
+    seconds from a thread, while one request is being served.
+
+    Samples are aggregated in the collapsed stack format flame graph tools
+    read, e.g. ``flamegraph.pl`` or speedscope, one line per distinct stack
+    with its number of samples. Stacks are rooted at ``request`` when the
+    loop was running the profiled request, at the route or task name when it
+    was running something else, e.g. the job worker summarizing the session
+    ``/end-session`` queued, and at ``(idle)`` when it was waiting.
+    """
+
+    def __init__(self, task: asyncio.Task) -> None:
+        self._task = task
+        self._loop = task.get_loop()
+        self._loop_thread = threading.get_ident()
+        self._samples: Counter[str] = Counter()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(
+            target=self._sample, name="request-profiler", daemon=True
+        )
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> Counter[str]:
+        self._stopped.set()
+        self._thread.join()
+        return self._samples
+
+    def _sample(self) -> None:
+        while not self._stopped.wait(settings.PROFILER_INTERVAL):
+            task = asyncio.current_task(self._loop)
+            frame = sys._current_frames().get(self._loop_thread)  # noqa: SLF001
+            if task is None:
+                root = "(idle)"
+            elif task is self._task:
+                root = "request"
+            else:
+                root = _describe(task)
+            stack = _stack(frame) if task is not None else []
+            self._samples[";".join([root, *stack])] += 1
+
+
+def _write_profile(path: Path, samples: Counter[str]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(
+        "".join(f"{stack} {count}\n" for stack, count in samples.most_common())
+    )
+
+
+class InstrumentationMiddleware:
+    """
+    ASGI middleware for the debugging aids, only added to the app when
+    ``STALL_WATCHDOG_ENABLED`` or ``PROFILER_ENABLED`` is set.
+
+    It keeps track of the request each task serves, for the stall watchdog,
+    and profiles requests to ``PROFILER_ROUTES`` that ask for it with an
+    ``X-Profile`` header or a ``profile`` query parameter, set to
+    ``PROFILER_KEY`` if one is configured. The profile is written to
+    ``PROFILER_OUTPUT_DIR`` and its path returned in the ``X-Profile-Output``
+    response header.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+        self._routes = {
+            f"{settings.API_V1_STR}{route}" for route in settings.PROFILER_ROUTES
+        }
+        self._output_dir = Path(
+            settings.PROFILER_OUTPUT_DIR
+            or Path(tempfile.gettempdir()) / "manas-profiles"
+        )
+
+    def _wants_profile(self, scope: Scope) -> bool:
+        if not settings.PROFILER_ENABLED or scope["path"] not in self._routes:
+            return False
+        flag = dict(scope["headers"]).get(b"x-profile", b"").decode()
+        if not flag:
+            flag = parse_qs(scope["query_string"].decode()).get("profile", [""])[0]
+        if not flag:
+            return False
+        return not settings.PROFILER_KEY or hmac.compare_digest(
+            flag, settings.PROFILER_KEY
+        )
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        task = asyncio.current_task()
+        if task is None:
+            await self.app(scope, receive, send)
+            return
+        _task_scopes[task] = scope
+        try:
+            if self._wants_profile(scope):
+                await self._profile(task, scope, receive, send)
+            else:
+                await self.app(scope, receive, send)
+        finally:
+            del _task_scopes[task]
+
+    async def _profile(
+        self, task: asyncio.Task, scope: Scope, receive: Receive, send: Send
+    ) -> None:
+
+        name = scope["path"].removeprefix(settings.API_V1_STR).strip("/")
+        path = self._output_dir / (
+            f"{name.replace('/', '-')}-{datetime.now():%Y%m%dT%H%M%S}-"
+            f"{uuid4().hex[:8]}.folded"
+        )
+
+        async def _send(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                message["headers"] = [
+                    *message.get("headers", []),
+                    (b"x-profile-output", str(path).encode()),
+                ]
+            await send(message)
+
+        profiler = RequestProfiler(task)
+        profiler.start()
+        try:
+            # background tasks run before this returns, they are profiled too
+            await self.app(scope, receive, _send)
+        finally:
+            samples = profiler.stop()
+            await asyncio.to_thread(_write_profile, path, samples)
+            logger.info(
+                "profiled %s with %d samples into %s",
+                scope["path"],
+                samples.total(),
+                path,
+            )
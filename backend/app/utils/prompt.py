@@ -0,0 +1,85 @@
+import json
+from itertools import groupby
+
+from app.models.chat import ConversationMessage, MoodAnalysisResult
+from app.models.session import SessionSummary
+from app.utils.context import estimate_tokens
+
+NO_HISTORY = "No previous messages."
+
+
+def _turn(message: ConversationMessage) -> dict:
+    return {
+        "message": message.message,
+        "reply": message.reply,
+        "timestamp": message.timestamp.isoformat(timespec="seconds"),
+    }
+
+
+def encode_conversation(history: list[ConversationMessage]) -> str:
+    """
+    Encode the conversation as a single compact JSON array, one object with
+    ``message``, ``reply`` and ``timestamp`` per turn.
+    """
+    if not history:
+        return NO_HISTORY
+    return json.dumps(
+        [_turn(message) for message in history],
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+
+
+def encode_mood_arc(moods: list[MoodAnalysisResult]) -> str:
+    """
+    Encode the moods of consecutive turns as runs, one line per run.
+
+    Each line reads ``turns <first>-<last>: <mood> (<confidence>%)`` with the
+    average confidence of the run, or ``turn <n>: ...`` for a single turn.
+    The replies are left out, they are part of the conversation already.
+    """
+    lines = []
+    turn = 1
+    for mood, run in groupby(moods, key=lambda m: m.mood):
+        confidences = [m.confidence for m in run]
+        last = turn + len(confidences) - 1
+        turns = f"turn {turn}" if turn == last else f"turns {turn}-{last}"
+        confidence = round(sum(confidences) / len(confidences))
+        lines.append(f"{turns}: {mood.value} ({confidence}%)")
+        turn = last + 1
+    return "\n".join(lines) or "No moods recorded."
+
+
+def encode_parts(parts: list[tuple[int, int, SessionSummary]]) -> str:
+    """
+    Encode the summaries of consecutive parts of a session, one line per
+    part reading ``turns <first>-<last>: <mood>. <summary>``.
+    """
+    return "\n".join(
+        f"turns {first}-{last}: {part.mood.value}. {part.summary}"
+        for first, last, part in parts
+    )
+
+
+def chunk_turns(
+    history: list[ConversationMessage], token_budget: int
+) -> list[tuple[int, int]]:
+    """
+    Split the conversation into consecutive chunks whose encoding fits
+    ``token_budget`` estimated tokens, a turn larger than the budget getting
+    a chunk of its own.
+
+    Returns:
+        list: The ``(start, end)`` slice bounds of each chunk.
+    """
+    chunks = []
+    start, used = 0, 0
+    for i, message in enumerate(history):
+        cost = estimate_tokens(json.dumps(_turn(message), ensure_ascii=False))
+        if i > start and used + cost > token_budget:
+            chunks.append((start, i))
+            start, used = i, 0
+        used += cost
+    if start < len(history):
+        chunks.append((start, len(history)))
+    return chunks
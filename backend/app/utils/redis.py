@@ -1,63 +1,911 @@
+import asyncio
 import logging
-from collections.abc import Awaitable
+import time
 
 from fastapi import Request
-from redis import Redis
+from redis.asyncio import BlockingConnectionPool, ConnectionPool, Redis
+from redis.asyncio.client import PubSub
+from redis.exceptions import ResponseError
 
 from app.config.settings import settings
-from app.models.chat import ConversationMessage, MoodAnalysisResult
+from app.models.chat import (
+    ChatInput,
+    ContextSummary,
+    ConversationMessage,
+    MoodAnalysisResult,
+    PublishedResult,
+)
+from app.models.session import SessionJob
+from app.utils.codec import decode_messages, decode_moods, decode_turns, get_codec
+from app.utils.context import ContextWindow
+from app.utils.metrics import ACTIVE_SESSIONS, SESSION_BYTES, timed
 
 logger = logging.getLogger(__name__)
 
+SESSION_JOB_QUEUE = "session_jobs:queue"
+SESSION_JOB_LEASES = "session_jobs:leases"
+SESSION_ACTIVITY = "sessions:last_activity"
+GLOBAL_RATE_LIMIT = "rate_limit:global"
+RESULTS_CHANNEL = "process:results"
+COALESCE_RESULT_TTL = 60
+
+# appends a turn, caps the session and slides its expiry in one atomic step.
+# The lists of the legacy layout, kept from before sessions were a single list,
+# get the same expiry so they are not left behind. Returns the turn the new one
+# pushed out of the context window, if any, whether it is in the legacy layout
+# and the current context summary.
+_ADD_TURN = """
+redis.call('RPUSH', KEYS[1], ARGV[1])
+local left = false
+local legacy = 0
+local window = tonumber(ARGV[6])
+if window > 0 then
+    local offset = redis.call('LLEN', KEYS[1]) - window - 1
+    if offset >= 0 then
+        left = redis.call('LINDEX', KEYS[1], offset)
+    else
+        left = redis.call('LINDEX', KEYS[3], offset)
+        legacy = 1
+    end
+end
+redis.call('LTRIM', KEYS[1], -tonumber(ARGV[3]), -1)
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+redis.call('EXPIRE', KEYS[2], ARGV[2])
+redis.call('EXPIRE', KEYS[3], ARGV[2])
+redis.call('EXPIRE', KEYS[4], ARGV[2])
+redis.call('ZADD', KEYS[5], ARGV[4], ARGV[5])
+return {left, legacy, redis.call('GET', KEYS[2]) or ''}
+"""
+
+# replaces the context summary if it is still the one the new summary was
+# folded from. Returns nothing if it was replaced, otherwise the current one.
+_SET_CONTEXT_SUMMARY = """
+local current = redis.call('GET', KEYS[1]) or ''
+if current ~= ARGV[1] then
+    return current
+end
+redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+return false
+"""
+
+# takes a token from the user's and the global bucket, refilling both for the
+# time since they were last used, or neither if either is empty. Returns the
+# empty bucket and the milliseconds until it has a token again.
+_RATE_LIMIT = """
+local now = tonumber(ARGV[1])
+local buckets = {}
+for i = 1, 2 do
+    local rate = tonumber(ARGV[i * 2])
+    local burst = tonumber(ARGV[i * 2 + 1])
+    local state = redis.call('HMGET', KEYS[i], 'tokens', 'ts')
+    local tokens = tonumber(state[1]) or burst
+    local ts = tonumber(state[2]) or now
+    tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+    if tokens < 1 then
+        return {i, math.ceil((1 - tokens) / rate * 1000)}
+    end
+    buckets[i] = {tokens, rate, burst}
+end
+for i = 1, 2 do
+    local tokens, rate, burst = unpack(buckets[i])
+    redis.call('HSET', KEYS[i], 'tokens', tostring(tokens - 1), 'ts', ARGV[1])
+    redis.call('EXPIRE', KEYS[i], math.ceil(burst / rate) + 1)
+end
+return {0, 0}
+"""
+
+# adds a message to the user's open batch of coalesced messages, opening one
+# led by the caller if there is none, and pushes the batch deadline out to the
+# end of the debounce window, capped at the max wait and cut short once the
+# batch is full
+_JOIN_COALESCED_BATCH = """
+local batch = redis.call('HGET', KEYS[1], 'batch')
+local leader = 0
+local now = tonumber(ARGV[2])
+local started = now
+if batch then
+    started = tonumber(redis.call('HGET', KEYS[1], 'started'))
+else
+    batch = ARGV[1]
+    leader = 1
+    redis.call('HSET', KEYS[1], 'batch', batch, 'started', ARGV[2])
+end
+local count = redis.call('RPUSH', KEYS[2], ARGV[6])
+local deadline = math.min(now + tonumber(ARGV[3]), started + tonumber(ARGV[4]))
+if count >= tonumber(ARGV[5]) then
+    deadline = now
+end
+redis.call('HSET', KEYS[1], 'deadline', tostring(deadline))
+if leader == 1 then
+    redis.call('EXPIRE', KEYS[1], ARGV[7])
+    redis.call('EXPIRE', KEYS[2], ARGV[7])
+end
+return {batch, leader}
+"""
+
+# claims an idempotency key for the caller unless a request with the same key
+# already has it. Returns nothing if the key was claimed, otherwise the stored
+# result of the request holding it, empty while it is running.
+_CLAIM_IDEMPOTENCY_KEY = """
+local current = redis.call('GET', KEYS[1])
+if current then
+    return current
+end
+redis.call('SET', KEYS[1], '', 'EX', ARGV[1])
+return false
+"""
+
+# extends the claim on an idempotency key while its request runs, unless the
+# request already completed and stored its result
+_REFRESH_IDEMPOTENCY_CLAIM = """
+if redis.call('GET', KEYS[1]) == '' then
+    return redis.call('EXPIRE', KEYS[1], ARGV[1])
+end
+return 0
+"""
+
+# moves the live session under the job's keys and queues the job in one step,
+# so messages that arrive afterwards start a fresh session. With a cutoff, the
+# session is only moved if it has been idle since then.
+_ENQUEUE_SESSION_JOB = """
+if ARGV[4] then
+    local active = redis.call('ZSCORE', KEYS[9], ARGV[3])
+    if not active or tonumber(active) > tonumber(ARGV[4]) then
+        return 0
+    end
+end
+redis.call('ZREM', KEYS[9], ARGV[3])
+local found = 0
+for i = 1, 3 do
+    if redis.call('EXISTS', KEYS[i]) == 1 then
+        redis.call('RENAME', KEYS[i], KEYS[i + 4])
+        -- the snapshot lives as long as the job, not the session it came from
+        redis.call('PERSIST', KEYS[i + 4])
+        found = 1
+    end
+end
+redis.call('DEL', KEYS[4])
+if found == 0 then
+    return 0
+end
+redis.call('SET', KEYS[8], ARGV[1])
+redis.call('RPUSH', KEYS[10], ARGV[2])
+return 1
+"""
+
+# puts the jobs a process was running back on the queue if its lease expired,
+# or unconditionally when it releases them, and drops the lease. A process that
+# renewed its lease in the meantime keeps its jobs. Returns the jobs requeued.
+_RECLAIM_SESSION_JOBS = """
+local deadline = redis.call('ZSCORE', KEYS[1], ARGV[1])
+if ARGV[3] ~= '1' and (not deadline or tonumber(deadline) > tonumber(ARGV[2])) then
+    return 0
+end
+local count = 0
+while redis.call('LMOVE', KEYS[2], KEYS[3], 'RIGHT', 'LEFT') do
+    count = count + 1
+end
+redis.call('ZREM', KEYS[1], ARGV[1])
+return count
+"""
+
 
 class RedisService:
-    def __init__(self) -> None:
-        self._redis_client = Redis(
-            host=settings.REDIS_HOST,
-            port=settings.REDIS_PORT,
-            db=0,
-            decode_responses=True,
-            password=settings.REDIS_PASSWORD,
-            username=settings.REDIS_USERNAME,
+    """
+    Async redis client shared by every request handled by a worker.
+
+    A single instance is created in the app lifespan and owns a bounded
+    connection pool, so requests wait for a free connection instead of opening
+    new ones under load. A ready made ``client`` can be passed instead, e.g. a
+    fake one for benchmarks; it must not decode responses.
+
+    A session is a single list of turns, each holding a message and its mood,
+    written with the ``REDIS_SESSION_CODEC`` codec and readable whatever codec
+    wrote it. The list is capped at ``SESSION_MAX_TURNS`` turns and expires
+    ``SESSION_TTL`` seconds after the last message. Sessions stored in the
+    legacy layout, with separate message and mood lists, are still read.
+    """
+
+    def __init__(self, client: Redis | None = None) -> None:
+        connection = {
+            "host": settings.REDIS_HOST,
+            "port": settings.REDIS_PORT,
+            "db": 0,
+            "decode_responses": False,
+            "password": settings.REDIS_PASSWORD,
+            "username": settings.REDIS_USERNAME,
+        }
+        self._pool = BlockingConnectionPool(
+            **connection,
+            max_connections=settings.REDIS_MAX_CONNECTIONS,
+            timeout=settings.REDIS_POOL_TIMEOUT,
+            socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+            health_check_interval=30,
+        )
+        # pubsub connections sit idle between messages, a read timeout would
+        # drop and reconnect them, losing what is published in between
+        self._pubsub_pool = ConnectionPool(
+            **connection, socket_timeout=None, socket_keepalive=True
+        )
+        self._redis_client = client or Redis(connection_pool=self._pool)
+        self._pubsub_client = client or Redis(connection_pool=self._pubsub_pool)
+        self._codec = get_codec(settings.REDIS_SESSION_CODEC)
+        self._add_turn = self._redis_client.register_script(_ADD_TURN)
+        self._set_context_summary = self._redis_client.register_script(
+            _SET_CONTEXT_SUMMARY
+        )
+        self._rate_limit = self._redis_client.register_script(_RATE_LIMIT)
+        self._join_coalesced_batch = self._redis_client.register_script(
+            _JOIN_COALESCED_BATCH
+        )
+        self._enqueue_session_job = self._redis_client.register_script(
+            _ENQUEUE_SESSION_JOB
+        )
+        self._claim_idempotency_key = self._redis_client.register_script(
+            _CLAIM_IDEMPOTENCY_KEY
+        )
+        self._refresh_idempotency_claim = self._redis_client.register_script(
+            _REFRESH_IDEMPOTENCY_CLAIM
+        )
+        self._reclaim_session_jobs = self._redis_client.register_script(
+            _RECLAIM_SESSION_JOBS
         )
         logger.info("redis client initialized")
 
     @staticmethod
-    def get_service(request: Request) -> Redis:
+    def get_service(request: Request) -> "RedisService":
         return request.app.state.redis_service
 
-    def clear_db(self, uid: str) -> None:
-        self._redis_client.delete(
-            f"user:{uid}:chat_history", f"user:{uid}:session_moods"
-        )
+    @staticmethod
+    def _session_key(uid: str) -> str:
+        return f"user:{uid}:session"
+
+    @staticmethod
+    def _chat_history_key(uid: str) -> str:
+        return f"user:{uid}:chat_history"
+
+    @staticmethod
+    def _session_moods_key(uid: str) -> str:
+        return f"user:{uid}:session_moods"
+
+    @staticmethod
+    def _context_summary_key(uid: str) -> str:
+        return f"user:{uid}:context_summary"
+
+    @staticmethod
+    def _rate_limit_key(uid: str) -> str:
+        return f"user:{uid}:rate_limit"
+
+    @staticmethod
+    def _coalesce_key(uid: str) -> str:
+        return f"user:{uid}:coalesce"
+
+    @staticmethod
+    def _coalesce_messages_key(uid: str) -> str:
+        return f"user:{uid}:coalesce_messages"
+
+    @staticmethod
+    def _coalesce_result_key(batch_id: str) -> str:
+        return f"coalesce:{batch_id}:result"
+
+    @staticmethod
+    def _idempotency_key(key: str) -> str:
+        return f"idempotency:{key}"
+
+    @staticmethod
+    def _profile_key(uid: str) -> str:
+        return f"user:{uid}:profile"
+
+    @staticmethod
+    def _sessions_cache_key(uid: str) -> str:
+        return f"user:{uid}:sessions_cache"
+
+    @staticmethod
+    def _session_job_key(job_id: str) -> str:
+        return f"session_job:{job_id}"
+
+    @staticmethod
+    def _session_job_processing_key(owner: str) -> str:
+        return f"session_jobs:processing:{owner}"
+
+    def _session_job_data_keys(self, job_id: str) -> list[str]:
+        job_key = self._session_job_key(job_id)
+        return [
+            f"{job_key}:session",
+            f"{job_key}:chat_history",
+            f"{job_key}:session_moods",
+        ]
+
+    def _session_keys(self, uid: str) -> list[str]:
+        # the turn list first, then the lists of the legacy layout
+        return [
+            self._session_key(uid),
+            self._chat_history_key(uid),
+            self._session_moods_key(uid),
+        ]
+
+    @timed("redis", "clear_db")
+    async def clear_db(self, uid: str) -> None:
+        async with self._redis_client.pipeline(transaction=True) as pipe:
+            pipe.delete(*self._session_keys(uid), self._context_summary_key(uid))
+            pipe.zrem(SESSION_ACTIVITY, uid)
+            await pipe.execute()
         logger.info("cleared the db")
 
-    def close(self) -> None:
-        self._redis_client.close()
+    async def close(self) -> None:
+        await self._redis_client.aclose()
+        await self._pool.disconnect()
+        await self._pubsub_pool.disconnect()
         logger.info("redis client closed")
 
+    @timed("redis", "get_chat_history")
     async def get_chat_history(self, user_id: str) -> list[ConversationMessage]:
-        result: Awaitable[list] | list = self._redis_client.lrange(
-            f"user:{user_id}:chat_history", 0, -1
+        history, _ = await self.get_session(user_id)
+        return history
+
+    @timed("redis", "get_context")
+    async def get_context(
+        self, user_id: str, turns: int
+    ) -> tuple[list[ConversationMessage], ContextSummary]:
+        """
+        Fetch the last ``turns`` messages and the rolling summary of the older
+        ones in a single round trip, without reading the whole history.
+        """
+        session_key, history_key, _ = self._session_keys(user_id)
+        async with self._redis_client.pipeline(transaction=False) as pipe:
+            pipe.lrange(session_key, -turns, -1)
+            pipe.lrange(history_key, -turns, -1)
+            pipe.get(self._context_summary_key(user_id))
+            entries, legacy_history, summary = await pipe.execute()
+
+        history, _ = decode_turns(entries)
+        if legacy_history:
+            history = (decode_messages(legacy_history) + history)[-turns:]
+        return (
+            history,
+            ContextSummary.model_validate_json(summary)
+            if summary
+            else ContextSummary(),
         )
-        if isinstance(result, Awaitable):
-            result = await result
 
-        return list(map(ConversationMessage.model_validate_json, result))
+    @timed("redis", "get_session_moods")
+    async def get_session_moods(self, user_id: str) -> list[MoodAnalysisResult]:
+        _, moods = await self.get_session(user_id)
+        return moods
+
+    @timed("redis", "get_session")
+    async def get_session(
+        self, user_id: str
+    ) -> tuple[list[ConversationMessage], list[MoodAnalysisResult]]:
+        """
+        Fetch the chat history and the session moods in a single round trip.
+
+        Returns:
+            tuple: The conversation messages and the matching mood results.
+        """
+        return await self._get_session_lists(*self._session_keys(user_id))
+
+    async def _get_session_lists(
+        self, session_key: str, history_key: str, moods_key: str
+    ) -> tuple[list[ConversationMessage], list[MoodAnalysisResult]]:
+        async with self._redis_client.pipeline(transaction=False) as pipe:
+            pipe.lrange(session_key, 0, -1)
+            pipe.lrange(history_key, 0, -1)
+            pipe.lrange(moods_key, 0, -1)
+            entries, legacy_history, legacy_moods = await pipe.execute()
+
+        history, moods = decode_turns(entries)
+        if legacy_history or legacy_moods:
+            history = decode_messages(legacy_history) + history
+            moods = decode_moods(legacy_moods) + moods
+        return history, moods
 
-    async def add_chat_history(self, user_id: str, chat: ConversationMessage) -> None:
-        self._redis_client.rpush(f"user:{user_id}:chat_history", chat.model_dump_json())
-        logger.info("added chat history")
+    @timed("redis", "add_message")
+    async def add_message(
+        self,
+        user_id: str,
+        chat: ConversationMessage,
+        mood: MoodAnalysisResult,
+        context_window: ContextWindow | None = None,
+    ) -> None:
+        """
+        Append a processed message and its mood to the session as one turn.
 
-    async def add_session_moods(self, user_id: str, mood: MoodAnalysisResult) -> None:
-        self._redis_client.rpush(
-            f"user:{user_id}:session_moods", mood.model_dump_json()
+        The write is atomic and refreshes the expiry of the whole session. With
+        a ``context_window``, the turn the new one pushes out of the window is
+        folded into the rolling context summary. The summary is replaced only
+        if it did not change since it was read, and the turn is folded into
+        the newer one otherwise, so concurrent messages of the same user never
+        lose or repeat a fold.
+        """
+        session_key, history_key, moods_key = self._session_keys(user_id)
+        summary_key = self._context_summary_key(user_id)
+        left, legacy, current = await self._add_turn(
+            keys=[session_key, summary_key, history_key, moods_key, SESSION_ACTIVITY],
+            args=[
+                self._codec.encode_turn(chat, mood),
+                settings.SESSION_TTL,
+                settings.SESSION_MAX_TURNS,
+                time.time(),
+                user_id,
+                context_window.turns if context_window is not None else 0,
+            ],
+        )
+        logger.debug("added a turn to the session")
+        if context_window is None or left is None:
+            return
+
+        message = decode_messages([left])[0] if legacy else decode_turns([left])[0][0]
+        while current is not None:
+            summary = (
+                ContextSummary.model_validate_json(current)
+                if current
+                else ContextSummary()
+            )
+            current = await self._set_context_summary(
+                keys=[summary_key],
+                args=[
+                    current,
+                    context_window.fold(summary, message).model_dump_json(),
+                    settings.SESSION_TTL,
+                ],
+            )
+
+    @timed("redis", "session_stats")
+    async def session_stats(self, sample: int) -> dict[str, float]:
+        """
+        Count the active sessions and measure the memory used by the most
+        recently active ones.
+
+        Memory is taken from ``MEMORY USAGE`` where the server supports it and
+        from the size of the stored entries otherwise.
+
+        Args:
+            sample: How many of the most recently active sessions to measure.
+
+        Returns:
+            dict: The number of active sessions and the mean, p95 and max
+            bytes per sampled session.
+        """
+        async with self._redis_client.pipeline(transaction=False) as pipe:
+            pipe.zremrangebyscore(
+                SESSION_ACTIVITY, "-inf", time.time() - settings.SESSION_TTL
+            )
+            pipe.zcard(SESSION_ACTIVITY)
+            pipe.zrevrange(SESSION_ACTIVITY, 0, sample - 1)
+            _, active, uids = await pipe.execute()
+
+        sizes = [await self._session_bytes(uid.decode()) for uid in uids]
+        sizes.sort()
+        return {
+            "active_sessions": active,
+            "sampled_sessions": len(sizes),
+            "bytes_mean": sum(sizes) / len(sizes) if sizes else 0,
+            "bytes_p95": sizes[int(len(sizes) * 0.95)] if sizes else 0,
+            "bytes_max": sizes[-1] if sizes else 0,
+        }
+
+    async def _session_bytes(self, uid: str) -> int:
+        keys = [*self._session_keys(uid), self._context_summary_key(uid)]
+        try:
+            async with self._redis_client.pipeline(transaction=False) as pipe:
+                for key in keys:
+                    pipe.memory_usage(key, samples=0)
+                return sum(size or 0 for size in await pipe.execute())
+        except ResponseError:
+            async with self._redis_client.pipeline(transaction=False) as pipe:
+                for key in keys[:-1]:
+                    pipe.lrange(key, 0, -1)
+                pipe.strlen(keys[-1])
+                *lists, summary = await pipe.execute()
+            return summary + sum(len(entry) for entries in lists for entry in entries)
+
+    @timed("redis", "take_token")
+    async def take_token(self, uid: str) -> tuple[str | None, float]:
+        """
+        Take a token from the user's and the global token bucket.
+
+        The buckets hold up to ``RATE_LIMIT_USER_BURST`` and
+        ``RATE_LIMIT_GLOBAL_BURST`` tokens and refill at ``RATE_LIMIT_USER_RATE``
+        and ``RATE_LIMIT_GLOBAL_RATE`` tokens per second.
+
+        Returns:
+            tuple: ``"user"`` or ``"global"`` for the bucket that was empty,
+            or None if a token was taken, and the seconds until it refills.
+        """
+        bucket, retry_after = await self._rate_limit(
+            keys=[self._rate_limit_key(uid), GLOBAL_RATE_LIMIT],
+            args=[
+                time.time(),
+                settings.RATE_LIMIT_USER_RATE,
+                settings.RATE_LIMIT_USER_BURST,
+                settings.RATE_LIMIT_GLOBAL_RATE,
+                settings.RATE_LIMIT_GLOBAL_BURST,
+            ],
+        )
+        return (None, "user", "global")[bucket], retry_after / 1000
+
+    @timed("redis", "join_coalesced_batch")
+    async def join_coalesced_batch(
+        self, uid: str, batch_id: str, data: ChatInput
+    ) -> tuple[str, bool]:
+        """
+        Add a message to the user's open batch of coalesced messages.
+
+        Args:
+            uid: The user the message is from.
+            batch_id: The id to open a new batch with if none is open.
+            data: The message.
+
+        Returns:
+            tuple: The id of the batch joined and whether the caller opened it
+            and so leads it.
+        """
+        # the batch outlives its max wait only if its leader died
+        ttl = int(settings.COALESCE_MAX_WAIT) + 5
+        batch, leader = await self._join_coalesced_batch(
+            keys=[self._coalesce_key(uid), self._coalesce_messages_key(uid)],
+            args=[
+                batch_id,
+                time.time(),
+                settings.COALESCE_WINDOW,
+                settings.COALESCE_MAX_WAIT,
+                settings.COALESCE_MAX_MESSAGES,
+                data.model_dump_json(),
+                ttl,
+            ],
+        )
+        return batch.decode(), bool(leader)
+
+    @timed("redis", "get_coalesced_deadline")
+    async def get_coalesced_deadline(self, uid: str) -> float | None:
+        deadline = await self._redis_client.hget(self._coalesce_key(uid), "deadline")
+        return float(deadline) if deadline is not None else None
+
+    @timed("redis", "close_coalesced_batch")
+    async def close_coalesced_batch(self, uid: str) -> list[ChatInput]:
+        """
+        Close the user's open batch, later messages open a new one.
+
+        Returns:
+            list: The messages of the batch in the order they arrived.
+        """
+        async with self._redis_client.pipeline(transaction=True) as pipe:
+            pipe.lrange(self._coalesce_messages_key(uid), 0, -1)
+            pipe.delete(self._coalesce_key(uid), self._coalesce_messages_key(uid))
+            entries, _ = await pipe.execute()
+        return [ChatInput.model_validate_json(entry) for entry in entries]
+
+    @timed("redis", "publish_coalesced_result")
+    async def publish_coalesced_result(self, result: PublishedResult) -> None:
+        """
+        Store the result of a batch and announce it on ``RESULTS_CHANNEL``.
+        The result is stored first, so a waiter that subscribed late still
+        finds it.
+        """
+        payload = result.model_dump_json()
+        async with self._redis_client.pipeline(transaction=True) as pipe:
+            pipe.set(
+                self._coalesce_result_key(result.key),
+                payload,
+                ex=COALESCE_RESULT_TTL,
+            )
+            pipe.publish(RESULTS_CHANNEL, payload)
+            await pipe.execute()
+
+    @timed("redis", "get_coalesced_result")
+    async def get_coalesced_result(self, batch_id: str) -> PublishedResult | None:
+        result = await self._redis_client.get(self._coalesce_result_key(batch_id))
+        return PublishedResult.model_validate_json(result) if result else None
+
+    @timed("redis", "claim_idempotency_key")
+    async def claim_idempotency_key(
+        self, key: str, ttl: int
+    ) -> tuple[bool, PublishedResult | None]:
+        """
+        Claim an idempotency key for a request, unless a request with the same
+        key is running or has completed.
+
+        Args:
+            key: The idempotency key.
+            ttl: Seconds until the claim lapses unless it is refreshed, e.g.
+                because the worker of the request died.
+
+        Returns:
+            tuple: Whether the key was claimed, and the result of the request
+            holding it if that one has completed.
+        """
+        current = await self._claim_idempotency_key(
+            keys=[self._idempotency_key(key)], args=[ttl]
+        )
+        if current is None:
+            return True, None
+        return False, PublishedResult.model_validate_json(current) if current else None
+
+    @timed("redis", "refresh_idempotency_claim")
+    async def refresh_idempotency_claim(self, key: str, ttl: int) -> None:
+        """
+        Extend the claim on an idempotency key to ``ttl`` seconds from now,
+        unless its request has completed.
+        """
+        await self._refresh_idempotency_claim(
+            keys=[self._idempotency_key(key)], args=[ttl]
+        )
+
+    @timed("redis", "publish_idempotent_result")
+    async def publish_idempotent_result(self, result: PublishedResult) -> None:
+        """
+        Store the result of a request under its idempotency key for
+        ``IDEMPOTENCY_TTL`` seconds and announce it on ``RESULTS_CHANNEL``.
+        A failed request is announced and its key released instead, so a
+        retry runs again.
+        """
+        payload = result.model_dump_json()
+        async with self._redis_client.pipeline(transaction=True) as pipe:
+            if result.mood is not None:
+                pipe.set(
+                    self._idempotency_key(result.key),
+                    payload,
+                    ex=settings.IDEMPOTENCY_TTL,
+                )
+            else:
+                pipe.delete(self._idempotency_key(result.key))
+            pipe.publish(RESULTS_CHANNEL, payload)
+            await pipe.execute()
+
+    async def subscribe_results(self) -> PubSub:
+        """
+        Subscribe to the results of coalesced batches and idempotent requests.
+        """
+        pubsub = self._pubsub_client.pubsub(ignore_subscribe_messages=True)
+        await pubsub.subscribe(RESULTS_CHANNEL)
+        return pubsub
+
+    @timed("redis", "ping")
+    async def ping(self) -> None:
+        await self._redis_client.ping()
+
+    @timed("redis", "get_cached_profile")
+    async def get_cached_profile(self, uid: str) -> bytes | None:
+        return await self._redis_client.get(self._profile_key(uid))
+
+    @timed("redis", "cache_profile")
+    async def cache_profile(self, uid: str, payload: str) -> None:
+        """
+        Cache the user's profile for ``PROFILE_CACHE_TTL`` seconds.
+        """
+        await self._redis_client.set(
+            self._profile_key(uid), payload, ex=settings.PROFILE_CACHE_TTL
+        )
+
+    @timed("redis", "invalidate_profile")
+    async def invalidate_profile(self, uid: str) -> None:
+        await self._redis_client.delete(self._profile_key(uid))
+
+    @timed("redis", "get_cached_sessions")
+    async def get_cached_sessions(self, user_id: str, page: str) -> bytes | None:
+        """
+        Return a cached page of the user's stored sessions, if any.
+        """
+        return await self._redis_client.hget(self._sessions_cache_key(user_id), page)
+
+    @timed("redis", "cache_sessions")
+    async def cache_sessions(self, user_id: str, page: str, payload: str) -> None:
+        """
+        Cache a page of the user's stored sessions for ``SESSIONS_CACHE_TTL``.
+
+        All pages of a user share one hash, so they expire and are invalidated
+        together.
+        """
+        key = self._sessions_cache_key(user_id)
+        async with self._redis_client.pipeline(transaction=False) as pipe:
+            pipe.hset(key, page, payload)
+            pipe.expire(key, settings.SESSIONS_CACHE_TTL, nx=True)
+            await pipe.execute()
+
+    @timed("redis", "invalidate_sessions")
+    async def invalidate_sessions(self, user_id: str) -> None:
+        await self._redis_client.delete(self._sessions_cache_key(user_id))
+        logger.info("invalidated the sessions cache")
+
+    @timed("redis", "enqueue_session_job")
+    async def enqueue_session_job(self, job: SessionJob) -> bool:
+        """
+        Snapshot the user's current session into a job and queue it.
+
+        Returns:
+            bool: False if there was no session data to snapshot.
+        """
+        queued = await self._snapshot_session(job, SESSION_JOB_QUEUE)
+        logger.info(
+            "session job %s queued %s",
+            job.job_id,
+            queued,
+            extra={"job_id": job.job_id},
+        )
+        return queued
+
+    @timed("redis", "get_idle_sessions")
+    async def get_idle_sessions(
+        self, idle_before: float, limit: int
+    ) -> list[tuple[str, float]]:
+        """
+        Find the users whose session has been idle since ``idle_before``,
+        longest idle first.
+
+        Returns:
+            list: The user ids with the epoch time of their last message.
+        """
+        sessions = await self._redis_client.zrangebyscore(
+            SESSION_ACTIVITY, "-inf", idle_before, start=0, num=limit, withscores=True
+        )
+        return [(uid.decode(), last_active) for uid, last_active in sessions]
+
+    @timed("redis", "claim_idle_session")
+    async def claim_idle_session(
+        self, job: SessionJob, idle_before: float, owner: str
+    ) -> bool:
+        """
+        Snapshot an idle session into a job that is already being processed.
+
+        The job is put on the processing list of ``owner`` instead of the
+        queue, so it is recovered like any other job if the process dies
+        before finishing it.
+
+        Returns:
+            bool: False if the user was active again since ``idle_before`` or
+            there was no session data.
+        """
+        return await self._snapshot_session(
+            job, self._session_job_processing_key(owner), idle_before
+        )
+
+    async def _snapshot_session(
+        self, job: SessionJob, queue: str, idle_before: float | None = None
+    ) -> bool:
+        args = [job.model_dump_json(), job.job_id, job.uid]
+        if idle_before is not None:
+            args.append(idle_before)
+        return bool(
+            await self._enqueue_session_job(
+                keys=[
+                    *self._session_keys(job.uid),
+                    self._context_summary_key(job.uid),
+                    *self._session_job_data_keys(job.job_id),
+                    self._session_job_key(job.job_id),
+                    SESSION_ACTIVITY,
+                    queue,
+                ],
+                args=args,
+            )
+        )
+
+    @timed("redis", "get_session_job")
+    async def get_session_job(self, job_id: str) -> SessionJob | None:
+        result = await self._redis_client.get(self._session_job_key(job_id))
+        return SessionJob.model_validate_json(result) if result else None
+
+    @timed("redis", "get_session_job_data")
+    async def get_session_job_data(
+        self, job_id: str
+    ) -> tuple[list[ConversationMessage], list[MoodAnalysisResult]]:
+        """
+        Fetch the session snapshot taken when the job was queued.
+        """
+        return await self._get_session_lists(*self._session_job_data_keys(job_id))
+
+    @timed("redis", "claim_session_job")
+    async def claim_session_job(self, owner: str, timeout: float) -> str | None:
+        """
+        Wait for a queued job and move it to the processing list of ``owner``.
+
+        Returns:
+            str | None: The job id, or None if nothing was queued in time.
+        """
+        job_id: bytes | None = await self._redis_client.blmove(
+            SESSION_JOB_QUEUE,
+            self._session_job_processing_key(owner),
+            timeout,
+            "LEFT",
+            "RIGHT",
+        )
+        return job_id.decode() if job_id is not None else None
+
+    @timed("redis", "update_session_job")
+    async def update_session_job(self, job: SessionJob) -> None:
+        await self._redis_client.set(
+            self._session_job_key(job.job_id), job.model_dump_json()
+        )
+
+    @timed("redis", "requeue_session_job")
+    async def requeue_session_job(self, job: SessionJob, owner: str) -> None:
+        async with self._redis_client.pipeline(transaction=True) as pipe:
+            pipe.set(self._session_job_key(job.job_id), job.model_dump_json())
+            pipe.lrem(self._session_job_processing_key(owner), 1, job.job_id)
+            pipe.rpush(SESSION_JOB_QUEUE, job.job_id)
+            await pipe.execute()
+
+    @timed("redis", "finish_session_job")
+    async def finish_session_job(self, job: SessionJob, owner: str) -> None:
+        """
+        Store the final state of a job, drop its snapshot and acknowledge it.
+
+        The job record itself is kept for ``SESSION_JOB_TTL`` seconds so
+        clients can still poll for the result.
+        """
+        job_key = self._session_job_key(job.job_id)
+        async with self._redis_client.pipeline(transaction=True) as pipe:
+            pipe.set(job_key, job.model_dump_json(), ex=settings.SESSION_JOB_TTL)
+            pipe.delete(*self._session_job_data_keys(job.job_id))
+            pipe.lrem(self._session_job_processing_key(owner), 1, job.job_id)
+            await pipe.execute()
+
+    @timed("redis", "ack_session_job")
+    async def ack_session_job(self, job_id: str, owner: str) -> None:
+        await self._redis_client.lrem(
+            self._session_job_processing_key(owner), 1, job_id
+        )
+
+    @timed("redis", "renew_session_job_lease")
+    async def renew_session_job_lease(self, owner: str, lease: float) -> None:
+        """
+        Extend the lease of ``owner`` on the jobs it is processing to ``lease``
+        seconds from now.
+        """
+        await self._redis_client.zadd(SESSION_JOB_LEASES, {owner: time.time() + lease})
+
+    @timed("redis", "reclaim_session_jobs")
+    async def reclaim_session_jobs(self) -> int:
+        """
+        Move the jobs of processes whose lease expired back to the queue.
+
+        Returns:
+            int: The number of recovered jobs.
+        """
+        now = time.time()
+        owners = await self._redis_client.zrangebyscore(SESSION_JOB_LEASES, "-inf", now)
+        recovered = 0
+        for owner in owners:
+            recovered += await self._requeue_processing(owner.decode(), now)
+        return recovered
+
+    @timed("redis", "release_session_jobs")
+    async def release_session_jobs(self, owner: str) -> int:
+        """
+        Move the jobs ``owner`` is processing back to the queue and drop its
+        lease, e.g. when it shuts down.
+
+        Returns:
+            int: The number of requeued jobs.
+        """
+        return await self._requeue_processing(owner, time.time(), release=True)
+
+    async def _requeue_processing(
+        self, owner: str, now: float, *, release: bool = False
+    ) -> int:
+        return await self._reclaim_session_jobs(
+            keys=[
+                SESSION_JOB_LEASES,
+                self._session_job_processing_key(owner),
+                SESSION_JOB_QUEUE,
+            ],
+            args=[owner, now, int(release)],
         )
-        logger.info("added session moods")
 
-    async def get_session_moods(self, user_id: str) -> list[MoodAnalysisResult]:
-        result = self._redis_client.lrange(f"user:{user_id}:session_moods", 0, -1)
-        if isinstance(result, Awaitable):
-            result = await result
 
-        return list(map(MoodAnalysisResult.model_validate_json, result))
+async def monitor_sessions(redis_service: RedisService) -> None:
+    """
+    Report the number of active sessions and their memory footprint in
+    ``ACTIVE_SESSIONS`` and ``SESSION_BYTES`` every ``SESSION_STATS_INTERVAL``
+    seconds. Meant to run as a background task for the lifetime of the app.
+    """
+    while True:
+        try:
+            stats = await redis_service.session_stats(settings.SESSION_STATS_SAMPLE)
+        except Exception:
+            logger.exception("failed to collect session stats")
+        else:
+            ACTIVE_SESSIONS.set(stats["active_sessions"])
+            for stat in ("mean", "p95", "max"):
+                SESSION_BYTES.labels(stat).set(stats[f"bytes_{stat}"])
+        await asyncio.sleep(settings.SESSION_STATS_INTERVAL)
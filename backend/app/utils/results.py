@@ -0,0 +1,162 @@
+import asyncio
+import contextlib
+import logging
+from collections import defaultdict
+from collections.abc import Awaitable, Callable, Iterator
+from typing import TYPE_CHECKING
+
+from fastapi import HTTPException
+
+from app.models.chat import MoodAnalysisResult, PublishedResult
+from app.utils.redis import RedisService
+
+if TYPE_CHECKING:
+    from redis.asyncio.client import PubSub
+
+logger = logging.getLogger(__name__)
+
+
+class ResultListener:
+    """
+    This class hands the results of ``/process`` requests, published by
+    whichever worker ran them, to the requests of this worker waiting for
+    them: the followers of a coalesced batch and the duplicates of an
+    idempotent request.
+
+    One pubsub connection per worker serves every waiter. Results are looked
+    up by key, batch ids and idempotency keys never collide. A result
+    published while the subscription reconnects is missed, so waiters also
+    look for the stored result every ``POLL_INTERVAL`` seconds.
+    """
+
+    POLL_INTERVAL = 1.0
+
+    def __init__(self, redis_service: RedisService) -> None:
+        self._redis_service = redis_service
+        self._waiters: defaultdict[str, set[asyncio.Future[PublishedResult]]] = (
+            defaultdict(set)
+        )
+        self._pubsub: PubSub | None = None
+        self._task: asyncio.Task | None = None
+
+    async def start(self) -> None:
+        self._pubsub = await self._redis_service.subscribe_results()
+        self._task = asyncio.create_task(self._listen(), name="result-listener")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+        if self._pubsub is not None:
+            await self._pubsub.aclose()
+
+    async def _listen(self) -> None:
+        while True:
+            try:
+                await self._dispatch()
+            except Exception:
+                logger.exception("error while listening for results")
+            await asyncio.sleep(1)
+
+    async def _dispatch(self) -> None:
+        assert self._pubsub is not None  # noqa: S101
+        async for message in self._pubsub.listen():
+            if message["type"] == "message":
+                self._resolve(PublishedResult.model_validate_json(message["data"]))
+
+    def _resolve(self, result: PublishedResult) -> None:
+        for future in self._waiters.get(result.key, ()):
+            if not future.done():
+                future.set_result(result)
+
+    @contextlib.contextmanager
+    def expect(self, key: str) -> Iterator[asyncio.Future[PublishedResult]]:
+        """
+        A future resolved with the next result published under ``key``.
+
+        Register it before looking for a stored result, so a result published
+        in between isn't missed.
+        """
+        future: asyncio.Future[PublishedResult] = (
+            asyncio.get_running_loop().create_future()
+        )
+        waiters = self._waiters[key]
+        waiters.add(future)
+        try:
+            yield future
+        finally:
+            waiters.discard(future)
+            if not waiters:
+                self._waiters.pop(key, None)
+
+    async def wait(
+        self,
+        future: asyncio.Future[PublishedResult],
+        lookup: Callable[[], Awaitable[PublishedResult | None]],
+        timeout: float,
+    ) -> PublishedResult | None:
+        """
+        Wait for the result ``future`` expects, or for ``lookup`` to find it
+        stored in redis.
+
+        Returns:
+            PublishedResult | None: The result, or None if it didn't arrive
+            within ``timeout`` seconds.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while (remaining := deadline - loop.time()) > 0:
+            done, _ = await asyncio.wait(
+                {future}, timeout=min(self.POLL_INTERVAL, remaining)
+            )
+            if done:
+                return future.result()
+            if (result := await lookup()) is not None:
+                return result
+        return None
+
+
+async def publish_outcome(
+    key: str,
+    answer: Callable[[], Awaitable[MoodAnalysisResult]],
+    publish: Callable[[PublishedResult], Awaitable[None]],
+) -> MoodAnalysisResult:
+    """
+    Answer a request and publish its reply under ``key``, or the error it
+    failed with, so the requests waiting for it never wait in vain. A request
+    that is cancelled, e.g. because its client went away, is published as
+    failed as well.
+    """
+    try:
+        mood = await answer()
+    except HTTPException as e:
+        await publish(
+            PublishedResult(
+                key=key, status_code=e.status_code, detail=e.detail, headers=e.headers
+            )
+        )
+        raise
+    except BaseException:
+        await publish(
+            PublishedResult(key=key, status_code=500, detail="internal server error")
+        )
+        raise
+    await publish(PublishedResult(key=key, mood=mood))
+    return mood
+
+
+def result_mood(result: PublishedResult) -> MoodAnalysisResult:
+    """
+    The reply of a published result.
+
+    Raises:
+        HTTPException: The error the request failed with.
+    """
+    if result.mood is None:
+        raise HTTPException(
+            status_code=result.status_code or 500,
+            detail=result.detail,
+            headers=result.headers,
+        )
+    return result.mood
@@ -0,0 +1,269 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from collections.abc import Awaitable, Callable
+from typing import TypeVar
+
+from app.config.settings import settings
+from app.utils.metrics import GEMINI_CIRCUIT_OPEN, GEMINI_FALLBACKS, GEMINI_HEDGES
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class ModelUnavailableError(RuntimeError):
+    """
+    Raised when the circuit breaker of every model of an analyzer is open.
+    """
+
+
+class QueueTimeoutError(TimeoutError):
+    """
+    Raised when a request timed out waiting for one of the worker's gemini
+    slots, before it was sent. It says nothing about the model, so it doesn't
+    count against it.
+    """
+
+
+class ModelStats:
+    """
+    This class keeps the rolling latency and error stats of one model, over
+    the last ``GEMINI_ROUTING_WINDOW`` requests.
+
+    Outcomes older than ``GEMINI_ROUTING_MAX_AGE`` seconds don't count towards
+    the error rate, so a model that was avoided for failing gets tried again.
+    """
+
+    def __init__(self) -> None:
+        self._latencies: deque[float] = deque(maxlen=settings.GEMINI_ROUTING_WINDOW)
+        self._outcomes: deque[tuple[float, bool]] = deque(
+            maxlen=settings.GEMINI_ROUTING_WINDOW
+        )
+
+    def record(self, latency: float | None) -> None:
+        """
+        Record a request, ``latency`` in seconds if it succeeded, None if it
+        failed.
+        """
+        self._outcomes.append((time.monotonic(), latency is None))
+        if latency is not None:
+            self._latencies.append(latency)
+
+    def percentile(self, percentile: float) -> float | None:
+        """
+        The latency below which ``percentile`` percent of the recent requests
+        completed, or None until ``GEMINI_ROUTING_MIN_SAMPLES`` succeeded.
+        """
+        if len(self._latencies) < settings.GEMINI_ROUTING_MIN_SAMPLES:
+            return None
+        latencies = sorted(self._latencies)
+        return latencies[round(percentile / 100 * (len(latencies) - 1))]
+
+    def error_rate(self) -> float:
+        since = time.monotonic() - settings.GEMINI_ROUTING_MAX_AGE
+        failures = [failed for at, failed in self._outcomes if at >= since]
+        if len(failures) < settings.GEMINI_ROUTING_MIN_SAMPLES:
+            return 0.0
+        return sum(failures) / len(failures)
+
+
+class CircuitBreaker:
+    """
+    This class stops requests to a model after ``GEMINI_BREAKER_FAILURES``
+    consecutive failures.
+
+    After ``GEMINI_BREAKER_COOLDOWN`` seconds requests are let through again,
+    the first success closes the breaker and the first failure opens it for
+    another cooldown.
+    """
+
+    def __init__(self, model: str) -> None:
+        self.model = model
+        self._failures = 0
+        self._open_until = 0.0
+
+    def allow(self) -> bool:
+        return time.monotonic() >= self._open_until
+
+    def record_success(self) -> None:
+        if self._failures >= settings.GEMINI_BREAKER_FAILURES:
+            logger.info("circuit breaker of %s closed", self.model)
+            GEMINI_CIRCUIT_OPEN.labels(self.model).set(0)
+        self._failures = 0
+        self._open_until = 0.0
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        if self._failures >= settings.GEMINI_BREAKER_FAILURES:
+            if self.allow():
+                logger.warning("circuit breaker of %s opened", self.model)
+            self._open_until = time.monotonic() + settings.GEMINI_BREAKER_COOLDOWN
+            GEMINI_CIRCUIT_OPEN.labels(self.model).set(1)
+
+
+# shared by the analyzers, a model that is down is down for all of them
+_breakers: dict[str, CircuitBreaker] = {}
+
+
+def _breaker(model: str) -> CircuitBreaker:
+    if model not in _breakers:
+        _breakers[model] = CircuitBreaker(model)
+    return _breakers[model]
+
+
+class ModelRouter:
+    """
+    This class picks the gemini model for the requests of one analyzer and
+    hedges slow ones.
+
+    Models are tried in the configured order, skipping those whose circuit
+    breaker is open and moving those failing more than
+    ``GEMINI_ROUTING_MAX_ERROR_RATE`` of their recent requests to the back.
+    A request that fails is retried on the next model. A request still
+    running after the ``GEMINI_HEDGE_PERCENTILE`` percentile of the model's
+    recent latencies is hedged with a second request to the next model, or
+    the same one if there is no other, and whichever answers first is used.
+
+    Args:
+        analyzer: Name of the analyzer, used in metrics.
+        models: The primary model followed by its fallbacks.
+    """
+
+    def __init__(self, analyzer: str, models: list[str]) -> None:
+        self.analyzer = analyzer
+        self.models = list(dict.fromkeys(models))
+        self._stats = {model: ModelStats() for model in self.models}
+
+    def candidates(self) -> list[str]:
+        """
+        The models to try, in order.
+
+        Raises:
+            ModelUnavailableError: If the breakers of all models are open.
+        """
+        healthy: list[str] = []
+        degraded: list[str] = []
+        for model in self.models:
+            if not _breaker(model).allow():
+                GEMINI_FALLBACKS.labels(self.analyzer, model, "circuit_open").inc()
+            elif (
+                self._stats[model].error_rate() > settings.GEMINI_ROUTING_MAX_ERROR_RATE
+            ):
+                GEMINI_FALLBACKS.labels(self.analyzer, model, "error_rate").inc()
+                degraded.append(model)
+            else:
+                healthy.append(model)
+        if not healthy and not degraded:
+            raise ModelUnavailableError(
+                f"all {self.analyzer} models are unavailable: {', '.join(self.models)}"
+            )
+        return healthy + degraded
+
+    def pick(self) -> str:
+        """
+        The model to send a request to that can't be hedged, e.g. a stream.
+        """
+        return self.candidates()[0]
+
+    def record(self, model: str, latency: float | None) -> None:
+        """
+        Record the outcome of a request sent to the model returned by
+        :meth:`pick`, ``latency`` in seconds or None if it failed.
+        """
+        self._stats[model].record(latency)
+        if latency is None:
+            _breaker(model).record_failure()
+        else:
+            _breaker(model).record_success()
+
+    def hedge_delay(self, model: str) -> float | None:
+        """
+        Seconds to wait for ``model`` before hedging, None if requests to it
+        are not hedged.
+        """
+        if not settings.GEMINI_HEDGE_ENABLED:
+            return None
+        latency = self._stats[model].percentile(settings.GEMINI_HEDGE_PERCENTILE)
+        if latency is None:
+            return None
+        return max(latency, settings.GEMINI_HEDGE_MIN_DELAY)
+
+    async def _attempt(self, model: str, call: Callable[[str], Awaitable[T]]) -> T:
+        started = time.perf_counter()
+        try:
+            result = await call(model)
+        except (asyncio.CancelledError, QueueTimeoutError):
+            raise
+        except Exception:
+            self.record(model, None)
+            raise
+        self.record(model, time.perf_counter() - started)
+        return result
+
+    async def run(self, call: Callable[[str], Awaitable[T]]) -> T:
+        """
+        Run ``call`` with the name of a model until one attempt succeeds.
+
+        Returns:
+            The result of the first successful attempt.
+
+        Raises:
+            ModelUnavailableError: If the breakers of all models are open.
+            QueueTimeoutError: If an attempt timed out waiting for a slot.
+            Exception: The error of the last attempt if all of them failed.
+        """
+        candidates = self.candidates()
+        first = candidates.pop(0)
+        running: dict[asyncio.Task[T], str] = {}
+
+        def _launch(model: str) -> asyncio.Task[T]:
+            task = asyncio.create_task(self._attempt(model, call))
+            running[task] = model
+            return task
+
+        leading = _launch(first)
+        delay = self.hedge_delay(first)
+        hedged = False
+        error: BaseException | None = None
+        try:
+            while running:
+                done, _ = await asyncio.wait(
+                    running, timeout=delay, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    # only one hedge per request
+                    delay = None
+                    hedged = True
+                    hedge = candidates.pop(0) if candidates else running[leading]
+                    GEMINI_FALLBACKS.labels(self.analyzer, hedge, "hedge").inc()
+                    _launch(hedge)
+                    continue
+
+                for task in done:
+                    model = running.pop(task)
+                    if task.exception() is None:
+                        if hedged:
+                            GEMINI_HEDGES.labels(
+                                self.analyzer, "primary" if task is leading else "hedge"
+                            ).inc()
+                        return task.result()
+                    error = task.exception()
+                    if isinstance(error, QueueTimeoutError):
+                        # another model would wait for the same slots
+                        raise error
+                    logger.warning(
+                        "%s request to %s failed: %r", self.analyzer, model, error
+                    )
+                if not running and candidates:
+                    model = candidates.pop(0)
+                    GEMINI_FALLBACKS.labels(self.analyzer, model, "error").inc()
+                    leading = _launch(model)
+                    if not hedged:
+                        delay = self.hedge_delay(model)
+        finally:
+            for task in running:
+                task.cancel()
+        assert error is not None  # noqa: S101
+        raise error
@@ -0,0 +1,91 @@
+import json
+import re
+
+_REPLY_START = re.compile(r'"reply"\s*:\s*"')
+_HIGH_SURROGATES = range(0xD800, 0xDC00)
+_ESCAPES = {
+    '"': '"',
+    "\\": "\\",
+    "/": "/",
+    "b": "\b",
+    "f": "\f",
+    "n": "\n",
+    "r": "\r",
+    "t": "\t",
+}
+
+
+class ReplyStreamParser:
+    """
+    Incrementally extract the ``reply`` string from a partial model output.
+
+    The model answers with a JSON object, possibly wrapped in a markdown fence,
+    that arrives in arbitrary chunks. Every call to :meth:`feed` returns the part
+    of the decoded reply that became available with the new chunk, so it can be
+    forwarded to the client before the object is complete.
+
+    Example:
+        parser = ReplyStreamParser()
+        parser.feed('{"mood": "joy", "reply": "Hel')  # 'Hel'
+        parser.feed('lo there"}')  # 'lo there'
+    """
+
+    def __init__(self) -> None:
+        self.text = ""
+        self.done = False
+        self._pos: int | None = None
+
+    def feed(self, chunk: str) -> str:
+        """
+        Add a chunk of model output.
+
+        Args:
+            chunk: The next piece of raw model output.
+
+        Returns:
+            str: The newly decoded reply text, empty if nothing new is available.
+        """
+        self.text += chunk
+        if self.done:
+            return ""
+
+        if self._pos is None:
+            match = _REPLY_START.search(self.text)
+            if match is None:
+                return ""
+            self._pos = match.end()
+
+        decoded: list[str] = []
+        pos = self._pos
+        while pos < len(self.text):
+            char = self.text[pos]
+            if char == '"':
+                self.done = True
+                pos += 1
+                break
+            if char != "\\":
+                decoded.append(char)
+                pos += 1
+                continue
+
+            # escape sequences are only decoded once they are complete
+            if pos + 1 >= len(self.text):
+                break
+            code = self.text[pos + 1]
+            if code != "u":
+                decoded.append(_ESCAPES.get(code, code))
+                pos += 2
+                continue
+            if pos + 6 > len(self.text):
+                break
+            escape = self.text[pos : pos + 6]
+            # a surrogate pair needs both halves before it can be decoded
+            if int(escape[2:], 16) in _HIGH_SURROGATES:
+                if pos + 12 > len(self.text):
+                    break
+                escape = self.text[pos : pos + 12]
+            decoded.append(json.loads(f'"{escape}"'))
+            pos += len(escape)
+
+        self._pos = pos
+        return "".join(decoded)
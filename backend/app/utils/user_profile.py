@@ -0,0 +1,140 @@
+import asyncio
+import hashlib
+import logging
+from datetime import datetime
+
+from cachetools import TTLCache
+from fastapi import Request
+from firebase_admin import auth
+from redis.exceptions import RedisError
+
+from app.config.settings import settings
+from app.models.user_profile import Profile
+from app.utils.metrics import PROFILE_CACHE, timed
+from app.utils.redis import RedisService
+
+logger = logging.getLogger(__name__)
+
+
+def profile_from_user(uid: str, user: auth.UserRecord) -> Profile:
+    return Profile(
+        uid=uid,
+        email=user.email or "",
+        full_name=user.display_name or "",
+        created_at=datetime.fromtimestamp(user.user_metadata.creation_timestamp / 1000),
+        updated_at=(
+            datetime.fromtimestamp(user.user_metadata.last_sign_in_timestamp / 1000)
+            if user.user_metadata.last_sign_in_timestamp
+            else None
+        ),
+    )
+
+
+def profile_etag(profile: Profile) -> str:
+    digest = hashlib.sha256(profile.model_dump_json().encode()).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+@timed("auth", "get_user")
+async def _fetch_profile(uid: str) -> Profile:
+    user = await asyncio.to_thread(auth.get_user, uid)
+    return profile_from_user(uid, user)
+
+
+class ProfileCache:
+    """
+    This class caches user profiles from Firebase Auth in two tiers: a small
+    in-process LRU with a ``PROFILE_CACHE_LOCAL_TTL`` of a few seconds, backed
+    by redis with a ``PROFILE_CACHE_TTL``.
+
+    Concurrent misses for the same user share one lookup, and Firebase is
+    called off the event loop. Updates are written through to both tiers by
+    the worker that made them, other workers see them once their local entry
+    expires. If redis is unavailable profiles are fetched from Firebase.
+    """
+
+    def __init__(self, redis_service: RedisService) -> None:
+        self._redis_service = redis_service
+        self._local: TTLCache[str, Profile] = TTLCache(
+            maxsize=settings.PROFILE_CACHE_SIZE, ttl=settings.PROFILE_CACHE_LOCAL_TTL
+        )
+        self._loading: dict[str, asyncio.Task[Profile]] = {}
+
+    @staticmethod
+    def get_cache(request: Request) -> "ProfileCache":
+        return request.app.state.profile_cache
+
+    async def get(self, uid: str) -> Profile:
+        """
+        Return the user's profile from the cache, loading it on a miss.
+
+        Raises:
+            UserNotFoundError: If the user does not exist.
+            FirebaseError: If Firebase could not be reached.
+        """
+        if (profile := self._local.get(uid)) is not None:
+            PROFILE_CACHE.labels("local").inc()
+            return profile
+
+        task = self._loading.get(uid)
+        if task is None:
+            task = asyncio.create_task(self._load(uid))
+            self._loading[uid] = task
+            task.add_done_callback(lambda done: self._loaded(uid, done))
+        else:
+            PROFILE_CACHE.labels("coalesced").inc()
+        # a caller going away must not cancel the lookup others wait for
+        return await asyncio.shield(task)
+
+    def _loaded(self, uid: str, task: asyncio.Task[Profile]) -> None:
+        if self._loading.get(uid) is task:
+            del self._loading[uid]
+
+    def _current(self, uid: str) -> bool:
+        # a profile written while this lookup ran replaced it, its result is
+        # older and must not be cached
+        return self._loading.get(uid) is asyncio.current_task()
+
+    async def _load(self, uid: str) -> Profile:
+        try:
+            cached = await self._redis_service.get_cached_profile(uid)
+        except RedisError:
+            logger.exception("profile cache unavailable")
+            cached = None
+        if cached:
+            PROFILE_CACHE.labels("redis").inc()
+            profile = Profile.model_validate_json(cached)
+        else:
+            PROFILE_CACHE.labels("miss").inc()
+            profile = await _fetch_profile(uid)
+            if self._current(uid):
+                await self._store(uid, profile)
+        if self._current(uid):
+            self._local[uid] = profile
+        return profile
+
+    async def _store(self, uid: str, profile: Profile) -> None:
+        try:
+            await self._redis_service.cache_profile(uid, profile.model_dump_json())
+        except RedisError:
+            logger.exception("could not cache the profile")
+
+    async def put(self, uid: str, profile: Profile) -> None:
+        """
+        Write an updated profile through to both tiers.
+        """
+        self._loading.pop(uid, None)
+        self._local[uid] = profile
+        await self._store(uid, profile)
+
+    async def invalidate(self, uid: str) -> None:
+        """
+        Drop the user's profile from both tiers, e.g. after an update that
+        may or may not have been applied.
+        """
+        self._loading.pop(uid, None)
+        self._local.pop(uid, None)
+        try:
+            await self._redis_service.invalidate_profile(uid)
+        except RedisError:
+            logger.exception("could not invalidate the cached profile")
@@ -0,0 +1,9 @@
+import os
+
+from benchmarks.fake_firebase import fake_firebase_credentials
+
+# the benchmarks only ever talk to local fakes, make sure the app settings load
+# without a real environment
+os.environ.setdefault("GEMINI_API_KEY", "fake")
+if "FIREBASE_CREDENTIALS" not in os.environ:
+    os.environ["FIREBASE_CREDENTIALS"] = fake_firebase_credentials()
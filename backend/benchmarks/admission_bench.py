@@ -0,0 +1,125 @@
+"""
+Benchmark of admission control on ``/process`` under overload.
+
+Sends more ``/process`` requests than the gemini concurrency limit can serve
+in time, with admission control off and on, in two scenarios:
+
+* ``overload``: many users at once. Without load shedding requests queue for
+  a gemini slot until they time out, with it the excess is turned away early.
+* ``greedy``: one user floods the endpoint next to users sending a single
+  message. The per-user token bucket should keep the others unaffected.
+
+Requests arrive spread evenly over ``--ramp`` seconds. Reports the status codes and the latency of successful and rejected requests
+per group of users.
+
+Usage:
+    python -m benchmarks.admission_bench --requests 300 --gemini-slots 16 --ramp 1
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from collections import Counter, defaultdict
+
+import httpx
+
+from app.config.settings import settings
+from app.utils import routing
+from app.utils.chat import GeminiClient
+from benchmarks.apps import session_app
+from benchmarks.fake_gemini import FakeGeminiServer
+from benchmarks.fake_redis import FakeRedisService
+from benchmarks.stats import percentiles
+
+
+async def _run(
+    scenario: str, requests: int, gemini_slots: int, ramp: float, *, admission: bool
+) -> dict:
+    settings.RATE_LIMIT_ENABLED = admission
+    settings.LOAD_SHED_QUEUE_DEPTH = gemini_slots * 2 if admission else 10**9
+    routing._breakers.clear()  # noqa: SLF001
+
+    gemini_client = GeminiClient(gemini_slots)
+    app = session_app(FakeRedisService(), gemini_client)
+
+    if scenario == "overload":
+        senders = [("users", f"user-{i}") for i in range(requests)]
+    else:
+        senders = [("greedy", "greedy-user")] * (requests // 2) + [
+            ("users", f"user-{i}") for i in range(requests // 2)
+        ]
+
+    statuses: dict[str, Counter] = defaultdict(Counter)
+    samples: dict[str, list[float]] = defaultdict(list)
+
+    async def _send(
+        client: httpx.AsyncClient, group: str, uid: str, delay: float
+    ) -> None:
+        await asyncio.sleep(delay)
+        started = time.perf_counter()
+        response = await client.post(
+            "/api/v1/process",
+            params={
+                "text": "it has been a long and tiring day",
+                "timestamp": "2025-01-01T10:00:00",
+            },
+            headers={"Authorization": f"Bearer {uid}"},
+        )
+        ms = (time.perf_counter() - started) * 1000
+        statuses[group][response.status_code] += 1
+        outcome = "ok" if response.is_success else "rejected"
+        samples[f"{group}_{outcome}"].append(ms)
+
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://bench", timeout=60
+    ) as client:
+        await asyncio.gather(
+            *(
+                _send(client, group, uid, ramp * i / len(senders))
+                for i, (group, uid) in enumerate(senders)
+            )
+        )
+
+    await gemini_client.close()
+    await app.state.redis_service.close()
+    return {
+        "scenario": scenario,
+        "admission": admission,
+        "statuses": {group: dict(counts) for group, counts in statuses.items()},
+        "latency": {key: percentiles(values) for key, values in samples.items()},
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--gemini-slots", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--timeout", type=float, default=3.0)
+    parser.add_argument("--ramp", type=float, default=1.0)
+    args = parser.parse_args()
+    settings.GEMINI_TIMEOUT = args.timeout
+
+    with FakeGeminiServer(latency=args.latency) as server:
+        settings.GEMINI_BASE_URL = server.base_url
+        results = [
+            asyncio.run(
+                _run(
+                    scenario,
+                    args.requests,
+                    args.gemini_slots,
+                    args.ramp,
+                    admission=admission,
+                )
+            )
+            for scenario in ("overload", "greedy")
+            for admission in (False, True)
+        ]
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""
+End-to-end benchmark of the API routes against local fakes.
+
+Boots the FastAPI ``app`` from ``app.main`` with a lifespan that wires in
+fakeredis (or a local redis server), an in-memory Firestore and the fake gemini
+server, and with the Firebase token check overridden. Simulated users then chat
+through ``/process``, list ``/sessions`` and close their session with
+``/end-session``, once for each of the given session lengths.
+
+Reports p50/p95/p99 latency per route, requests per second and event loop
+blocking time as JSON, suitable for keeping as a baseline to compare against.
+
+Usage:
+    python -m benchmarks.app_bench --users 50 --session-lengths 5,20 --output baseline.json
+"""
+
+import argparse
+import asyncio
+import json
+import platform
+import time
+from collections import defaultdict
+from collections.abc import AsyncGenerator
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+import httpx
+from fastapi import FastAPI
+
+from app.config.settings import settings
+from app.main import app
+from app.utils.auth import verify_firebase_token
+from app.utils.chat import GeminiClient, MoodAnalyzer, SessionAnalyzer
+from app.utils.jobs import SessionJobLease, SessionJobWorker
+from app.utils.user_profile import ProfileCache
+from benchmarks.fake_firebase import fake_uid
+from benchmarks.fake_firestore import FakeFirestore
+from benchmarks.fake_gemini import FakeGeminiServer
+from benchmarks.fake_redis import FakeRedisService
+from benchmarks.stats import LoopLagMonitor, percentiles
+
+API = settings.API_V1_STR
+
+
+@asynccontextmanager
+async def _fake_lifespan(
+    app: FastAPI, redis_url: str, firestore_latency: float
+) -> AsyncGenerator[None, None]:
+    app.state.redis_service = FakeRedisService(redis_url)
+    app.state.firestore_db = FakeFirestore(firestore_latency)
+    app.state.profile_cache = ProfileCache(app.state.redis_service)
+    gemini_client = app.state.gemini_client = GeminiClient()
+    app.state.mood_analyzer = MoodAnalyzer(gemini_client)
+    app.state.session_analyzer = SessionAnalyzer(gemini_client)
+    app.state.message_coalescer = None
+    app.state.idempotent_requests = None
+    lease = SessionJobLease(app.state.redis_service)
+    await lease.start()
+    worker = SessionJobWorker(
+        app.state.redis_service,
+        app.state.firestore_db,
+        app.state.session_analyzer,
+        lease,
+    )
+    await worker.start()
+    yield
+    await worker.stop()
+    await lease.stop()
+    await app.state.redis_service.close()
+    await gemini_client.close()
+
+
+class _Recorder:
+    def __init__(self) -> None:
+        self.samples: dict[str, list[float]] = defaultdict(list)
+        self.errors: dict[str, int] = defaultdict(int)
+
+    async def request(
+        self,
+        client: httpx.AsyncClient,
+        route: str,
+        method: str,
+        url: str,
+        headers: dict[str, str],
+        params: dict[str, str] | None = None,
+    ) -> None:
+        started = time.perf_counter()
+        response = await client.request(method, url, headers=headers, params=params)
+        self.samples[route].append((time.perf_counter() - started) * 1000)
+        if response.is_error:
+            self.errors[route] += 1
+
+
+async def _user(
+    client: httpx.AsyncClient, recorder: _Recorder, uid: str, session_length: int
+) -> None:
+    headers = {"Authorization": f"Bearer {uid}"}
+    for i in range(session_length):
+        await recorder.request(
+            client,
+            "process",
+            "POST",
+            f"{API}/process",
+            params={
+                "text": f"this is message number {i} of my day, it went okay",
+                "timestamp": "2025-01-01T10:00:00",
+            },
+            headers=headers,
+        )
+    await recorder.request(
+        client, "sessions", "GET", f"{API}/sessions", headers=headers
+    )
+    await recorder.request(
+        client, "end_session", "POST", f"{API}/end-session", headers=headers
+    )
+
+
+async def _scenario(client: httpx.AsyncClient, users: int, session_length: int) -> dict:
+    recorder = _Recorder()
+    async with LoopLagMonitor() as lag:
+        started = time.perf_counter()
+        await asyncio.gather(
+            *(
+                _user(client, recorder, f"user-{session_length}-{i}", session_length)
+                for i in range(users)
+            )
+        )
+        elapsed = time.perf_counter() - started
+
+    requests = sum(len(samples) for samples in recorder.samples.values())
+    return {
+        "session_length": session_length,
+        "users": users,
+        "requests": requests,
+        "errors": sum(recorder.errors.values()),
+        "seconds": round(elapsed, 3),
+        "requests_per_second": round(requests / elapsed, 2),
+        "routes": {
+            route: {**percentiles(samples), "errors": recorder.errors[route]}
+            for route, samples in recorder.samples.items()
+        },
+        **lag.result(),
+    }
+
+
+async def _bench(args: argparse.Namespace) -> list[dict]:
+    app.dependency_overrides[verify_firebase_token] = fake_uid
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with (
+        _fake_lifespan(app, args.redis_url, args.firestore_latency),
+        httpx.AsyncClient(transport=transport, base_url="http://bench") as client,
+    ):
+        # warm up connections and the prompt caches outside the measurements
+        await _user(client, _Recorder(), "warmup", 1)
+        return [
+            await _scenario(client, args.users, length)
+            for length in args.session_lengths
+        ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument(
+        "--session-lengths",
+        type=lambda value: [int(length) for length in value.split(",")],
+        default=[5, 20],
+    )
+    parser.add_argument("--gemini-latency", type=float, default=0.2)
+    parser.add_argument("--firestore-latency", type=float, default=0.01)
+    parser.add_argument(
+        "--redis-url", default="", help="use a local redis server instead of fakeredis"
+    )
+    parser.add_argument("--output", type=Path, help="also write the report here")
+    args = parser.parse_args()
+
+    with FakeGeminiServer(latency=args.gemini_latency) as server:
+        settings.GEMINI_BASE_URL = server.base_url
+        scenarios = asyncio.run(_bench(args))
+
+    report = {
+        "config": {
+            "users": args.users,
+            "gemini_latency_s": args.gemini_latency,
+            "firestore_latency_s": args.firestore_latency,
+            "redis": args.redis_url or "fakeredis",
+            "python": platform.python_version(),
+        },
+        "scenarios": scenarios,
+    }
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        args.output.write_text(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
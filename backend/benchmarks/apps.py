@@ -0,0 +1,96 @@
+"""
+App and metric helpers shared by the benchmarks that drive the session routes.
+"""
+
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+
+import httpx
+from fastapi import FastAPI
+from prometheus_client import REGISTRY
+
+from app.api import session_router
+from app.utils.auth import verify_firebase_token
+from app.utils.chat import GeminiClient, MoodAnalyzer
+from app.utils.coalesce import MessageCoalescer
+from app.utils.idempotency import IdempotentRequests
+from app.utils.redis import RedisService
+from app.utils.results import ResultListener
+from benchmarks.fake_firebase import fake_uid
+
+
+def counter(name: str, labels: dict[str, str] | None = None) -> float:
+    """
+    The current value of a prometheus sample, 0 if it wasn't recorded yet.
+    """
+    return REGISTRY.get_sample_value(name, labels or {}) or 0.0
+
+
+def gemini_calls(outcome: str = "ok") -> float:
+    """
+    The gemini ``generate_content`` calls made so far with ``outcome``.
+    """
+    return counter(
+        "manas_operation_duration_seconds_count",
+        {"component": "gemini", "operation": "generate_content", "outcome": outcome},
+    )
+
+
+def session_app(redis_service: RedisService, gemini_client: GeminiClient) -> FastAPI:
+    """
+    An app serving the session routes on the given services, with the fake
+    firebase auth and without coalescing or idempotency keys. Set other state,
+    e.g. ``firestore_db``, on the returned app.
+    """
+    app = FastAPI()
+    app.include_router(session_router, prefix="/api/v1")
+    app.dependency_overrides[verify_firebase_token] = fake_uid
+    app.state.redis_service = redis_service
+    app.state.gemini_client = gemini_client
+    app.state.mood_analyzer = MoodAnalyzer(gemini_client)
+    app.state.message_coalescer = None
+    app.state.idempotent_requests = None
+    return app
+
+
+@asynccontextmanager
+async def worker_clients(
+    redis_service: RedisService,
+    gemini_client: GeminiClient,
+    workers: int = 2,
+    *,
+    coalesce: bool = False,
+    idempotency: bool = False,
+) -> AsyncIterator[list[httpx.AsyncClient]]:
+    """
+    Clients of ``workers`` apps sharing one redis, standing in for the workers
+    of a deployment. Each app has a result listener of its own, like a worker.
+
+    Example:
+        async with worker_clients(redis_service, gemini_client) as clients:
+            await clients[0].post("/api/v1/process", ...)
+    """
+    apps, clients, listeners = [], [], []
+    for _ in range(workers):
+        app = session_app(redis_service, gemini_client)
+        listener = ResultListener(redis_service)
+        if coalesce or idempotency:
+            await listener.start()
+            listeners.append(listener)
+        if coalesce:
+            app.state.message_coalescer = MessageCoalescer(redis_service, listener)
+        if idempotency:
+            app.state.idempotent_requests = IdempotentRequests(redis_service, listener)
+        apps.append(app)
+        clients.append(
+            httpx.AsyncClient(
+                transport=httpx.ASGITransport(app=app), base_url="http://bench"
+            )
+        )
+    try:
+        yield clients
+    finally:
+        for client in clients:
+            await client.aclose()
+        for listener in listeners:
+            await listener.stop()
@@ -0,0 +1,118 @@
+"""
+Benchmark of building a gemini client per request against sharing one.
+
+Runs ``MoodAnalyzer.analyze_async`` against the fake gemini server served over
+TLS, once with a new ``genai.Client`` for every request, as the analyzers used
+to do, and once with the lifespan scoped ``GeminiClient`` whose transport keeps
+its connections alive. Reports per request latency, requests per second and
+the CPU time spent on the event loop thread per request, which is where client
+construction and TLS handshakes happen.
+
+The fake server only speaks HTTP/1.1, so the shared client negotiates that
+through ALPN instead of HTTP/2; the saving measured is the handshake and client
+construction, not multiplexing.
+
+Usage:
+    python -m benchmarks.client_reuse --latency 0.05 --requests 200 --concurrency 1,16
+"""
+
+import argparse
+import asyncio
+import copy
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+
+from google import genai
+from google.genai.types import HttpOptions
+
+from app.config.settings import settings
+from app.utils.chat import GeminiClient, MoodAnalyzer
+from benchmarks.fake_gemini import FakeGeminiServer, self_signed_certificate
+from benchmarks.stats import LoopLagMonitor, percentiles
+
+TEXT = "I finally finished the project I was stressing about."
+
+
+def _per_request_analyzer(shared: MoodAnalyzer) -> MoodAnalyzer:
+    # a genai client of its own, but the shared gemini slots and the same
+    # cached system instruction
+    gemini_client = copy.copy(shared._gemini)  # noqa: SLF001
+    gemini_client.client = genai.Client(
+        api_key=settings.GEMINI_API_KEY,
+        http_options=HttpOptions(base_url=settings.GEMINI_BASE_URL),
+    )
+    analyzer = MoodAnalyzer(gemini_client)
+    analyzer._prompt_cache = shared._prompt_cache  # noqa: SLF001
+    return analyzer
+
+
+async def _run(mode: str, requests: int, concurrency: int) -> dict:
+    gemini_client = GeminiClient()
+    shared = MoodAnalyzer(gemini_client)
+    # one request up front so the prompt cache handle exists for both modes
+    await shared.analyze_async(text=TEXT, history=[])
+
+    slots = asyncio.Semaphore(concurrency)
+    samples: list[float] = []
+
+    async def _one() -> None:
+        async with slots:
+            started = time.perf_counter()
+            analyzer = (
+                _per_request_analyzer(shared) if mode == "per_request" else shared
+            )
+            await analyzer.analyze_async(text=TEXT, history=[])
+            samples.append((time.perf_counter() - started) * 1000)
+
+    async with LoopLagMonitor() as lag:
+        cpu = time.thread_time()
+        started = time.perf_counter()
+        await asyncio.gather(*(_one() for _ in range(requests)))
+        elapsed = time.perf_counter() - started
+        cpu = time.thread_time() - cpu
+
+    await gemini_client.close()
+    return {
+        "mode": mode,
+        "concurrency": concurrency,
+        "requests_per_second": round(requests / elapsed, 2),
+        "loop_cpu_ms_per_request": round(cpu / requests * 1000, 2),
+        **percentiles(samples),
+        **lag.result(),
+    }
+
+
+async def _bench(requests: int, levels: list[int]) -> list[dict]:
+    return [
+        await _run(mode, requests, level)
+        for level in levels
+        for mode in ("per_request", "shared")
+    ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", default="1,16")
+    args = parser.parse_args()
+    levels = [int(level) for level in args.concurrency.split(",")]
+
+    with tempfile.TemporaryDirectory() as directory:
+        certificate = str(self_signed_certificate(Path(directory)))
+        # trusted by both genai.Client and GeminiClient
+        os.environ["SSL_CERT_FILE"] = certificate
+        with FakeGeminiServer(
+            latency=args.latency, certfile=certificate, keyfile=certificate
+        ) as server:
+            settings.GEMINI_BASE_URL = server.base_url
+            results = asyncio.run(_bench(args.requests, levels))
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Benchmark of coalescing rapid-fire messages into one gemini request.
+
+Simulated users each send a burst of short messages to ``/process``, a fixed
+gap apart, with coalescing off and on. The messages of a user alternate
+between two app instances sharing one redis, standing in for two workers, so
+batches are coordinated across them. Reports gemini calls per message, burst
+latency, and checks that every request of a batch got the same reply and that
+each batch was stored as one turn holding its messages in order.
+
+Usage:
+    python -m benchmarks.coalesce_bench --users 20 --burst 4 --gap 0.3
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+
+from app.config.settings import settings
+from app.utils.chat import GeminiClient
+from benchmarks.apps import counter, gemini_calls, worker_clients
+from benchmarks.fake_gemini import FakeGeminiServer
+from benchmarks.fake_redis import FakeRedisService
+from benchmarks.stats import percentiles
+
+
+async def _burst(
+    clients: list[httpx.AsyncClient], uid: str, burst: int, gap: float
+) -> tuple[float, list[dict]]:
+    async def _send(i: int) -> dict:
+        await asyncio.sleep(i * gap)
+        response = await clients[i % len(clients)].post(
+            "/api/v1/process",
+            params={
+                "text": f"quick message {i} from {uid}",
+                "timestamp": f"2025-01-01T10:00:{i:02d}",
+            },
+            headers={"Authorization": f"Bearer {uid}"},
+        )
+        response.raise_for_status()
+        return response.json()
+
+    started = time.perf_counter()
+    replies = await asyncio.gather(*(_send(i) for i in range(burst)))
+    return (time.perf_counter() - started) * 1000, replies
+
+
+async def _run(users: int, burst: int, gap: float, *, coalesce: bool) -> dict:
+    redis_service = FakeRedisService()
+    gemini_client = GeminiClient()
+    async with worker_clients(
+        redis_service, gemini_client, coalesce=coalesce
+    ) as clients:
+        calls = gemini_calls()
+        saved = counter("manas_gemini_calls_saved_total")
+        uids = [f"user-{i}" for i in range(users)]
+        bursts = await asyncio.gather(
+            *(_burst(clients, uid, burst, gap) for uid in uids)
+        )
+        calls = gemini_calls() - calls
+        saved = counter("manas_gemini_calls_saved_total") - saved
+
+        # the history is written by a background task after each response
+        await asyncio.sleep(0.2)
+    for uid, (_, replies) in zip(uids, bursts, strict=True):
+        history, moods = await redis_service.get_session(uid)
+        texts = [text for message in history for text in message.message.split("\n")]
+        if texts != [f"quick message {i} from {uid}" for i in range(burst)]:
+            raise SystemExit(f"{uid}: history out of order {texts}")
+        if {mood.reply for mood in moods} != {reply["reply"] for reply in replies}:
+            raise SystemExit(f"{uid}: replies do not match the stored turns")
+
+    await gemini_client.close()
+    await redis_service.close()
+
+    messages = users * burst
+    return {
+        "coalesce": coalesce,
+        "messages": messages,
+        "gemini_calls": int(calls),
+        "gemini_calls_saved": int(saved),
+        "gemini_calls_per_message": round(calls / messages, 2),
+        "burst_ms": percentiles([ms for ms, _ in bursts]),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--burst", type=int, default=4)
+    parser.add_argument("--gap", type=float, default=0.3)
+    parser.add_argument("--latency", type=float, default=0.5)
+    args = parser.parse_args()
+
+    with FakeGeminiServer(latency=args.latency) as server:
+        settings.GEMINI_BASE_URL = server.base_url
+        results = [
+            asyncio.run(_run(args.users, args.burst, args.gap, coalesce=coalesce))
+            for coalesce in (False, True)
+        ]
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Microbenchmark of the session entry codecs stored in redis.
+
+Encodes and decodes a session of messages and moods with the original
+per-entry pydantic JSON path, two lists of messages and moods, and as one list
+of turns with the JSON and msgpack codecs, decoded in bulk. Reports bytes per
+message and mood pair and encode/decode throughput in pairs per second.
+
+Usage:
+    python -m benchmarks.codec_bench --messages 50 --rounds 200
+"""
+
+import argparse
+import json
+import time
+from collections.abc import Callable
+from datetime import datetime, timedelta, timezone
+
+from app.models.chat import ConversationMessage, MoodAnalysisResult
+from app.models.enums import MoodCategory
+from app.utils.codec import JsonCodec, MsgpackCodec, decode_turns
+
+
+def _session(
+    messages: int,
+) -> tuple[list[ConversationMessage], list[MoodAnalysisResult]]:
+    started = datetime(2025, 9, 11, 14, 20, tzinfo=timezone.utc)
+    moods = list(MoodCategory)
+    return (
+        [
+            ConversationMessage(
+                message=f"Message {i}: today was long and I keep thinking about it.",
+                reply=f"Reply {i}: that sounds like a lot, what stayed with you most?",
+                timestamp=started + timedelta(seconds=40 * i),
+            )
+            for i in range(messages)
+        ],
+        [
+            MoodAnalysisResult(
+                mood=moods[i % len(moods)],
+                confidence=80,
+                reply=f"Reply {i}: that sounds like a lot, what stayed with you most?",
+            )
+            for i in range(messages)
+        ],
+    )
+
+
+def _rate(func: Callable[[], object], rounds: int, pairs: int) -> float:
+    started = time.perf_counter()
+    for _ in range(rounds):
+        func()
+    return round(rounds * pairs / (time.perf_counter() - started), 1)
+
+
+def _bench(messages: int, rounds: int) -> list[dict]:
+    history, moods = _session(messages)
+    results = []
+
+    def _pydantic_encode() -> tuple[list[bytes], list[bytes]]:
+        return (
+            [m.model_dump_json().encode() for m in history],
+            [m.model_dump_json().encode() for m in moods],
+        )
+
+    encoded_history, encoded_moods = _pydantic_encode()
+    results.append(
+        {
+            "format": "json, per entry (original)",
+            "bytes_per_pair": sum(map(len, encoded_history + encoded_moods)) / messages,
+            "encode_pairs_per_second": _rate(_pydantic_encode, rounds, messages),
+            "decode_pairs_per_second": _rate(
+                lambda: (
+                    list(map(ConversationMessage.model_validate_json, encoded_history)),
+                    list(map(MoodAnalysisResult.model_validate_json, encoded_moods)),
+                ),
+                rounds,
+                messages,
+            ),
+        }
+    )
+
+    for codec in (JsonCodec(), MsgpackCodec()):
+
+        def _encode(codec: JsonCodec | MsgpackCodec = codec) -> list[bytes]:
+            return list(map(codec.encode_turn, history, moods))
+
+        encoded = _encode()
+        assert decode_turns(encoded) == (history, moods)  # noqa: S101
+        results.append(
+            {
+                "format": f"{codec.name} turns, bulk decode",
+                "bytes_per_pair": sum(map(len, encoded)) / messages,
+                "encode_pairs_per_second": _rate(_encode, rounds, messages),
+                "decode_pairs_per_second": _rate(
+                    lambda entries=encoded: decode_turns(entries), rounds, messages
+                ),
+            }
+        )
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--messages", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+    print(json.dumps(_bench(args.messages, args.rounds), indent=2))
+
+
+if __name__ == "__main__":
+    main()
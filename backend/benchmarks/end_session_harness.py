@@ -0,0 +1,213 @@
+"""
+Local harness for the asynchronous end-session pipeline.
+
+Simulated users chat through ``/process`` and then call ``/end-session``. The
+jobs are run by ``SessionJobWorker`` against the fake gemini server, which fails a
+share of the requests, an in-memory Firestore and fakeredis. The harness checks
+that every job settles, that each finished job stored exactly one session, and
+that re-running or recovering a finished job does not store it again.
+
+Jobs are run by workers standing in for separate processes, each with a lease
+of its own. One of them hangs on every job it claims and is killed once the
+sessions are ended, and another one is started while jobs are running. The
+harness checks that no job ever runs on two workers at once, and that the jobs
+of the killed worker are recovered once its lease expires.
+
+Usage:
+    python -m benchmarks.end_session_harness --users 20 --error-rate 0.2
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from collections import Counter
+from http import HTTPStatus
+
+import httpx
+
+from app.config.settings import settings
+from app.utils.chat import GeminiClient, SessionAnalyzer
+from app.utils.jobs import SessionJobLease, SessionJobWorker
+from app.utils.redis import RedisService
+from benchmarks.apps import session_app
+from benchmarks.fake_firestore import FakeFirestore
+from benchmarks.fake_gemini import FakeGeminiServer
+from benchmarks.fake_redis import FakeRedisService
+
+
+class _TrackedWorker(SessionJobWorker):
+    """
+    A ``SessionJobWorker`` that counts the runs of a job that overlap another.
+    """
+
+    running: Counter[str] = Counter()
+    overlaps = 0
+
+    async def process(self, job_id: str) -> None:
+        if self.running[job_id]:
+            _TrackedWorker.overlaps += 1
+        self.running[job_id] += 1
+        try:
+            await super().process(job_id)
+        finally:
+            self.running[job_id] -= 1
+
+
+class _HangingAnalyzer:
+    async def summarize_async(self, *_: object) -> None:
+        await asyncio.Event().wait()
+
+
+async def _start_worker(
+    redis_service: RedisService,
+    firestore_db: FakeFirestore,
+    session_analyzer: SessionAnalyzer | _HangingAnalyzer,
+) -> tuple[SessionJobLease, _TrackedWorker]:
+    lease = SessionJobLease(redis_service)
+    await lease.start()
+    worker = _TrackedWorker(
+        redis_service,
+        firestore_db,
+        session_analyzer,  # pyright: ignore[reportArgumentType]
+        lease,
+    )
+    await worker.start()
+    return lease, worker
+
+
+async def _kill(lease: SessionJobLease, worker: SessionJobWorker) -> None:
+    # like a killed process: the jobs stay claimed and the lease is not renewed
+    tasks = [*worker._tasks, lease._task]  # noqa: SLF001
+    for task in tasks:
+        task.cancel()  # pyright: ignore[reportOptionalMemberAccess]
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def _user_session(
+    client: httpx.AsyncClient, uid: str, messages: int
+) -> tuple[str, float]:
+    headers = {"Authorization": f"Bearer {uid}"}
+    for i in range(messages):
+        # the fake gemini fails some requests, retry them like the app would
+        for _ in range(10):
+            response = await client.post(
+                "/api/v1/process",
+                params={
+                    "text": f"message {i} from {uid}",
+                    "timestamp": "2025-01-01T10:00:00",
+                },
+                headers=headers,
+            )
+            if response.is_success:
+                break
+        response.raise_for_status()
+
+    started = time.perf_counter()
+    response = await client.post("/api/v1/end-session", headers=headers)
+    end_session_ms = (time.perf_counter() - started) * 1000
+    if response.status_code != HTTPStatus.ACCEPTED:
+        raise SystemExit(f"end-session returned {response.status_code}")
+    return response.json()["job_id"], end_session_ms
+
+
+async def _wait_for_job(
+    client: httpx.AsyncClient, uid: str, job_id: str, timeout: float
+) -> dict:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        response = await client.get(
+            f"/api/v1/end-session/{job_id}", headers={"Authorization": f"Bearer {uid}"}
+        )
+        job = response.json()
+        if job["status"] in ("done", "failed"):
+            return job
+        await asyncio.sleep(0.1)
+    raise SystemExit(f"job {job_id} did not settle in {timeout}s")
+
+
+async def _run(users: int, messages: int, timeout: float) -> dict:
+    redis_service = FakeRedisService()
+    gemini_client = GeminiClient()
+    app = session_app(redis_service, gemini_client)
+    firestore_db = app.state.firestore_db = FakeFirestore()
+    session_analyzer = app.state.session_analyzer = SessionAnalyzer(gemini_client)
+    workers = [await _start_worker(redis_service, firestore_db, session_analyzer)]
+    hung = await _start_worker(redis_service, firestore_db, _HangingAnalyzer())
+
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        uids = [f"user-{i}" for i in range(users)]
+        started = await asyncio.gather(
+            *(_user_session(client, uid, messages) for uid in uids)
+        )
+        # a worker starting must leave the jobs of running ones alone
+        workers.append(
+            await _start_worker(redis_service, firestore_db, session_analyzer)
+        )
+        await asyncio.sleep(0.5)
+        held = sum(_TrackedWorker.running.values())
+        await _kill(*hung)
+        jobs = await asyncio.gather(
+            *(
+                _wait_for_job(client, uid, job_id, timeout)
+                for uid, (job_id, _) in zip(uids, started, strict=True)
+            )
+        )
+
+        # a finished job that shows up again must not store a second session
+        for job in jobs:
+            await workers[0][1].process(job["job_id"])
+
+    for lease, worker in workers:
+        await worker.stop()
+        await lease.stop()
+    await gemini_client.close()
+
+    documents = firestore_db.documents
+    for uid, job in zip(uids, jobs, strict=True):
+        stored = [
+            path for path in documents if path.startswith(f"users/{uid}/sessions/")
+        ]
+        expected = [f"users/{uid}/sessions/{job['job_id']}"]
+        if job["status"] == "done" and stored != expected:
+            raise SystemExit(f"{uid}: expected {expected}, found {stored}")
+        if job["status"] == "failed" and stored:
+            raise SystemExit(f"{uid}: failed job stored {stored}")
+    if _TrackedWorker.overlaps:
+        raise SystemExit(f"{_TrackedWorker.overlaps} jobs ran on two workers at once")
+
+    attempts = [job["attempts"] for job in jobs]
+    return {
+        "users": users,
+        "done": sum(job["status"] == "done" for job in jobs),
+        "failed": sum(job["status"] == "failed" for job in jobs),
+        "retried": sum(count > 1 for count in attempts),
+        "held_by_killed_worker": held,
+        "overlapping_runs": _TrackedWorker.overlaps,
+        "end_session_ms_p50": round(statistics.median(ms for _, ms in started), 2),
+        "end_session_ms_max": round(max(ms for _, ms in started), 2),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--messages", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--error-rate", type=float, default=0.2)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--lease", type=float, default=1.0)
+    args = parser.parse_args()
+    settings.SESSION_JOB_LEASE = args.lease
+
+    with FakeGeminiServer(latency=args.latency, error_rate=args.error_rate) as server:
+        settings.GEMINI_BASE_URL = server.base_url
+        result = asyncio.run(_run(args.users, args.messages, args.timeout))
+
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Local stand-ins for Firebase, used by the benchmarks.
+"""
+
+import json
+import time
+from types import SimpleNamespace
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from fastapi import Request
+
+
+def fake_firebase_credentials() -> str:
+    """
+    Build a syntactically valid service account, so ``firebase_admin`` can be
+    initialized without talking to Google.
+    """
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    )
+    return json.dumps(
+        {
+            "type": "service_account",
+            "project_id": "manas-bench",
+            "private_key_id": "bench",
+            "private_key": pem.decode(),
+            "client_email": "bench@manas-bench.iam.gserviceaccount.com",
+            "client_id": "1",
+            "token_uri": "https://oauth2.googleapis.com/token",
+        }
+    )
+
+
+def fake_uid(request: Request) -> str:
+    """
+    Stand-in for ``verify_firebase_token`` that takes the bearer token as uid.
+    """
+    return request.headers["Authorization"].removeprefix("Bearer ")
+
+
+class FakeAuth:
+    """
+    Stand-in for the user lookups of ``firebase_admin.auth``, blocking for
+    ``latency`` seconds like the remote call does and counting the calls.
+    """
+
+    def __init__(self, latency: float = 0.05) -> None:
+        self.latency = latency
+        self.calls = 0
+        self._names: dict[str, str] = {}
+
+    def get_user(self, uid: str) -> SimpleNamespace:
+        self.calls += 1
+        time.sleep(self.latency)
+        return SimpleNamespace(
+            email=f"{uid}@example.com",
+            display_name=self._names.get(uid, uid),
+            user_metadata=SimpleNamespace(
+                creation_timestamp=1_700_000_000_000,
+                last_sign_in_timestamp=1_750_000_000_000,
+            ),
+        )
+
+    def update_user(self, uid: str, display_name: str) -> SimpleNamespace:
+        self._names[uid] = display_name
+        return self.get_user(uid)
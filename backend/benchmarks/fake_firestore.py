@@ -0,0 +1,284 @@
+"""
+An in-memory stand-in for the async Firestore client, used by the benchmarks.
+
+Only the parts of the API the app uses are implemented: nested collections and
+documents, ``add``/``set``/``get``/``get_all``/``list_documents``, batched
+writes with the ``Increment`` and ``ArrayUnion`` transforms, transactions for
+``async_transactional``, and queries with ``order_by``, ``limit`` and
+``start_after``. Documents read are counted in ``reads``, like Firestore bills
+them.
+"""
+
+import asyncio
+import uuid
+from collections.abc import AsyncIterator
+from datetime import datetime, timezone
+from typing import Any
+
+from google.api_core.exceptions import Aborted
+from google.cloud.firestore import ArrayUnion, Increment
+
+DESCENDING = "DESCENDING"
+
+
+def _merge(current: dict[str, Any], data: dict[str, Any]) -> dict[str, Any]:
+    merged = dict(current)
+    for key, value in data.items():
+        if isinstance(value, dict):
+            merged[key] = _merge(merged.get(key) or {}, value)
+        elif isinstance(value, Increment):
+            merged[key] = merged.get(key, 0) + value.value
+        elif isinstance(value, ArrayUnion):
+            existing = list(merged.get(key) or [])
+            merged[key] = existing + [v for v in value.values if v not in existing]
+        else:
+            merged[key] = value
+    return merged
+
+
+class FakeSnapshot:
+    def __init__(self, reference: "FakeDocument", data: dict[str, Any] | None) -> None:
+        self.reference = reference
+        self.id = reference.id
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self) -> dict[str, Any] | None:
+        return dict(self._data) if self._data is not None else None
+
+
+class FakeDocument:
+    def __init__(self, store: "FakeFirestore", path: str) -> None:
+        self._store = store
+        self.path = path
+        self.id = path.rsplit("/", 1)[-1]
+
+    def collection(self, name: str) -> "FakeCollection":
+        return FakeCollection(self._store, f"{self.path}/{name}")
+
+    async def set(self, data: dict[str, Any], *, merge: bool = False) -> None:
+        await self._store.tick()
+        self._store.write(self, data, merge=merge)
+
+    async def get(self) -> FakeSnapshot:
+        await self._store.tick()
+        return self._store.read(self)
+
+
+class FakeQuery:
+    def __init__(
+        self,
+        collection: "FakeCollection",
+        orders: tuple[tuple[str, str], ...] = (),
+        limit: int | None = None,
+        start_after: dict[str, Any] | None = None,
+    ) -> None:
+        self._collection = collection
+        self._orders = orders
+        self._limit = limit
+        self._start_after = start_after
+
+    def order_by(self, field: str, direction: str = "ASCENDING") -> "FakeQuery":
+        return FakeQuery(
+            self._collection,
+            (*self._orders, (field, direction)),
+            self._limit,
+            self._start_after,
+        )
+
+    def limit(self, count: int) -> "FakeQuery":
+        return FakeQuery(self._collection, self._orders, count, self._start_after)
+
+    def start_after(self, values: dict[str, Any]) -> "FakeQuery":
+        return FakeQuery(self._collection, self._orders, self._limit, values)
+
+    @staticmethod
+    def _value(snapshot: FakeSnapshot, field: str) -> object:
+        if field == "__name__":
+            return snapshot.id
+        return (snapshot.to_dict() or {}).get(field)
+
+    async def stream(self) -> AsyncIterator[FakeSnapshot]:
+        await self._collection.store.tick()
+        snapshots = self._collection.snapshots()
+        for field, direction in reversed(self._orders):
+            snapshots.sort(
+                key=lambda s, f=field: self._value(s, f),
+                reverse=direction == DESCENDING,
+            )
+
+        if self._start_after is not None:
+            cursor = [self._start_after.get(field) for field, _ in self._orders]
+            for index, snapshot in enumerate(snapshots):
+                if [
+                    self._value(snapshot, field) for field, _ in self._orders
+                ] == cursor:
+                    snapshots = snapshots[index + 1 :]
+                    break
+
+        for snapshot in snapshots[: self._limit]:
+            self._collection.store.reads += 1
+            yield snapshot
+
+
+class FakeCollection(FakeQuery):
+    def __init__(self, store: "FakeFirestore", path: str) -> None:
+        super().__init__(self)
+        self.store = store
+        self.path = path
+
+    def document(self, document_id: str | None = None) -> FakeDocument:
+        return FakeDocument(
+            self.store, f"{self.path}/{document_id or uuid.uuid4().hex}"
+        )
+
+    async def add(self, data: dict[str, Any]) -> tuple[datetime, FakeDocument]:
+        document = self.document()
+        await document.set(data)
+        return datetime.now(timezone.utc), document
+
+    async def list_documents(self) -> AsyncIterator[FakeDocument]:
+        await self.store.tick()
+        depth = self.path.count("/") + 1
+        # like firestore, includes documents that only have subcollections
+        paths = {
+            "/".join(path.split("/")[: depth + 1])
+            for path in self.store.documents
+            if path.startswith(f"{self.path}/")
+        }
+        for path in sorted(paths):
+            yield FakeDocument(self.store, path)
+
+    def snapshots(self) -> list[FakeSnapshot]:
+        depth = self.path.count("/") + 1
+        return [
+            FakeSnapshot(FakeDocument(self.store, path), data)
+            for path, data in self.store.documents.items()
+            if path.startswith(f"{self.path}/") and path.count("/") == depth
+        ]
+
+
+class FakeWriteBatch:
+    def __init__(self, store: "FakeFirestore") -> None:
+        self._store = store
+        self._writes: list[tuple[FakeDocument, dict[str, Any] | None, bool]] = []
+
+    def set(
+        self, reference: FakeDocument, data: dict[str, Any], *, merge: bool = False
+    ) -> None:
+        self._writes.append((reference, data, merge))
+
+    def delete(self, reference: FakeDocument) -> None:
+        self._writes.append((reference, None, False))
+
+    async def commit(self) -> None:
+        # a single round trip for the whole batch
+        await self._store.tick()
+        self._apply()
+
+    def _apply(self) -> None:
+        for reference, data, merge in self._writes:
+            if data is None:
+                self._store.delete(reference)
+            else:
+                self._store.write(reference, data, merge=merge)
+        self._writes.clear()
+
+
+class FakeTransaction(FakeWriteBatch):
+    """
+    A transaction that commits only if no document it read was written since,
+    and is aborted otherwise, so ``async_transactional`` runs it again.
+    """
+
+    def __init__(self, store: "FakeFirestore", max_attempts: int = 5) -> None:
+        super().__init__(store)
+        self._id: bytes | None = None
+        self._read_only = False
+        self._max_attempts = max_attempts
+        self._read_versions: dict[str, int] = {}
+        self.attempts = 0
+
+    def _clean_up(self) -> None:
+        self._writes.clear()
+        self._read_versions.clear()
+        self._id = None
+
+    async def _begin(self, retry_id: bytes | None = None) -> None:  # noqa: ARG002
+        await self._store.tick()
+        self.attempts += 1
+        self._id = uuid.uuid4().bytes
+
+    def _record_read(self, reference: FakeDocument) -> None:
+        self._read_versions[reference.path] = self._store.versions.get(
+            reference.path, 0
+        )
+
+    async def _commit(self) -> None:
+        await self._store.tick()
+        if any(
+            self._store.versions.get(path, 0) != version
+            for path, version in self._read_versions.items()
+        ):
+            self._clean_up()
+            msg = "a document read by the transaction was written since"
+            raise Aborted(msg)
+        self._apply()
+        self._clean_up()
+
+    async def _rollback(self) -> None:
+        self._clean_up()
+
+
+class FakeFirestore:
+    """
+    In-memory async Firestore client.
+
+    Args:
+        latency: Seconds every read or write waits, to mimic the network.
+    """
+
+    def __init__(self, latency: float = 0.0) -> None:
+        self.documents: dict[str, dict[str, Any]] = {}
+        self.versions: dict[str, int] = {}
+        self.reads = 0
+        self._latency = latency
+
+    async def tick(self) -> None:
+        await asyncio.sleep(self._latency)
+
+    def read(self, reference: FakeDocument) -> FakeSnapshot:
+        self.reads += 1
+        return FakeSnapshot(reference, self.documents.get(reference.path))
+
+    def write(
+        self, reference: FakeDocument, data: dict[str, Any], *, merge: bool
+    ) -> None:
+        current = self.documents.get(reference.path, {}) if merge else {}
+        self.documents[reference.path] = _merge(current, data)
+        self.versions[reference.path] = self.versions.get(reference.path, 0) + 1
+
+    def delete(self, reference: FakeDocument) -> None:
+        self.documents.pop(reference.path, None)
+        self.versions[reference.path] = self.versions.get(reference.path, 0) + 1
+
+    async def get_all(
+        self,
+        references: list[FakeDocument],
+        transaction: FakeTransaction | None = None,
+    ) -> AsyncIterator[FakeSnapshot]:
+        # a single round trip for all of them
+        await self.tick()
+        for reference in references:
+            if transaction is not None:
+                transaction._record_read(reference)  # noqa: SLF001
+            yield self.read(reference)
+
+    def collection(self, name: str) -> FakeCollection:
+        return FakeCollection(self, name)
+
+    def batch(self) -> FakeWriteBatch:
+        return FakeWriteBatch(self)
+
+    def transaction(self, max_attempts: int = 5) -> FakeTransaction:
+        return FakeTransaction(self, max_attempts)
@@ -0,0 +1,264 @@
+"""
+A minimal stand-in for the Gemini REST API, used by the benchmarks.
+
+It answers ``generateContent`` and ``streamGenerateContent`` calls after a
+configurable delay with a canned response shaped like the real one, and keeps
+``cachedContents`` in memory, so the analyzers can be pointed at it through
+``GEMINI_BASE_URL`` and exercised without network access or quota.
+"""
+
+import asyncio
+import ipaddress
+import json
+import random
+import threading
+import time
+import uuid
+from collections.abc import AsyncIterator
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any
+
+import uvicorn
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from typing_extensions import Self
+
+MOOD_REPLY = {
+    "mood": "neutral",
+    "confidence": 80,
+    "reply": "Thanks for sharing that with me. How are you feeling about it now?",
+}
+SESSION_REPLY = {
+    "mood": "neutral",
+    "summary": "The user talked through their day and the AI listened supportively.",
+}
+
+
+def create_app(
+    latency: float = 0.5,
+    error_rate: float = 0.0,
+    malformed_rate: float = 0.0,
+    tail_rate: float = 0.0,
+    tail_latency: float = 0.0,
+    model_faults: dict[str, dict[str, float]] | None = None,
+    min_cache_tokens: int = 0,
+) -> FastAPI:
+    """
+    Create the fake gemini application.
+
+    Args:
+        latency: Seconds to wait before answering each request.
+        error_rate: Share of requests answered with a 503 instead.
+        malformed_rate: Share of requests answered with prose instead of JSON.
+        tail_rate: Share of requests answered after ``tail_latency`` instead
+            of ``latency``.
+        tail_latency: Seconds to wait before answering a slow request.
+        model_faults: Any of the above per model name, overriding the defaults
+            for requests to that model.
+        min_cache_tokens: Smallest system instruction, in tokens, accepted as
+            cached content; smaller ones are refused with a 400 like gemini's.
+    """
+    app = FastAPI()
+    cached_contents: dict[str, str] = {}
+    defaults = {
+        "latency": latency,
+        "error_rate": error_rate,
+        "malformed_rate": malformed_rate,
+        "tail_rate": tail_rate,
+        "tail_latency": tail_latency,
+    }
+
+    def _text(content: dict) -> str:
+        return "".join(part.get("text", "") for part in content.get("parts", []))
+
+    def _prompt_text(body: dict) -> str:
+        return "".join(_text(content) for content in body.get("contents", []))
+
+    def _cached_content(name: str, model: str, ttl: str) -> dict:
+        expire_time = datetime.now(timezone.utc) + timedelta(
+            seconds=float(ttl.removesuffix("s"))
+        )
+        return {
+            "name": name,
+            "model": model,
+            "expireTime": expire_time.isoformat(),
+            "usageMetadata": {"totalTokenCount": len(cached_contents[name]) // 4},
+        }
+
+    @app.post("/{api_version}/cachedContents")
+    async def create_cached_content(request: Request) -> JSONResponse:
+        body = await request.json()
+        text = _text(body.get("systemInstruction", {}))
+        if len(text) // 4 < min_cache_tokens:
+            message = (
+                f"Cached content is too small. total_token_count={len(text) // 4}, "
+                f"min_total_token_count={min_cache_tokens}"
+            )
+            return JSONResponse(
+                status_code=400,
+                content={
+                    "error": {
+                        "code": 400,
+                        "message": message,
+                        "status": "INVALID_ARGUMENT",
+                    }
+                },
+            )
+        name = f"cachedContents/{uuid.uuid4().hex}"
+        cached_contents[name] = text
+        return JSONResponse(
+            content=_cached_content(name, body["model"], body.get("ttl", "3600s"))
+        )
+
+    @app.patch("/{api_version}/cachedContents/{cache_id}")
+    async def update_cached_content(cache_id: str, request: Request) -> JSONResponse:
+        body = await request.json()
+        name = f"cachedContents/{cache_id}"
+        return JSONResponse(content=_cached_content(name, "", body.get("ttl", "3600s")))
+
+    def _response(text: str, prompt_tokens: int, cached_tokens: int = 0) -> dict:
+        return {
+            "candidates": [
+                {
+                    "content": {"role": "model", "parts": [{"text": text}]},
+                    "finishReason": "STOP",
+                }
+            ],
+            "usageMetadata": {
+                "promptTokenCount": prompt_tokens,
+                "cachedContentTokenCount": cached_tokens,
+                "candidatesTokenCount": 32,
+                "totalTokenCount": prompt_tokens + 32,
+            },
+        }
+
+    @app.post("/{api_version}/models/{target}")
+    async def generate_content(target: str, request: Request) -> Response:
+        faults = {**defaults, **(model_faults or {}).get(target.partition(":")[0], {})}
+        latency = faults["latency"]
+        if random.random() < faults["tail_rate"]:  # noqa: S311
+            latency = faults["tail_latency"]
+        body = await request.json()
+        cached = cached_contents.get(body.get("cachedContent", ""), "")
+        instruction = cached or _text(body.get("systemInstruction", {}))
+        prompt = _prompt_text(body)
+        prompt_tokens = (len(instruction) + len(prompt)) // 4
+        cached_tokens = len(cached) // 4
+        reply = SESSION_REPLY if "Session Analysis" in instruction else MOOD_REPLY
+        text = json.dumps(reply)
+        if random.random() < faults["malformed_rate"]:  # noqa: S311
+            text = "I'm sorry, I can't put that into the requested format."
+
+        if random.random() < faults["error_rate"]:  # noqa: S311
+            await asyncio.sleep(latency)
+            return JSONResponse(
+                status_code=503,
+                content={"error": {"code": 503, "message": "overloaded"}},
+            )
+
+        if not target.endswith(":streamGenerateContent"):
+            await asyncio.sleep(latency)
+            return JSONResponse(content=_response(text, prompt_tokens, cached_tokens))
+
+        async def _chunks() -> AsyncIterator[str]:
+            # the first chunk arrives after a fraction of the latency and the
+            # rest is spread over the remaining time, like a real stream
+            pieces = [text[i : i + 16] for i in range(0, len(text), 16)]
+            await asyncio.sleep(latency / 4)
+            for piece in pieces:
+                chunk = _response(piece, prompt_tokens, cached_tokens)
+                yield f"data: {json.dumps(chunk)}\n\n"
+                await asyncio.sleep(latency * 3 / 4 / len(pieces))
+
+        return StreamingResponse(_chunks(), media_type="text/event-stream")
+
+    return app
+
+
+def self_signed_certificate(directory: Path, host: str = "127.0.0.1") -> Path:
+    """
+    Write a self-signed certificate and key for ``host`` into ``directory``.
+
+    Returns:
+        Path: The PEM file holding both, usable as certfile, keyfile and CA file.
+    """
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, host)])
+    now = datetime.now(timezone.utc)
+    certificate = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - timedelta(minutes=5))
+        .not_valid_after(now + timedelta(days=1))
+        .add_extension(
+            x509.SubjectAlternativeName([x509.IPAddress(ipaddress.ip_address(host))]),
+            critical=False,
+        )
+        .add_extension(x509.BasicConstraints(ca=True, path_length=None), critical=True)
+        .sign(key, hashes.SHA256())
+    )
+    path = directory / "fake_gemini.pem"
+    path.write_bytes(
+        certificate.public_bytes(serialization.Encoding.PEM)
+        + key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption(),
+        )
+    )
+    return path
+
+
+class FakeGeminiServer:
+    """
+    Run the fake gemini application on a background thread.
+
+    Pass a ``certfile`` and ``keyfile``, e.g. from :func:`self_signed_certificate`,
+    to serve over TLS. Other keyword arguments, e.g. ``malformed_rate`` or
+    ``model_faults``, are passed on to :func:`create_app`.
+
+    Example:
+        with FakeGeminiServer(latency=0.2) as server:
+            os.environ["GEMINI_BASE_URL"] = server.base_url
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.5,
+        error_rate: float = 0.0,
+        host: str = "127.0.0.1",
+        port: int = 8765,
+        certfile: str | None = None,
+        keyfile: str | None = None,
+        **faults: Any,
+    ) -> None:
+        scheme = "https" if certfile else "http"
+        self.base_url = f"{scheme}://{host}:{port}"
+        config = uvicorn.Config(
+            create_app(latency, error_rate, **faults),
+            host=host,
+            port=port,
+            log_level="warning",
+            ssl_certfile=certfile,
+            ssl_keyfile=keyfile,
+        )
+        self._server = uvicorn.Server(config)
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+
+    def __enter__(self) -> Self:
+        self._thread.start()
+        while not self._server.started:
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        self._server.should_exit = True
+        self._thread.join()
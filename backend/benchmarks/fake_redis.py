@@ -0,0 +1,32 @@
+"""
+A fakeredis backed ``RedisService``, used by the benchmarks.
+"""
+
+import asyncio
+
+from fakeredis import FakeAsyncRedis
+from redis.asyncio import Redis
+
+from app.utils.redis import RedisService
+
+
+class FakeRedisService(RedisService):
+    """
+    ``RedisService`` on fakeredis, or on a local redis server when a url is given.
+
+    fakeredis serves blocking commands by blocking the event loop, so jobs are
+    claimed with a minimal timeout and the wait happens between polls instead.
+    """
+
+    def __init__(self, url: str = "") -> None:
+        self._fake = not url
+        client = FakeAsyncRedis() if self._fake else Redis.from_url(url)
+        super().__init__(client)
+
+    async def claim_session_job(self, owner: str, timeout: float) -> str | None:
+        if not self._fake:
+            return await super().claim_session_job(owner, timeout)
+        job_id = await super().claim_session_job(owner, 0.001)
+        if job_id is None:
+            await asyncio.sleep(0.05)
+        return job_id
@@ -0,0 +1,106 @@
+"""
+Load test for the gemini call path of ``MoodAnalyzer``.
+
+Runs a batch of ``analyze`` calls at several concurrency levels against the fake
+gemini server and reports throughput for the blocking and the async client path,
+together with the event loop lag observed while the batch was running.
+
+With ``--malformed-rate`` the fake server answers a share of requests with prose
+instead of JSON, and the report ends with the parse outcomes and retries.
+
+Usage:
+    python -m benchmarks.gemini_load --latency 0.2 --requests 256
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import time
+from collections.abc import Awaitable, Callable
+
+from app.config.settings import settings
+from app.utils.chat import GeminiClient, MalformedOutputError, MoodAnalyzer
+from app.utils.metrics import GEMINI_OUTPUT_PARSE, GEMINI_OUTPUT_RETRIES
+from benchmarks.fake_gemini import FakeGeminiServer
+from benchmarks.stats import LoopLagMonitor
+
+
+async def _run_batch(
+    call: Callable[[], Awaitable[object]], requests: int, concurrency: int
+) -> dict:
+    slots = asyncio.Semaphore(concurrency)
+
+    async def _one() -> None:
+        async with slots:
+            await call()
+
+    async with LoopLagMonitor() as lag:
+        started = time.perf_counter()
+        await asyncio.gather(*(_one() for _ in range(requests)))
+        elapsed = time.perf_counter() - started
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "seconds": round(elapsed, 3),
+        "requests_per_second": round(requests / elapsed, 2),
+        **lag.result(),
+    }
+
+
+async def _bench(requests: int, levels: list[int], sync_requests: int) -> list[dict]:
+    gemini_client = GeminiClient()
+    analyzer = MoodAnalyzer(gemini_client)
+    text = "I finally finished the project I was stressing about."
+    results = []
+
+    async def _blocking() -> None:
+        with contextlib.suppress(MalformedOutputError):
+            analyzer.analyze(text=text, history=[])
+
+    async def _async() -> None:
+        with contextlib.suppress(MalformedOutputError):
+            await analyzer.analyze_async(text=text, history=[])
+
+    for level in levels:
+        row = await _run_batch(_blocking, min(sync_requests, requests), level)
+        results.append({"path": "blocking", **row})
+        row = await _run_batch(_async, requests, level)
+        results.append({"path": "async", **row})
+    await gemini_client.close()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--requests", type=int, default=256)
+    parser.add_argument(
+        "--sync-requests",
+        type=int,
+        default=16,
+        help="requests per level for the blocking path, which runs serially",
+    )
+    parser.add_argument("--concurrency", default="1,8,64,256")
+    parser.add_argument("--malformed-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    levels = [int(level) for level in args.concurrency.split(",")]
+
+    with FakeGeminiServer(
+        latency=args.latency, malformed_rate=args.malformed_rate
+    ) as server:
+        settings.GEMINI_BASE_URL = server.base_url
+        results = asyncio.run(_bench(args.requests, levels, args.sync_requests))
+
+    outcomes = {
+        outcome: GEMINI_OUTPUT_PARSE.labels("mood", outcome)._value.get()  # noqa: SLF001
+        for outcome in ("valid", "repaired", "failed")
+    }
+    outcomes["retries"] = GEMINI_OUTPUT_RETRIES.labels("mood")._value.get()  # noqa: SLF001
+    results.append({"parse": outcomes})
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""
+Benchmark of answering retried ``/process`` requests from their first attempt.
+
+Simulated users send messages one after the other, and every message is sent
+again ``--copies - 1`` times, ``--gap`` seconds apart, like a client retrying
+after its connection dropped. With the default gap and gemini latency the
+first retry arrives while the first attempt is still running and the next one
+after it completed. Copies alternate between two app instances sharing one
+redis, standing in for two workers. Half of the users send an
+``Idempotency-Key`` header, the others rely on the key derived from the
+message.
+
+Runs with idempotency keys off and on, and reports the gemini calls, the
+duplicates answered without one, by whether the first attempt was in flight
+or completed, and the turns stored per user. With keys on, checks that every
+copy of a message got the same reply and that each message was stored once.
+
+Usage:
+    python -m benchmarks.idempotency_bench --users 20 --messages 5 --copies 3
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from uuid import uuid4
+
+import httpx
+
+from app.config.settings import settings
+from app.utils.chat import GeminiClient
+from benchmarks.apps import counter, gemini_calls, worker_clients
+from benchmarks.fake_gemini import FakeGeminiServer
+from benchmarks.fake_redis import FakeRedisService
+from benchmarks.stats import percentiles
+
+
+def _duplicates(state: str) -> float:
+    return counter("manas_duplicate_requests_total", {"state": state})
+
+
+async def _message(
+    clients: list[httpx.AsyncClient],
+    uid: str,
+    i: int,
+    copies: int,
+    gap: float,
+    *,
+    send_key: bool,
+) -> list[str]:
+    headers = {"Authorization": f"Bearer {uid}"}
+    if send_key:
+        headers["Idempotency-Key"] = uuid4().hex
+
+    async def _send(copy: int) -> str:
+        await asyncio.sleep(copy * gap)
+        response = await clients[copy % len(clients)].post(
+            "/api/v1/process",
+            params={
+                "text": f"message number {i} from {uid}",
+                "timestamp": f"2025-01-01T10:{i // 60:02d}:{i % 60:02d}",
+            },
+            headers=headers,
+        )
+        response.raise_for_status()
+        return response.json()["reply"]
+
+    return await asyncio.gather(*(_send(copy) for copy in range(copies)))
+
+
+async def _user(
+    clients: list[httpx.AsyncClient],
+    uid: str,
+    args: argparse.Namespace,
+    *,
+    send_key: bool,
+) -> tuple[float, list[list[str]]]:
+    started = time.perf_counter()
+    replies = [
+        await _message(clients, uid, i, args.copies, args.gap, send_key=send_key)
+        for i in range(args.messages)
+    ]
+    return (time.perf_counter() - started) * 1000, replies
+
+
+async def _run(args: argparse.Namespace, *, idempotency: bool) -> dict:
+    redis_service = FakeRedisService()
+    gemini_client = GeminiClient()
+    async with worker_clients(
+        redis_service, gemini_client, idempotency=idempotency
+    ) as clients:
+        calls = gemini_calls()
+        in_flight, completed = _duplicates("in_flight"), _duplicates("completed")
+        uids = [f"user-{i}" for i in range(args.users)]
+        users = await asyncio.gather(
+            *(
+                _user(clients, uid, args, send_key=i % 2 == 0)
+                for i, uid in enumerate(uids)
+            )
+        )
+        calls = gemini_calls() - calls
+        in_flight = _duplicates("in_flight") - in_flight
+        completed = _duplicates("completed") - completed
+
+        # the history is written by a background task after each response
+        await asyncio.sleep(0.2)
+    turns = []
+    for uid, (_, replies) in zip(uids, users, strict=True):
+        history, moods = await redis_service.get_session(uid)
+        turns.append(len(history))
+        if not idempotency:
+            continue
+        if any(len(set(copies)) != 1 for copies in replies):
+            raise SystemExit(f"{uid}: copies of a message got different replies")
+        texts = [message.message for message in history]
+        if texts != [f"message number {i} from {uid}" for i in range(args.messages)]:
+            raise SystemExit(f"{uid}: messages stored more than once {texts}")
+        if [mood.reply for mood in moods] != [copies[0] for copies in replies]:
+            raise SystemExit(f"{uid}: replies do not match the stored turns")
+
+    await gemini_client.close()
+    await redis_service.close()
+
+    messages = args.users * args.messages
+    return {
+        "idempotency": idempotency,
+        "messages": messages,
+        "requests": messages * args.copies,
+        "gemini_calls": int(calls),
+        "duplicates_suppressed": {
+            "in_flight": int(in_flight),
+            "completed": int(completed),
+        },
+        "turns_stored_per_user": sum(turns) / len(turns),
+        "user_ms": percentiles([ms for ms, _ in users]),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--messages", type=int, default=5)
+    parser.add_argument("--copies", type=int, default=3)
+    parser.add_argument("--gap", type=float, default=0.4)
+    parser.add_argument("--latency", type=float, default=0.5)
+    args = parser.parse_args()
+
+    with FakeGeminiServer(latency=args.latency) as server:
+        settings.GEMINI_BASE_URL = server.base_url
+        results = [
+            asyncio.run(_run(args, idempotency=idempotency))
+            for idempotency in (False, True)
+        ]
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""
+Benchmark and consistency check of the incrementally kept mood statistics.
+
+Stores sessions of random moods, spread over more than a year and in random
+order, for a number of users in an in-memory Firestore. Sessions are stored
+the way the job worker stores them and in batches of many users like the idle
+session sweeper, and some are stored again by two concurrent attempts with
+other moods, like a job retried after its transaction was committed while
+the first attempt was still running.
+
+Then checks the statistics against a brute-force recomputation from all the
+sessions, with ``app.backfill_mood_stats --verify`` and by comparing the
+``/mood-stats`` totals and streaks to a scan of every session, and rebuilds
+them from scratch with the backfill. Reports the mismatches and the
+documents read and latency of ``/mood-stats`` against the scan it replaces,
+as JSON, and exits with an error if the statistics of any user differ from
+the recomputation.
+
+Usage:
+    python -m benchmarks.mood_stats_bench --users 20 --sessions 300
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import Counter
+from datetime import date, datetime, timedelta
+
+import httpx
+
+from app.backfill_mood_stats import backfill
+from app.config.settings import settings
+from app.main import app
+from app.models.enums import MoodCategory, MoodStatsPeriod, MoodStatsRange
+from app.models.session import SessionJob, SessionModel
+from app.utils.auth import verify_firebase_token
+from app.utils.jobs import _store_sessions
+from app.utils.mood_stats import RANGES, STATS_COLLECTION, period_start, streaks
+from benchmarks.fake_firebase import fake_uid
+from benchmarks.fake_firestore import FakeFirestore
+from benchmarks.stats import percentiles
+
+API = settings.API_V1_STR
+MOODS = [mood for mood in MoodCategory if mood is not MoodCategory.UNDETERMINED]
+
+
+def _job(uid: str, created_at: datetime) -> SessionJob:
+    job = SessionJob(job_id=f"{uid}-{created_at.timestamp()}", uid=uid)
+    job.session = SessionModel(
+        mood=random.choice(MOODS),  # noqa: S311
+        summary="a session",
+        created_at=created_at,
+    )
+    return job
+
+
+async def _store(
+    firestore_db: FakeFirestore, users: int, sessions: int, retry_rate: float
+) -> int:
+    now = datetime.now()
+    jobs = [
+        _job(f"user-{i}", now - timedelta(days=random.random() * 400))  # noqa: S311
+        for i in range(users)
+        for _ in range(sessions)
+    ]
+    random.shuffle(jobs)
+    half = len(jobs) // 2
+    # one at a time like the job worker, then in batches like the sweeper
+    await asyncio.gather(*(_store_sessions(firestore_db, [job]) for job in jobs[:half]))
+    for start in range(half, len(jobs), 100):
+        await _store_sessions(firestore_db, jobs[start : start + 100])
+
+    retried = random.sample(jobs, int(len(jobs) * retry_rate))
+    for job in retried:
+        # two attempts at once, like a job recovered from a worker that was
+        # only slow, each with a mood of its own
+        attempts = [job.model_copy(deep=True) for _ in range(2)]
+        for attempt in attempts:
+            attempt.session.mood = random.choice(MOODS)  # noqa: S311  # pyright: ignore[reportOptionalMemberAccess]
+        await asyncio.gather(
+            *(_store_sessions(firestore_db, [attempt]) for attempt in attempts)
+        )
+    return len(retried)
+
+
+async def _scan(firestore_db: FakeFirestore, uid: str, today: date) -> dict:
+    """
+    The year of statistics computed from all the sessions of a user.
+    """
+    period, count = RANGES[MoodStatsRange.YEAR]
+    first = period_start(today, period) - timedelta(weeks=count - 1)
+    sessions = firestore_db.collection("users").document(uid).collection("sessions")
+    totals: Counter[str] = Counter()
+    days = set()
+    async for snapshot in sessions.stream():
+        session = snapshot.to_dict() or {}
+        day = session["created_at"].date()
+        days.add(day.isoformat())
+        if first <= day <= today:
+            totals[session["mood"]] += 1
+    current_streak, longest_streak = streaks(days, today)
+    return {
+        "totals": dict(totals),
+        "current_streak": current_streak,
+        "longest_streak": longest_streak,
+    }
+
+
+async def _compare(
+    firestore_db: FakeFirestore, client: httpx.AsyncClient, uid: str
+) -> tuple[bool, tuple[float, int], tuple[float, int]]:
+    headers = {"Authorization": f"Bearer {uid}"}
+    started = time.perf_counter()
+    reads = firestore_db.reads
+    response = await client.get(f"{API}/mood-stats?range=year", headers=headers)
+    response.raise_for_status()
+    endpoint = (time.perf_counter() - started) * 1000, firestore_db.reads - reads
+    stats = response.json()
+    assert stats["period"] == MoodStatsPeriod.WEEK.value  # noqa: S101
+
+    started = time.perf_counter()
+    reads = firestore_db.reads
+    expected = await _scan(firestore_db, uid, date.today())
+    scan = (time.perf_counter() - started) * 1000, firestore_db.reads - reads
+
+    actual = {key: stats[key] for key in expected}
+    return actual == expected, endpoint, scan
+
+
+async def _bench(args: argparse.Namespace) -> dict:
+    firestore_db = FakeFirestore(args.firestore_latency)
+    retried = await _store(firestore_db, args.users, args.sessions, args.retry_rate)
+    report: dict = {
+        "users": args.users,
+        "sessions_per_user": args.sessions,
+        "retried_sessions": retried,
+        "verify_mismatches": await backfill(firestore_db, [], verify=True),
+    }
+
+    app.state.firestore_db = firestore_db
+    app.dependency_overrides[verify_firebase_token] = fake_uid
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://b") as client:
+        results = [
+            await _compare(firestore_db, client, f"user-{i}") for i in range(args.users)
+        ]
+    report["endpoint_mismatches"] = sum(not matches for matches, _, _ in results)
+    for name, index in (("endpoint", 1), ("scan", 2)):
+        report[name] = {
+            "reads_per_request": sum(r[index][1] for r in results) / len(results),
+            **percentiles([r[index][0] for r in results]),
+        }
+
+    # drop the statistics and rebuild them from the sessions
+    for path in list(firestore_db.documents):
+        if f"/{STATS_COLLECTION}/" in path:
+            del firestore_db.documents[path]
+    report["rebuilt"] = await backfill(firestore_db, [])
+    report["mismatches_after_rebuild"] = await backfill(firestore_db, [], verify=True)
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--sessions", type=int, default=300)
+    parser.add_argument("--retry-rate", type=float, default=0.1)
+    parser.add_argument("--firestore-latency", type=float, default=0.005)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    report = asyncio.run(_bench(args))
+    print(json.dumps(report, indent=2))
+    mismatches = {
+        key: report[key]
+        for key in (
+            "verify_mismatches",
+            "endpoint_mismatches",
+            "mismatches_after_rebuild",
+        )
+        if report[key]
+    }
+    if mismatches:
+        raise SystemExit(f"mood statistics differ from the sessions: {mismatches}")
+
+
+if __name__ == "__main__":
+    main()
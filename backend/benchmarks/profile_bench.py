@@ -0,0 +1,140 @@
+"""
+Benchmark of the profile cache behind ``GET /profile``.
+
+Simulated users open screens of the app, each loading the profile with a few
+concurrent requests, with the profile fetched from Firebase on every request
+as before and with the cache. Clients with the cache keep the ``ETag`` and
+revalidate with ``If-None-Match``. Halfway through, every user changes their
+display name, the following loads must return it. Firebase Auth is replaced
+by a fake that blocks for ``--latency`` seconds per lookup.
+
+Reports Firebase lookups per request, status codes, and request latency.
+
+Usage:
+    python -m benchmarks.profile_bench --users 50 --screens 10 --fanout 3
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from collections import Counter
+from unittest import mock
+
+import httpx
+from fastapi import FastAPI
+from firebase_admin import auth
+
+from app.api import profile_router
+from app.models.user_profile import Profile
+from app.utils.auth import verify_firebase_token
+from app.utils.user_profile import ProfileCache, _fetch_profile
+from benchmarks.fake_firebase import FakeAuth, fake_uid
+from benchmarks.fake_redis import FakeRedisService
+from benchmarks.stats import percentiles
+
+
+class UncachedProfiles(ProfileCache):
+    """Looks the profile up on every request, like the endpoint used to."""
+
+    async def get(self, uid: str) -> Profile:
+        return await _fetch_profile(uid)
+
+
+async def _user(
+    client: httpx.AsyncClient,
+    uid: str,
+    screens: int,
+    fanout: int,
+    statuses: Counter,
+    samples: list[float],
+) -> None:
+    headers = {"Authorization": f"Bearer {uid}"}
+    etag: str | None = None
+    name = uid
+
+    async def _load() -> httpx.Response:
+        started = time.perf_counter()
+        response = await client.get(
+            "/api/v1/profile",
+            headers={**headers, **({"If-None-Match": etag} if etag else {})},
+        )
+        samples.append((time.perf_counter() - started) * 1000)
+        statuses[response.status_code] += 1
+        return response
+
+    for screen in range(screens):
+        if screen == screens // 2:
+            name = f"{uid} renamed"
+            response = await client.patch(
+                "/api/v1/profile/display-name",
+                params={"display_name": name},
+                headers=headers,
+            )
+            response.raise_for_status()
+        for response in await asyncio.gather(*(_load() for _ in range(fanout))):
+            if response.status_code == httpx.codes.OK:
+                if response.json()["full_name"] != name:
+                    raise SystemExit(f"{uid}: stale profile {response.json()}")
+                etag = response.headers.get("ETag")
+        await asyncio.sleep(0.05)
+
+
+async def _run(args: argparse.Namespace, *, cached: bool) -> dict:
+    fake_auth = FakeAuth(args.latency)
+    redis_service = FakeRedisService()
+    app = FastAPI()
+    app.include_router(profile_router, prefix="/api/v1")
+    app.dependency_overrides[verify_firebase_token] = fake_uid
+    app.state.profile_cache = (ProfileCache if cached else UncachedProfiles)(
+        redis_service
+    )
+
+    statuses: Counter = Counter()
+    samples: list[float] = []
+    with (
+        mock.patch.object(auth, "get_user", fake_auth.get_user),
+        mock.patch.object(auth, "update_user", fake_auth.update_user),
+    ):
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://bench"
+        ) as client:
+            await asyncio.gather(
+                *(
+                    _user(
+                        client,
+                        f"user-{i}",
+                        args.screens,
+                        args.fanout,
+                        statuses,
+                        samples,
+                    )
+                    for i in range(args.users)
+                )
+            )
+    await redis_service.close()
+
+    return {
+        "cached": cached,
+        "requests": len(samples),
+        "firebase_lookups": fake_auth.calls,
+        "lookups_per_request": round(fake_auth.calls / len(samples), 3),
+        "statuses": dict(statuses),
+        **percentiles(samples),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--screens", type=int, default=10)
+    parser.add_argument("--fanout", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    results = [asyncio.run(_run(args, cached=cached)) for cached in (False, True)]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Benchmark of the prompt size of session summaries.
+
+Summarizes sessions of increasing length against the fake gemini server with
+the original prompt, a Python list of per-turn JSON strings for the
+conversation and for the moods, and with the compact encoding of
+``app.utils.prompt``, chunked map-reduce style past
+``SESSION_SUMMARY_CHUNK_TOKENS``. Reports the uncached prompt tokens billed
+per session, as counted by the fake server, and the gemini requests sent.
+
+Usage:
+    python -m benchmarks.prompt_bench --sizes 10,50,200,500
+"""
+
+import argparse
+import asyncio
+import json
+from datetime import datetime, timedelta, timezone
+
+from app.config.settings import settings
+from app.models.chat import ConversationMessage, MoodAnalysisResult
+from app.models.enums import MoodCategory
+from app.utils.chat import GeminiClient, SessionAnalyzer
+from benchmarks.apps import counter
+from benchmarks.fake_gemini import FakeGeminiServer
+
+MESSAGES = [
+    "I've been so tired lately, work won't stop and I can't \"switch off\".",
+    "My manager said the deadline moved up again, I don't know how we'll make it.",
+    "Talked to my sister tonight and it actually helped a lot.",
+    "Still can't sleep. Everything I didn't finish keeps going round in my head.",
+]
+REPLIES = [
+    "That sounds exhausting. What usually helps you unwind after a day like this?",
+    "A moved deadline on top of everything is a lot. What feels most urgent to you?",
+    "I'm really glad you had her to talk to. What did she say that helped?",
+    "Racing thoughts at night are hard. Would writing them down help park them?",
+]
+
+
+class LegacySessionAnalyzer(SessionAnalyzer):
+    """The session analyzer with the prompt format before the encoder."""
+
+    LEGACY_TEMPLATE = """
+    Analyze the following:
+
+    Conversation History (JSON format):
+    {conversation_history}
+
+    Mood History (JSON format):
+    {mood_history}
+    """
+
+    def _build_prompt(
+        self,
+        conversation_history: list[ConversationMessage],
+        mood_history: list[MoodAnalysisResult],
+    ) -> str:
+        return self.LEGACY_TEMPLATE.format(
+            conversation_history=[h.model_dump_json() for h in conversation_history],
+            mood_history=[m.model_dump_json() for m in mood_history],
+        )
+
+
+def _session(
+    turns: int,
+) -> tuple[list[ConversationMessage], list[MoodAnalysisResult]]:
+    started = datetime(2025, 9, 11, 14, 20, tzinfo=timezone.utc)
+    moods = [MoodCategory.SADNESS, MoodCategory.FEAR, MoodCategory.JOY]
+    history, session_moods = [], []
+    for i in range(turns):
+        reply = REPLIES[i % len(REPLIES)]
+        history.append(
+            ConversationMessage(
+                message=MESSAGES[i % len(MESSAGES)],
+                reply=reply,
+                timestamp=started + timedelta(seconds=45 * i, microseconds=1234),
+            )
+        )
+        # moods change every few turns, like they do in a conversation
+        session_moods.append(
+            MoodAnalysisResult(
+                mood=moods[i // 6 % len(moods)], confidence=80 + i % 15, reply=reply
+            )
+        )
+    return history, session_moods
+
+
+def _prompt_tokens() -> float:
+    return sum(
+        counter("manas_gemini_tokens_total", {"model": model, "kind": "prompt"})
+        for model in settings.GEMINI_SESSION_MODELS
+    )
+
+
+def _requests() -> float:
+    return counter(
+        "manas_operation_duration_seconds_count",
+        {"component": "gemini", "operation": "generate_content", "outcome": "ok"},
+    )
+
+
+async def _run(analyzer: SessionAnalyzer, turns: int) -> dict:
+    history, moods = _session(turns)
+    tokens, requests = _prompt_tokens(), _requests()
+    await analyzer.summarize_async(history, moods)
+    tokens, requests = _prompt_tokens() - tokens, _requests() - requests
+    return {
+        "turns": turns,
+        "prompt_tokens": int(tokens),
+        "gemini_requests": int(requests),
+    }
+
+
+async def _bench(sizes: list[int]) -> dict:
+    gemini_client = GeminiClient()
+    chunk_tokens = settings.SESSION_SUMMARY_CHUNK_TOKENS
+    results: dict[str, list[dict]] = {"before": [], "after": []}
+    for name, analyzer in (
+        ("before", LegacySessionAnalyzer(gemini_client)),
+        ("after", SessionAnalyzer(gemini_client)),
+    ):
+        # the original summarizer sent the whole session in one request
+        settings.SESSION_SUMMARY_CHUNK_TOKENS = (
+            10**9 if name == "before" else chunk_tokens
+        )
+        for turns in sizes:
+            results[name].append(await _run(analyzer, turns))
+    settings.SESSION_SUMMARY_CHUNK_TOKENS = chunk_tokens
+    await gemini_client.close()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", default="10,50,200,500")
+    parser.add_argument("--chunk-tokens", type=int)
+    args = parser.parse_args()
+    if args.chunk_tokens:
+        settings.SESSION_SUMMARY_CHUNK_TOKENS = args.chunk_tokens
+
+    with FakeGeminiServer(latency=0.01) as server:
+        settings.GEMINI_BASE_URL = server.base_url
+        results = asyncio.run(_bench([int(n) for n in args.sizes.split(",")]))
+
+    for before, after in zip(results["before"], results["after"], strict=True):
+        after["saved"] = f"{1 - after['prompt_tokens'] / before['prompt_tokens']:.0%}"
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Benchmark of gemini model routing, hedging and fallback.
+
+Runs ``MoodAnalyzer.analyze_async`` against the fake gemini server in two
+scenarios, each with routing off (the primary model only, no hedging) and on:
+
+* ``tail``: a share of the primary's requests is slow, hedging should cut p99.
+* ``outage``: every request to the primary fails, the fallback model and the
+  circuit breaker should keep requests succeeding without waiting on it.
+
+Reports latency percentiles, failed analyses, and gemini requests sent per
+analysis, i.e. the extra load hedging and fallbacks cost.
+
+Usage:
+    python -m benchmarks.routing_bench --requests 400 --concurrency 8
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+from app.config.settings import settings
+from app.utils import routing
+from app.utils.chat import GeminiClient, MoodAnalyzer
+from benchmarks.apps import gemini_calls
+from benchmarks.fake_gemini import FakeGeminiServer
+from benchmarks.stats import percentiles
+
+PRIMARY = "gemini-2.5-flash"
+FALLBACK = "gemini-2.5-flash-lite"
+TEXT = "Work was a lot today but I got through the worst of it."
+
+SCENARIOS = {
+    "tail": {PRIMARY: {"tail_rate": 0.05, "tail_latency": 2.0}},
+    "outage": {PRIMARY: {"error_rate": 1.0}},
+}
+
+
+def _gemini_requests() -> float:
+    return gemini_calls("ok") + gemini_calls("error")
+
+
+async def _run(requests: int, concurrency: int, *, routed: bool) -> dict:
+    settings.GEMINI_MOOD_MODELS = [PRIMARY, FALLBACK] if routed else [PRIMARY]
+    settings.GEMINI_HEDGE_ENABLED = routed
+    routing._breakers.clear()  # noqa: SLF001
+    gemini_client = GeminiClient()
+    analyzer = MoodAnalyzer(gemini_client)
+    slots = asyncio.Semaphore(concurrency)
+    samples: list[float] = []
+    failed = 0
+
+    async def _one() -> None:
+        nonlocal failed
+        async with slots:
+            started = time.perf_counter()
+            try:
+                await analyzer.analyze_async(text=TEXT, history=[])
+            except Exception:  # noqa: BLE001
+                failed += 1
+                return
+            samples.append((time.perf_counter() - started) * 1000)
+
+    sent = _gemini_requests()
+    await asyncio.gather(*(_one() for _ in range(requests)))
+    sent = _gemini_requests() - sent
+    await gemini_client.close()
+    return {
+        "routed": routed,
+        "failed": failed,
+        "gemini_requests_per_analysis": round(sent / requests, 3),
+        **percentiles(samples),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.1)
+    args = parser.parse_args()
+
+    results = {}
+    for scenario, model_faults in SCENARIOS.items():
+        with FakeGeminiServer(
+            latency=args.latency, model_faults=model_faults
+        ) as server:
+            settings.GEMINI_BASE_URL = server.base_url
+            results[scenario] = [
+                asyncio.run(_run(args.requests, args.concurrency, routed=routed))
+                for routed in (False, True)
+            ]
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""
+Benchmark of the stall watchdog and the request profiler.
+
+Runs the chat scenario of ``app_bench`` against the app as is, with the
+instrumentation middleware and the stall watchdog, and with the ``/process``
+and ``/end-session`` requests of some of the users profiled. Then makes the
+mood analyzer block the event loop with a synchronous sleep every few calls,
+and checks that the watchdog reports each of those stalls with the route and
+the blocking frame.
+
+Reports requests per second and p50/p95/p99 latency per run, the stalls the
+watchdog recorded and the size of a profile, as JSON.
+
+Usage:
+    python -m benchmarks.stall_bench --users 50 --session-length 10
+"""
+
+import argparse
+import asyncio
+import json
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+
+import httpx
+from starlette.types import ASGIApp
+
+from app.config.settings import settings
+from app.main import app
+from app.utils.auth import verify_firebase_token
+from app.utils.profiling import InstrumentationMiddleware, StallWatchdog
+from benchmarks.app_bench import _fake_lifespan
+from benchmarks.fake_firebase import fake_uid
+from benchmarks.fake_gemini import FakeGeminiServer
+from benchmarks.stats import percentiles
+
+API = settings.API_V1_STR
+
+
+async def _user(
+    client: httpx.AsyncClient,
+    samples: dict[str, list[float]],
+    uid: str,
+    session_length: int,
+    headers: dict[str, str],
+) -> list[str]:
+    headers = {"Authorization": f"Bearer {uid}", **headers}
+    requests = [("process", f"{API}/process")] * session_length
+    outputs = []
+    for route, url in [*requests, ("end_session", f"{API}/end-session")]:
+        started = time.perf_counter()
+        response = await client.post(
+            url,
+            params={"text": "today went okay", "timestamp": "2025-01-01T10:00:00"}
+            if route == "process"
+            else None,
+            headers=headers,
+        )
+        samples[route].append((time.perf_counter() - started) * 1000)
+        response.raise_for_status()
+        if "x-profile-output" in response.headers:
+            outputs.append(response.headers["x-profile-output"])
+    return outputs
+
+
+async def _run(
+    asgi_app: ASGIApp, args: argparse.Namespace, name: str, profiled_users: int = 0
+) -> tuple[dict, list[str]]:
+    transport = httpx.ASGITransport(app=asgi_app)
+    samples: dict[str, list[float]] = defaultdict(list)
+    async with httpx.AsyncClient(transport=transport, base_url="http://b") as client:
+        started = time.perf_counter()
+        outputs = await asyncio.gather(
+            *(
+                _user(
+                    client,
+                    samples,
+                    f"{name}-{i}",
+                    args.session_length,
+                    {"X-Profile": "1"} if i < profiled_users else {},
+                )
+                for i in range(args.users)
+            )
+        )
+        elapsed = time.perf_counter() - started
+    requests = sum(len(route) for route in samples.values())
+    result = {
+        "requests_per_second": round(requests / elapsed, 1),
+        "routes": {route: percentiles(values) for route, values in samples.items()},
+    }
+    return result, [output for user in outputs for output in user]
+
+
+def _block_mood_analysis(every: int, seconds: float) -> None:
+    analyzer = app.state.mood_analyzer
+    analyze_async = analyzer.analyze_async
+    calls = 0
+
+    async def _blocking(*args: object, **kwargs: object) -> object:
+        nonlocal calls
+        calls += 1
+        if calls % every == 0:
+            # the kind of mistake the watchdog is for
+            time.sleep(seconds)  # noqa: ASYNC251
+        return await analyze_async(*args, **kwargs)
+
+    analyzer.analyze_async = _blocking
+
+
+async def _bench(args: argparse.Namespace) -> dict:
+    app.dependency_overrides[verify_firebase_token] = fake_uid
+    settings.PROFILER_ENABLED = True
+    settings.PROFILER_OUTPUT_DIR = tempfile.mkdtemp(prefix="manas-profiles-")
+    instrumented = InstrumentationMiddleware(app)
+    report: dict = {}
+    async with _fake_lifespan(app, "", args.firestore_latency):
+        await _run(app, args, "warmup")
+        report["plain"], _ = await _run(app, args, "plain")
+
+        watchdog = StallWatchdog()
+        watchdog.start()
+        report["watchdog"], _ = await _run(instrumented, args, "watchdog")
+        report["watchdog"]["stalls"] = len(watchdog.stalls)
+        watchdog.stalls.clear()
+        report["profiled"], outputs = await _run(
+            instrumented, args, "profiled", args.profiled_users
+        )
+        report["profiled"]["stalls"] = len(watchdog.stalls)
+        watchdog.stalls.clear()
+
+        _block_mood_analysis(args.block_every, args.block)
+        blocked, _ = await _run(instrumented, args, "blocked")
+        await watchdog.stop()
+
+    expected = args.users * args.session_length // args.block_every
+    report["blocked"] = {
+        **blocked,
+        "injected_stalls": expected,
+        "recorded_stalls": len(watchdog.stalls),
+        "example": watchdog.stalls[0] if watchdog.stalls else None,
+    }
+    profiles = [Path(output) for output in outputs]
+    report["profiles"] = {
+        "files": len(profiles),
+        "samples_per_request": round(
+            sum(
+                int(line.rsplit(" ", 1)[1])
+                for profile in profiles
+                for line in profile.read_text().splitlines()
+            )
+            / len(profiles),
+            1,
+        ),
+        "example": str(profiles[-1]),
+    }
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--session-length", type=int, default=10)
+    parser.add_argument("--gemini-latency", type=float, default=0.2)
+    parser.add_argument("--firestore-latency", type=float, default=0.01)
+    parser.add_argument("--profiled-users", type=int, default=1)
+    parser.add_argument("--block", type=float, default=0.3)
+    parser.add_argument("--block-every", type=int, default=50)
+    args = parser.parse_args()
+
+    with FakeGeminiServer(latency=args.gemini_latency) as server:
+        settings.GEMINI_BASE_URL = server.base_url
+        report = asyncio.run(_bench(args))
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
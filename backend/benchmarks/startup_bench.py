@@ -0,0 +1,113 @@
+"""
+Benchmark of the import time and cold start of the app.
+
+Starts fresh interpreters that import ``app.main``, run its lifespan with
+fakeredis in place of redis, and serve a first request. Reports, as medians
+over the runs, the time to import the app, to run the lifespan startup and to
+answer the first request, the modules loaded by the import, and the files the
+process left behind in the temp directory.
+
+With ``--preload`` the interpreter first imports the app, like the gunicorn
+master does before forking, so the times are those of a forked worker.
+
+``--root`` points at another checkout of the backend, to compare against it.
+
+Usage:
+    python -m benchmarks.startup_bench --runs 5
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+# runs in the fresh interpreter, the clock starts before anything is imported,
+# or after the preload
+_CHILD = """
+import os, sys, tempfile, time
+if os.environ.get("BENCH_PRELOAD"):
+    import app.main
+started = time.perf_counter()
+before = set(os.listdir(tempfile.gettempdir()))
+import app.main
+imported = time.perf_counter()
+modules = len(sys.modules)
+
+import asyncio, json
+import httpx
+from benchmarks.fake_redis import FakeRedisService
+
+app.main.RedisService = FakeRedisService
+
+
+async def _start():
+    begin = time.perf_counter()
+    async with app.main.app.router.lifespan_context(app.main.app):
+        up = time.perf_counter()
+        transport = httpx.ASGITransport(app=app.main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://b") as c:
+            (await c.get("/")).raise_for_status()
+        return up - begin, time.perf_counter() - up
+
+
+startup, first_request = asyncio.run(_start())
+print(json.dumps({
+    "import_ms": (imported - started) * 1000,
+    "startup_ms": startup * 1000,
+    "first_request_ms": first_request * 1000,
+    "modules": modules,
+    "leaked_files": len(set(os.listdir(tempfile.gettempdir())) - before),
+}))
+"""
+
+
+def _run(root: Path, *, preload: bool) -> dict:
+    env = {**os.environ, "PYTHONPATH": str(root), "DEBUG": "true"}
+    if preload:
+        env["BENCH_PRELOAD"] = "1"
+    started = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, "-c", _CHILD],
+        cwd=root,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    result["process_ms"] = (time.perf_counter() - started) * 1000
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--preload", action="store_true")
+    parser.add_argument(
+        "--root", type=Path, default=Path(__file__).resolve().parent.parent
+    )
+    args = parser.parse_args()
+
+    runs = [_run(args.root.resolve(), preload=args.preload) for _ in range(args.runs)]
+    report = {
+        key: round(statistics.median(run[key] for run in runs), 1) for key in runs[0]
+    }
+    print(
+        json.dumps(
+            {
+                "root": str(args.root),
+                "preload": args.preload,
+                "runs": args.runs,
+                **report,
+            },
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
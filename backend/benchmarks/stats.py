@@ -0,0 +1,84 @@
+"""
+Measurement helpers shared by the benchmarks.
+"""
+
+import asyncio
+import statistics
+import time
+from types import TracebackType
+
+from typing_extensions import Self
+
+
+def percentiles(samples: list[float]) -> dict[str, float]:
+    """
+    Summarize latency samples in milliseconds.
+    """
+    if not samples:
+        return {"count": 0}
+    cuts = (
+        statistics.quantiles(samples, n=100, method="inclusive")
+        if len(samples) > 1
+        else [samples[0]] * 99
+    )
+    return {
+        "count": len(samples),
+        "mean_ms": round(statistics.fmean(samples), 2),
+        "p50_ms": round(cuts[49], 2),
+        "p95_ms": round(cuts[94], 2),
+        "p99_ms": round(cuts[98], 2),
+        "max_ms": round(max(samples), 2),
+    }
+
+
+class LoopLagMonitor:
+    """
+    Measure how long the event loop is blocked while the context is active.
+
+    A probe task sleeps for ``interval`` seconds in a loop; any extra time it
+    takes to wake up is time the loop spent running something else without
+    yielding.
+
+    Example:
+        async with LoopLagMonitor() as lag:
+            await run_load()
+        print(lag.result())
+    """
+
+    def __init__(self, interval: float = 0.005, threshold: float = 0.005) -> None:
+        self._interval = interval
+        self._threshold = threshold
+        self._task: asyncio.Task | None = None
+        self.max_lag = 0.0
+        self.blocked = 0.0
+        self.stalls = 0
+
+    async def _probe(self) -> None:
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self._interval)
+            lag = time.perf_counter() - started - self._interval
+            self.max_lag = max(self.max_lag, lag)
+            if lag > self._threshold:
+                self.blocked += lag
+                self.stalls += 1
+
+    async def __aenter__(self) -> Self:
+        self._task = asyncio.create_task(self._probe())
+        return self
+
+    async def __aexit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        tb: TracebackType | None,
+    ) -> None:
+        if self._task is not None:
+            self._task.cancel()
+
+    def result(self) -> dict[str, float]:
+        return {
+            "loop_max_lag_ms": round(self.max_lag * 1000, 2),
+            "loop_blocked_ms": round(self.blocked * 1000, 2),
+            "loop_stalls": self.stalls,
+        }
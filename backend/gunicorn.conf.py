@@ -0,0 +1,36 @@
+"""
+Gunicorn settings for serving the app with several workers.
+
+The app is imported once by the master and the workers are forked from it.
+Importing ``app.main`` loads no gRPC or Gemini SDK and opens no connections,
+firebase, the clients and the background tasks are all set up by the lifespan
+of each worker, after the fork.
+
+Set ``PROMETHEUS_MULTIPROC_DIR`` to an empty directory to aggregate the
+metrics of the workers.
+
+Usage:
+    gunicorn app.main:app
+"""
+
+import os
+from typing import TYPE_CHECKING
+
+from app.config.settings import settings
+
+if TYPE_CHECKING:
+    from gunicorn.arbiter import Arbiter
+    from gunicorn.workers.base import Worker
+
+bind = f"{settings.SERVER_HOST}:{settings.SERVER_PORT}"
+workers = settings.SERVER_WORKERS
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+
+
+def child_exit(_server: "Arbiter", worker: "Worker") -> None:
+    # drop the live gauges of the worker, its counters are kept
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        from prometheus_client import multiprocess  # noqa: PLC0415
+
+        multiprocess.mark_process_dead(worker.pid)